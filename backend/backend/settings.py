@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'corsheaders',
     'machine',
+    'modbus_reader',
 ]
 
 MIDDLEWARE = [
@@ -113,6 +114,12 @@ DATABASES = {
     }
 }
 
+# PyMySQL stands in for mysqlclient only when the MySQL block above is enabled
+# (importing it costs ~20 ms at every process start otherwise).
+if DATABASES["default"]["ENGINE"] == "django.db.backends.mysql":
+    import pymysql
+    pymysql.install_as_MySQLdb()
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
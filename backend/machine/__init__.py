@@ -1,3 +0,0 @@
-# backend/backend/__init__.py
-import pymysql
-pymysql.install_as_MySQLdb()
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MachineConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'machine'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from .models import MachineSetting
+        from .views import settings_cache
+        post_save.connect(settings_cache.clear, sender=MachineSetting, dispatch_uid="machine_settings_cache")
+        post_delete.connect(settings_cache.clear, sender=MachineSetting, dispatch_uid="machine_settings_cache")
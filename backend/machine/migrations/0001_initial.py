@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineSetting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('auto_s1_speed', models.FloatField()),
+                ('auto_s1_acc', models.IntegerField()),
+                ('auto_s1_dec', models.IntegerField()),
+                ('auto_s1_single_step', models.FloatField()),
+                ('auto_s1_last_step', models.FloatField()),
+                ('no_of_roll', models.IntegerField()),
+                ('product_count_pcs', models.IntegerField()),
+                ('product_count_set', models.IntegerField()),
+            ],
+        ),
+    ]
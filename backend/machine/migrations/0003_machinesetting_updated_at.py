@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('machine', '0002_machinesetting_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machinesetting',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
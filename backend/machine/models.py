@@ -9,6 +9,16 @@ class MachineSetting(models.Model):
     no_of_roll = models.IntegerField()
     product_count_pcs = models.IntegerField()
     product_count_set = models.IntegerField()
+    # bumped on every edit; applied_* record what was last downloaded to the PLC
+    version = models.PositiveIntegerField(default=1)
+    applied_version = models.PositiveIntegerField(null=True, blank=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)   # part of the API's ETag validator
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None and kwargs.get("update_fields") is None:
+            self.version += 1
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Machine Setting {self.id}"
@@ -0,0 +1,112 @@
+# backend/machine/recipe.py
+"""
+Recipe download: push a MachineSetting row to the PLC.
+Model fields are mapped to registers by a tag-map file (same format as
+MODBUS_TAG_MAP, tag names = field names; see recipe_map.example.json). The PLC's
+current values are read in as few requests as the read planner allows, and only
+the fields whose registers differ are written, as batched FC16 runs.
+"""
+import os
+from typing import Dict, List, Optional
+
+from django.utils import timezone
+
+from modbus_reader import modbus
+from modbus_reader.connections import connections, ConnectionUnavailable
+from modbus_reader.decode import decode_array, encode_value
+from modbus_reader.modbus_utils import _read_registers, write_registers_and_verify
+from modbus_reader.register_map import ReadPlan, get_plan
+from modbus_reader.snapshot import DEFAULT_DEVICE
+
+from .models import MachineSetting
+
+# -------- CONFIG --------
+RECIPE_MAP = os.getenv("MACHINE_RECIPE_MAP", "")   # field -> register map; downloads are off when unset
+
+
+class RecipeError(Exception):
+    """Download could not run (no map, PLC unreachable, read failed)."""
+
+
+def recipe_plan(path: str = RECIPE_MAP) -> ReadPlan:
+    if not path:
+        raise RecipeError("no recipe map configured (MACHINE_RECIPE_MAP)")
+    plan = get_plan(path)
+    unknown = [t.name for t in plan.tags if not hasattr(MachineSetting, t.name)]
+    if unknown:
+        raise RecipeError(f"recipe map has tags that are not MachineSetting fields: {unknown}")
+    return plan
+
+
+def read_current(plan: ReadPlan, host: str, port: int, unit_id: int,
+                 timeout: float = 2.0, device: Optional[str] = None) -> Dict[str, List[int]]:
+    """Current registers of every recipe field (one request per coalesced block)."""
+    regs_by_tag: Dict[str, List[int]] = {}
+    try:
+        with connections.session(host, port, unit_id, timeout=timeout, device=device) as client:
+            for block in plan.blocks:
+                rr = _read_registers(client, block.start, block.count, unit_id)
+                if rr.isError():
+                    raise RecipeError(f"read @{block.start} failed: {rr}")
+                for tag in block.tags:
+                    off = tag.address - block.start
+                    regs = list(rr.registers[off:off + tag.count])
+                    if len(regs) == tag.count:   # a short response leaves the tag out
+                        regs_by_tag[tag.name] = regs
+    except ConnectionUnavailable as e:
+        raise RecipeError(f"connect_failed: {e}") from None
+    return regs_by_tag
+
+
+def _plc_value(tag, regs: List[int]):
+    value = decode_array(regs, tag.type, tag.word_order, tag.byte_order)[0]
+    return value if tag.scale == 1.0 else value * tag.scale
+
+
+def download(setting: MachineSetting, host: Optional[str] = None, port: Optional[int] = None,
+             unit_id: Optional[int] = None, dry_run: bool = False, force: bool = False,
+             plan: Optional[ReadPlan] = None) -> Dict[str, object]:
+    """
+    Diff `setting` against the PLC and write the fields that differ.
+    Fields are compared as encoded registers, so float rounding never causes a
+    spurious write. On a verified write the row's applied_version/applied_at are set.
+    Raises TransportUnsupported when the PLC is on RTU (writes are TCP-only).
+    """
+    plan = plan or recipe_plan()
+    device = None if host else DEFAULT_DEVICE   # no host: the poller's default device
+    host = host or modbus.MODBUS_HOST
+    port = port or modbus.MODBUS_PORT
+    unit_id = modbus.DEVICE_ID if unit_id is None else unit_id
+
+    current = read_current(plan, host, port, unit_id, device=device)
+    missing = [t.name for t in plan.tags if t.name not in current]
+    if missing:
+        raise RecipeError(f"PLC returned no registers for: {', '.join(missing)}")
+    changed: Dict[str, List[object]] = {}
+    regs: Dict[int, int] = {}
+    for tag in plan.tags:
+        value = getattr(setting, tag.name)
+        wanted = encode_value(value, tag.type, tag.word_order, tag.byte_order, tag.scale)
+        if force or current[tag.name] != wanted:
+            changed[tag.name] = [_plc_value(tag, current[tag.name]), value]
+            regs.update(zip(range(tag.address, tag.end), wanted))
+
+    result: Dict[str, object] = {
+        "ok": True, "id": setting.pk, "version": setting.version,
+        "applied_version": setting.applied_version, "dry_run": dry_run,
+        "changed": changed, "unchanged": [t.name for t in plan.tags if t.name not in changed],
+    }
+    if dry_run:
+        return result
+    if regs:
+        ok, detail = write_registers_and_verify(host, port, unit_id, regs, device=device)
+        result["write"] = detail
+        if not ok or detail.get("verify") != "ok":
+            result["ok"] = False
+            return result
+
+    setting.applied_version = setting.version
+    setting.applied_at = timezone.now()
+    setting.save(update_fields=["applied_version", "applied_at", "updated_at"])
+    result["applied_version"] = setting.applied_version
+    return result
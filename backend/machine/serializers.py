@@ -5,3 +5,4 @@ class MachineSettingSerializer(serializers.ModelSerializer):
     class Meta:
         model = MachineSetting
         fields = '__all__'
+        read_only_fields = ('version', 'applied_version', 'applied_at')
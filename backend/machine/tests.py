@@ -1,3 +1,106 @@
+import os
+from unittest import mock
+
 from django.test import TestCase
 
-# Create your tests here.
+from modbus_reader.decode import encode_value
+from modbus_reader.register_map import get_plan
+
+from . import recipe
+from .models import MachineSetting
+from .recipe import RecipeError, download
+
+EXAMPLE_MAP = os.path.join(os.path.dirname(__file__), "recipe_map.example.json")
+
+
+class RecipeDownloadTests(TestCase):
+    def setUp(self):
+        self.plan = get_plan(EXAMPLE_MAP)
+        self.setting = MachineSetting.objects.create(
+            auto_s1_speed=15.0, auto_s1_acc=150, auto_s1_dec=150, auto_s1_single_step=7.0,
+            auto_s1_last_step=106.0, no_of_roll=4, product_count_pcs=0, product_count_set=0, version=3)
+
+    def plc_holding(self, **overrides):
+        """Registers the PLC would return: the setting's own values, except `overrides`."""
+        regs = {}
+        for tag in self.plan.tags:
+            value = overrides.get(tag.name, getattr(self.setting, tag.name))
+            regs[tag.name] = encode_value(value, tag.type, tag.word_order, tag.byte_order, tag.scale)
+        return regs
+
+    def run_download(self, current, write_result=(True, {"verify": "ok"}), **kwargs):
+        with mock.patch.object(recipe, "read_current", return_value=current), \
+                mock.patch.object(recipe, "write_registers_and_verify", return_value=write_result) as write:
+            result = download(self.setting, host="10.15.0.1", port=502, unit_id=1, plan=self.plan, **kwargs)
+        return result, write
+
+    def test_only_changed_registers_are_written(self):
+        result, write = self.run_download(self.plc_holding(auto_s1_acc=120, auto_s1_speed=12.5))
+        self.assertTrue(result["ok"])
+        write.assert_called_once()
+        self.assertEqual(write.call_args.args[3], {
+            200: encode_value(15.0, "float32")[0], 201: encode_value(15.0, "float32")[1], 202: 150})
+        self.assertEqual(result["changed"], {"auto_s1_speed": [12.5, 15.0], "auto_s1_acc": [120, 150]})
+        self.setting.refresh_from_db()
+        self.assertEqual(self.setting.applied_version, 3)
+
+    def test_nothing_to_write_when_the_plc_already_matches(self):
+        result, write = self.run_download(self.plc_holding())
+        write.assert_not_called()
+        self.assertEqual((result["ok"], result["changed"], result["applied_version"]), (True, {}, 3))
+
+    def test_force_writes_every_register(self):
+        result, write = self.run_download(self.plc_holding(), force=True)
+        self.assertEqual(sorted(write.call_args.args[3]), list(range(200, 209)))
+        self.assertEqual(len(result["changed"]), len(self.plan.tags))
+
+    def test_dry_run_writes_nothing(self):
+        result, write = self.run_download(self.plc_holding(no_of_roll=2), dry_run=True)
+        write.assert_not_called()
+        self.assertEqual(result["changed"], {"no_of_roll": [2, 4]})
+        self.setting.refresh_from_db()
+        self.assertIsNone(self.setting.applied_version)
+
+    def test_failed_verify_leaves_the_version_unapplied(self):
+        result, _ = self.run_download(self.plc_holding(no_of_roll=2),
+                                      write_result=(True, {"verify": "mismatch", "mismatches": {208: [4, 2]}}))
+        self.assertFalse(result["ok"])
+        self.setting.refresh_from_db()
+        self.assertIsNone(self.setting.applied_version)
+
+    def test_a_tag_missing_from_the_read_is_an_error(self):
+        current = self.plc_holding()
+        del current["auto_s1_last_step"]
+        with self.assertRaisesMessage(RecipeError, "auto_s1_last_step"):
+            self.run_download(current)
+
+    def test_read_current_leaves_out_tags_a_short_response_did_not_cover(self):
+        class Client:
+            def read_holding_registers(self, address, count, **kw):
+                return mock.Mock(registers=list(range(address, address + count - 1)), isError=lambda: False)
+
+        session = mock.MagicMock()
+        session.return_value.__enter__.return_value = Client()
+        with mock.patch.object(recipe.connections, "session", session):
+            current = recipe.read_current(self.plan, "10.15.0.1", 502, 1)
+        self.assertNotIn("no_of_roll", current)              # register 208 never came back
+        self.assertEqual(current["auto_s1_acc"], [202])
+
+
+class SettingsETagTests(TestCase):
+    def test_list_is_304_until_a_row_changes(self):
+        MachineSetting.objects.create(
+            auto_s1_speed=15.0, auto_s1_acc=150, auto_s1_dec=150, auto_s1_single_step=7.0,
+            auto_s1_last_step=106.0, no_of_roll=4, product_count_pcs=0, product_count_set=0)
+        first = self.client.get("/api/machine-settings/", HTTP_ACCEPT="application/json")
+        self.assertEqual(first.status_code, 200)
+        tag = first["ETag"]
+        again = self.client.get("/api/machine-settings/", HTTP_ACCEPT="application/json", HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(again.status_code, 304)
+
+        setting = MachineSetting.objects.get()
+        setting.no_of_roll = 8
+        setting.save()
+        changed = self.client.get("/api/machine-settings/", HTTP_ACCEPT="application/json", HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()[0]["no_of_roll"], 8)
@@ -1,7 +1,77 @@
-from rest_framework import viewsets
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from modbus_reader.connections import TransportUnsupported
+from modbus_reader.http_cache import ResponseCache, etag, not_modified
 from .models import MachineSetting
 from .serializers import MachineSettingSerializer
+from .recipe import RecipeError, download
+
+# Rendered list/detail bodies; cleared on save/delete (see apps.py)
+settings_cache = ResponseCache()
+
+
+def table_version():
+    """
+    (rows, max id, last update) - one aggregate query that changes whenever a row
+    is created, edited or deleted in any process. (queryset.update() skips
+    auto_now, so it must set updated_at itself.)
+    """
+    v = MachineSetting.objects.aggregate(n=Count("id"), top=Max("id"), last=Max("updated_at"))
+    return v["n"], v["top"], v["last"] and v["last"].isoformat()
+
 
 class MachineSettingViewSet(viewsets.ModelViewSet):
     queryset = MachineSetting.objects.all()
     serializer_class = MachineSettingSerializer
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(request, "list", lambda: self.get_serializer(self.get_queryset(), many=True).data,
+                            lambda: super(MachineSettingViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(request, ("detail", kwargs.get("pk")), lambda: self.get_serializer(self.get_object()).data,
+                            lambda: super(MachineSettingViewSet, self).retrieve(request, *args, **kwargs))
+
+    def _cached(self, request, key, data, fallback):
+        """
+        Serve GETs from the body rendered for the current table version, with an
+        ETag so unchanged polls get a 304. Only JSON is cached; the browsable API
+        goes through DRF as usual.
+        """
+        renderer = request.accepted_renderer
+        if renderer.format != "json":
+            return fallback()
+        version = table_version()
+        tag = etag("machine-settings", key, request.accepted_media_type, *version)
+        response = not_modified(request, tag)
+        if response is None:
+            cache_key = (key, request.accepted_media_type)
+            body = settings_cache.get(cache_key, version)
+            if body is None:
+                body = settings_cache.put(cache_key, version, renderer.render(
+                    data(), request.accepted_media_type, self.get_renderer_context()))
+            response = HttpResponse(body, content_type=renderer.media_type)
+        response["ETag"] = tag
+        response["Cache-Control"] = "no-cache"
+        return response
+
+    @action(detail=True, methods=["post"])
+    def download(self, request, pk=None):
+        """
+        POST /api/machine-settings/<id>/download/[?dry_run=1][&force=1]
+        Writes the fields that differ from the PLC and records the applied version.
+        """
+        setting = self.get_object()
+        flag = lambda name: request.query_params.get(name, "") in ("1", "true")
+        try:
+            result = download(setting, dry_run=flag("dry_run"), force=flag("force"))
+        except TransportUnsupported as e:
+            return Response({"ok": False, "error": str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        except RecipeError as e:
+            return Response({"ok": False, "error": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        except ValueError as e:   # a field value doesn't fit its register type
+            return Response({"ok": False, "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_200_OK if result["ok"] else status.HTTP_502_BAD_GATEWAY)
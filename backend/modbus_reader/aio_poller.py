@@ -0,0 +1,250 @@
+# backend/modbus_reader/aio_poller.py
+import asyncio
+import heapq
+import itertools
+import os
+import time
+import traceback
+from typing import Dict, List, Optional
+
+from . import metrics, modbus
+from .changes import publish_cycle
+from .breaker import board
+from .devices import Device
+from .register_map import ReadPlan, ScanGroup, get_plan
+from .snapshot import DEFAULT_DEVICE
+from .transports import RTU, PacedClient, SerialLine, serial_line, tcp_client
+
+# -------- CONFIG --------
+MAX_CONCURRENCY = int(os.getenv("MODBUS_MAX_CONCURRENCY", "16"))   # devices polled at once
+ADAPT_AFTER     = int(os.getenv("MODBUS_ADAPT_AFTER", "5"))         # unchanged scans before a group slows down
+
+
+class DeviceLink:
+    """
+    Persistent async client for one device; its circuit breaker decides when to try.
+    RTU devices borrow their serial line's client (see transports.SerialLine).
+    """
+
+    def __init__(self, dev: Device):
+        self.dev = dev
+        self.client = None
+        self.line: Optional[SerialLine] = serial_line(dev) if dev.transport == RTU else None
+        self.breaker = board.get(dev.host, dev.port, dev.unit_id, dev.name)
+
+    async def ensure_connected(self):
+        if self.client is not None and self.client.connected:
+            return self.client
+
+        self.close()
+        if self.line is not None:
+            if await self.line.ensure_connected(self.dev.timeout) is None:
+                metrics.connect_failures_total.inc(self.dev.name)
+                print(f"[AsyncPoller] {self.dev.name}: cannot open {self.line.port}")
+                return None
+            self.client = PacedClient(self.line)
+            return self.client
+
+        client = tcp_client(self.dev)
+        if not await client.connect():
+            client.close()
+            metrics.connect_failures_total.inc(self.dev.name)
+            print(f"[AsyncPoller] {self.dev.name}: connect to {self.dev.host}:{self.dev.port} failed")
+            return None
+        self.client = client
+        return client
+
+    def failed(self, error: object = None):
+        self.close()
+        self.breaker.failure(error)
+
+    def close(self):
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+            self.client = None
+
+
+class Scan:
+    """One (device, scan group) entry in the scheduler queue."""
+
+    def __init__(self, dev: Device, group: ScanGroup):
+        self.dev = dev
+        self.group = group
+        self.base = group.interval if group.interval is not None else dev.interval
+        self.interval = self.base
+        self.max_interval = (group.max_interval
+                             if group.max_interval and group.max_interval > self.base else None)
+        self.stable = 0
+        self.last_raw = None
+        self.busy = False
+
+    def settle(self, raw: tuple):
+        """Adaptive slowdown: double the interval after ADAPT_AFTER unchanged scans, snap back on change."""
+        if raw == self.last_raw:
+            self.stable += 1
+            if self.max_interval and self.stable >= ADAPT_AFTER:
+                self.interval = min(self.max_interval, self.interval * 2)
+                self.stable = 0
+        else:
+            self.stable = 0
+            self.interval = self.base
+        self.last_raw = raw
+
+
+class DeviceState:
+    """Link, plan and the merged latest registers/values of one device."""
+
+    def __init__(self, dev: Device):
+        self.link = DeviceLink(dev)
+        self.plan: ReadPlan = get_plan(dev.tag_map)
+        line = self.link.line
+        self.lock = asyncio.Lock()   # one request stream per connection
+        if line is not None:
+            wire = sum(line.request_budget(b.count) for b in self.plan.blocks)
+            if wire > dev.timeout:
+                print(f"[AsyncPoller] {dev.name}: a full cycle needs ~{wire:.2f}s of wire time "
+                      f"at {line.baudrate} baud but timeout is {dev.timeout}s")
+        self.regs: Dict[str, List[int]] = {}
+        self.values: Dict[str, object] = {}
+
+    def turn(self):
+        """Exclusive use of the device's wire: its own socket, or its turn on the RS-485 bus."""
+        line = self.link.line
+        return self.lock if line is None else line.queue.turn(self.link.dev.unit_id)
+
+
+class AsyncPoller:
+    """
+    Polls many devices concurrently on one event loop.
+    Every (device, scan group) pair is an entry in one deadline-ordered queue, so fast
+    scan classes get the bus time and static setpoints are read rarely. A semaphore
+    caps in-flight requests, and a per-device timeout keeps one dead PLC from
+    delaying the others.
+    """
+
+    def __init__(self, devices: List[Device], max_concurrency: int = MAX_CONCURRENCY):
+        self.devices = devices
+        self.max_concurrency = max(1, max_concurrency)
+        self.state: Dict[str, DeviceState] = {}
+        self.scans: List[Scan] = []
+        self._stopping = False
+        self._sem: Optional[asyncio.Semaphore] = None
+        for dev in devices:
+            st = self.state[dev.name] = DeviceState(dev)
+            self.scans += [Scan(dev, group) for group in st.plan.groups]
+
+    @property
+    def links(self) -> Dict[str, DeviceLink]:
+        return {name: st.link for name, st in self.state.items()}
+
+    async def _read(self, st: DeviceState, blocks):
+        client = await st.link.ensure_connected()
+        if client is None:
+            return None
+        return await modbus.read_blocks_async(client, st.link.dev.unit_id, blocks, st.link.dev.name)
+
+    def _allowed(self, dev: Device) -> bool:
+        """False while the device's circuit is open: skip it, /status/ keeps its last snapshot."""
+        return self.state[dev.name].link.breaker.allow()
+
+    async def _read_guarded(self, dev: Device, blocks):
+        """Read `blocks` once the breaker allowed it (see _allowed); reports the outcome to it."""
+        st = self.state[dev.name]
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        try:
+            async with st.turn(), self._sem:
+                parts = await asyncio.wait_for(self._read(st, blocks), timeout=dev.timeout)
+            if parts is not None:
+                st.link.breaker.success()
+                return parts
+            error = "no block answered" if st.link.client is not None else "connect failed"
+        except asyncio.TimeoutError:
+            metrics.cycle_timeouts_total.inc(dev.name)
+            print(f"[AsyncPoller] {dev.name}: cycle exceeded {dev.timeout}s")
+            error = f"cycle exceeded {dev.timeout}s"
+        except Exception as e:
+            print(f"[AsyncPoller] {dev.name}: cycle raised:", repr(e))
+            error = repr(e)
+        st.link.failed(error)
+        return None
+
+    def _publish(self, dev: Device, parts) -> Dict[str, object]:
+        st = self.state[dev.name]
+        st.regs.update(parts[0])
+        st.values.update(parts[1])
+        data = modbus.assemble(st.plan, st.regs, st.values)
+        if dev.name == DEFAULT_DEVICE:
+            modbus.last_values.update(data)   # keep get_last_values() meaningful
+        return publish_cycle(data, dev.name, st.plan)
+
+    async def poll_device(self, dev: Device) -> Optional[Dict[str, object]]:
+        """One full cycle (every block) for one device; publishes on success."""
+        if not self._allowed(dev):
+            return None
+        parts = await self._read_guarded(dev, self.state[dev.name].plan.blocks)
+        return self._publish(dev, parts) if parts is not None else None
+
+    async def _scan(self, sc: Scan):
+        started = time.perf_counter()
+        try:
+            if not self._allowed(sc.dev):
+                return   # no cycle ran: nothing to time
+            parts = await self._read_guarded(sc.dev, sc.group.blocks)
+            metrics.cycle_seconds.observe(time.perf_counter() - started, sc.dev.name, sc.group.name)
+            if parts is None:
+                return
+            regs = parts[0]
+            sc.settle(tuple(r for t in sc.group.tags for r in regs.get(t.name, ())))
+            self._publish(sc.dev, parts)
+        finally:
+            sc.busy = False
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        order = itertools.count()
+        now = loop.time()
+        # (deadline, interval, tiebreak, scan): at equal deadlines the faster class goes first
+        queue = [(now, sc.interval, next(order), sc) for sc in self.scans]
+        heapq.heapify(queue)
+        running = set()
+        try:
+            while queue and not self._stopping:
+                due, _, _, sc = queue[0]
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                heapq.heappop(queue)
+                if not sc.busy:   # an overrunning scan just skips this slot
+                    sc.busy = True
+                    task = loop.create_task(self._scan(sc))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+                else:
+                    metrics.overruns_total.inc(sc.dev.name, sc.group.name)
+                nxt = due + sc.interval
+                if nxt <= loop.time():   # fell behind: don't try to catch up in a burst
+                    nxt = loop.time() + sc.interval
+                heapq.heappush(queue, (nxt, sc.interval, next(order), sc))
+        finally:
+            for t in list(running):
+                t.cancel()
+            for st in self.state.values():
+                st.link.close()
+
+    def stop(self):
+        self._stopping = True
+
+
+def run_forever(devices: List[Device], max_concurrency: int = MAX_CONCURRENCY):
+    """Blocking entry point for a poller thread."""
+    try:
+        asyncio.run(AsyncPoller(devices, max_concurrency).run())
+    except Exception as e:
+        print("[AsyncPoller] stopped:", repr(e))
+        traceback.print_exc()
@@ -0,0 +1,312 @@
+# backend/modbus_reader/alarms.py
+"""
+Alarm rules evaluated on the poll stream.
+
+Rules come from a JSON file (MODBUS_ALARM_RULES); the kind follows from the keys:
+
+  [{"name": "speed_high",  "tag": "float1", "high": 120, "hysteresis": 2, "on_delay": 5},
+   {"name": "temp_range",  "tag": "float3", "low": 10, "high": 80, "off_delay": 30,
+    "device": "press-1", "severity": "critical", "message": "oil temperature"},
+   {"name": "pcs_stalled", "tag": "float1", "stalled": 300}]
+
+  high      active while value > high, clears below high - hysteresis
+  low       active while value < low, clears above low + hysteresis
+  low+high  out of range, clears back inside the range narrowed by hysteresis
+  stalled   active when the tag has not changed for that many seconds
+  device    a device name, or "*" (default) for every device
+
+on_delay: the condition must hold that long before the alarm is raised;
+off_delay: the clear condition must hold that long before it clears.
+
+Rules are compiled once into a (device, tag) -> rules index, so a snapshot only
+costs the rules of the tags in its "changes" (values are the change detector's
+reported values, i.e. after deadband). Delays and stall timeouts sit in one heap
+and fire on the next snapshot of any device, or when the alarms are read. A rule
+keeps one heap entry: moving its deadline later (a stall timer on every change)
+only updates the state, and the entry re-arms itself when it comes up.
+
+Rules are evaluated once per host, in the process that owns the poll stream (the
+thread-mode poller or run_poller). Its `sink` ships each batch of raised/cleared
+events, with the active set, to the web workers over the snapshot feed; they
+ingest() it the way the change detector mirrors change_seq, so /alarms/ serves
+the same seqs and timestamps in every worker.
+"""
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+# -------- CONFIG --------
+RULES_FILE = os.getenv("MODBUS_ALARM_RULES", "")   # no rules file = no alarms
+ALARM_LOG  = int(os.getenv("MODBUS_ALARM_LOG", "1000"))   # raised/cleared events kept for /alarms/
+
+
+@dataclass
+class Rule:
+    name: str
+    tag: str
+    device: str = "*"
+    high: Optional[float] = None
+    low: Optional[float] = None
+    stalled: Optional[float] = None
+    hysteresis: float = 0.0
+    on_delay: float = 0.0
+    off_delay: float = 0.0
+    severity: str = "warning"
+    message: str = ""
+
+    def __post_init__(self):
+        if self.stalled is None and self.high is None and self.low is None:
+            raise ValueError(f"alarm {self.name}: needs high, low or stalled")
+        if self.stalled is not None and (self.high is not None or self.low is not None):
+            raise ValueError(f"alarm {self.name}: stalled can't be combined with high/low")
+
+    @property
+    def kind(self) -> str:
+        if self.stalled is not None:
+            return "stalled"
+        if self.high is not None and self.low is not None:
+            return "range"
+        return "high" if self.high is not None else "low"
+
+    def tripped(self, v: float) -> bool:
+        return (self.high is not None and v > self.high) or (self.low is not None and v < self.low)
+
+    def cleared(self, v: float) -> bool:
+        h = self.hysteresis
+        return ((self.high is None or v < self.high - h) and
+                (self.low is None or v > self.low + h))
+
+
+def load_rules(path: str = RULES_FILE) -> List[Rule]:
+    if not path:
+        return []
+    with open(path) as f:
+        entries = json.load(f)
+    rules, seen = [], set()
+    for entry in entries:
+        rule = Rule(**entry)
+        if (rule.name, rule.device) in seen:
+            raise ValueError(f"duplicate alarm in {path}: {rule.name} ({rule.device})")
+        seen.add((rule.name, rule.device))
+        rules.append(rule)
+    return rules
+
+
+class AlarmState:
+    __slots__ = ("rule", "device", "active", "since", "value", "last_change", "pending", "due", "queued")
+
+    def __init__(self, rule: Rule, device: str):
+        self.rule = rule
+        self.device = device
+        self.active = False
+        self.since: Optional[float] = None        # raised at
+        self.value: object = None
+        self.last_change: Optional[float] = None
+        self.pending: Optional[str] = None        # "on" / "off" while a delay runs
+        self.due: Optional[float] = None          # when `pending` takes effect
+        self.queued: Optional[float] = None       # deadline of this state's live heap entry
+
+    def as_dict(self) -> Dict[str, object]:
+        r = self.rule
+        return {"name": r.name, "device": self.device, "tag": r.tag, "kind": r.kind,
+                "severity": r.severity, "message": r.message, "since": self.since,
+                "value": self.value, "clearing": self.pending == "off"}
+
+
+AlarmEvent = Tuple[int, float, str, str, str, str, object]   # (seq, ts, raised|cleared, name, device, tag, value)
+
+
+class AlarmEngine:
+    def __init__(self, rules: Optional[List[Rule]] = None, log_size: int = ALARM_LOG):
+        self._lock = threading.Lock()
+        self.rules = load_rules() if rules is None else rules
+        self._index: Dict[str, Dict[str, List[AlarmState]]] = {}   # device -> tag -> states
+        self._timers: List[Tuple[float, int, AlarmState]] = []
+        self._order = itertools.count()
+        self._states = 0
+        self._active: Dict[Tuple[str, str], AlarmState] = {}
+        self._log: Deque[AlarmEvent] = deque(maxlen=log_size)
+        self._seq = 0
+        self.sink: Optional[Callable[[Dict[str, object]], object]] = None   # owner: to the fed workers
+        self._unsent: List[AlarmEvent] = []
+        self._mirror: Optional[List[Dict[str, object]]] = None   # fed workers: the owner's active set
+
+    def _device_index(self, device: str) -> Dict[str, List[AlarmState]]:
+        """Compile the rules that apply to `device` (once, on its first snapshot)."""
+        index = self._index.get(device)
+        if index is None:
+            index = self._index[device] = {}
+            for rule in self.rules:
+                if rule.device in ("*", device):
+                    index.setdefault(rule.tag, []).append(AlarmState(rule, device))
+                    self._states += 1
+        return index
+
+    # ---- transitions ----
+    def _schedule(self, st: AlarmState, when: float, pending: str):
+        st.pending, st.due = pending, when
+        if st.queued is None or when < st.queued:   # a later deadline waits for the queued entry
+            st.queued = when
+            heapq.heappush(self._timers, (when, next(self._order), st))
+            if len(self._timers) > 2 * self._states + 16:
+                self._compact()
+
+    def _compact(self):
+        """Drop the entries left behind when deadlines moved earlier."""
+        live = {id(st): (when, order, st) for when, order, st in self._timers if when == st.queued}
+        self._timers = list(live.values())
+        heapq.heapify(self._timers)
+
+    def _cancel(self, st: AlarmState):
+        st.pending = st.due = None   # the heap entry is dropped when it comes up
+
+    def _raise(self, st: AlarmState, ts: float):
+        self._cancel(st)
+        st.active, st.since = True, ts
+        self._active[(st.device, st.rule.name)] = st
+        self._emit(ts, "raised", st)
+
+    def _clear(self, st: AlarmState, ts: float):
+        self._cancel(st)
+        st.active, st.since = False, None
+        self._active.pop((st.device, st.rule.name), None)
+        self._emit(ts, "cleared", st)
+        if st.rule.stalled is not None:   # fires again if nothing changes for `stalled` seconds
+            self._schedule(st, st.last_change + st.rule.stalled + st.rule.on_delay, "on")
+
+    def _emit(self, ts: float, what: str, st: AlarmState):
+        self._seq += 1
+        event = (self._seq, ts, what, st.rule.name, st.device, st.rule.tag, st.value)
+        self._log.append(event)
+        if self.sink is not None:
+            self._unsent.append(event)
+        print(f"[Alarm] {st.device}/{st.rule.name} {what} ({st.rule.tag}={st.value})")
+
+    def _on(self, st: AlarmState, ts: float):
+        if st.rule.on_delay <= 0:
+            self._raise(st, ts)
+        elif st.pending != "on":
+            self._schedule(st, ts + st.rule.on_delay, "on")
+
+    def _off(self, st: AlarmState, ts: float):
+        if st.rule.off_delay <= 0:
+            self._clear(st, ts)
+        elif st.pending != "off":
+            self._schedule(st, ts + st.rule.off_delay, "off")
+
+    def _evaluate(self, st: AlarmState, value: object, ts: float):
+        st.value = value
+        st.last_change = ts
+        rule = st.rule
+        if rule.stalled is not None:
+            if st.active:
+                self._off(st, ts)   # clearing re-arms the timer (see _clear)
+            else:
+                self._schedule(st, ts + rule.stalled + rule.on_delay, "on")
+            return
+        if not isinstance(value, (int, float)) or value != value:
+            return   # unknown value: hold the current state
+        if not st.active:
+            if rule.tripped(value):
+                self._on(st, ts)
+            else:
+                self._cancel(st)
+        elif rule.cleared(value):
+            self._off(st, ts)
+        else:
+            self._cancel(st)
+
+    def _fire(self, now: float):
+        timers = self._timers
+        while timers and timers[0][0] <= now:
+            when, _, st = heapq.heappop(timers)
+            if when != st.queued:
+                continue   # superseded by an earlier deadline
+            st.queued = None
+            if st.pending is None:
+                continue   # cancelled
+            if st.due > when:   # moved later meanwhile: re-arm
+                st.queued = st.due
+                heapq.heappush(timers, (st.due, next(self._order), st))
+            elif st.pending == "on":
+                self._raise(st, when)
+            else:
+                self._clear(st, when)
+
+    def _ship(self):
+        """Hand the events raised/cleared since the last call, with the active set, to the sink."""
+        if self.sink is None:
+            return
+        with self._lock:
+            if not self._unsent:
+                return
+            msg = {"op": "alarms", "seq": self._seq, "events": self._unsent,
+                   "active": [st.as_dict() for st in self._active.values()]}
+            self._unsent = []
+        try:
+            self.sink(msg)
+        except Exception as e:
+            print("[Alarm] sink failed:", repr(e))
+
+    # ---- feeding / reading ----
+    def observe(self, snap: Dict[str, object]):
+        """Snapshot-store listener (owning process): evaluate only the rules of the tags that changed."""
+        if not self.rules:
+            return
+        changes = snap.get("changes")
+        ts = snap["ts"]
+        with self._lock:
+            self._fire(ts)
+            if changes:
+                index = self._device_index(snap["device"])
+                for tag, value in changes.items():
+                    states = index.get(tag)
+                    if states:
+                        for st in states:
+                            self._evaluate(st, value, ts)
+        self._ship()
+
+    def ingest(self, msg: Dict[str, object]):
+        """
+        Fed workers: mirror the owner's events under the owner's seqs. Events already
+        seen (a replay after reconnecting) are skipped; a gap restarts the log, so
+        events() from before it are simply gone.
+        """
+        head = msg["seq"]
+        with self._lock:
+            if head < self._seq:                  # the owner restarted
+                self._log.clear()
+                self._seq = 0
+            events = [tuple(e) for e in msg["events"] if e[0] > self._seq]
+            if events and events[0][0] != self._seq + 1:
+                self._log.clear()
+            self._log.extend(events)
+            self._seq = head
+            self._mirror = msg["active"]
+
+    def active(self, device: Optional[str] = None) -> List[Dict[str, object]]:
+        with self._lock:
+            if self._mirror is not None:
+                out = [a for a in self._mirror if device is None or a["device"] == device]
+            else:
+                self._fire(time.time())
+                out = [st.as_dict() for st in self._active.values() if device is None or st.device == device]
+        self._ship()
+        return sorted(out, key=lambda a: a["since"] or 0.0)
+
+    def events(self, since: int = 0, device: Optional[str] = None) -> Tuple[List[AlarmEvent], int]:
+        with self._lock:
+            self._fire(time.time())
+            events = [e for e in self._log if e[0] > since and (device is None or e[4] == device)]
+            seq = self._seq
+        self._ship()
+        return events, seq
+
+
+alarms = AlarmEngine()
@@ -1,14 +1,23 @@
 from django.apps import AppConfig
-import threading
-import time
-from . import modbus
+
 
 class ModbusReaderConfig(AppConfig):
     name = 'modbus_reader'
 
     def ready(self):
-        def poll_loop():
-            while True:
-                modbus.read_modbus()
-                time.sleep(5)
-        threading.Thread(target=poll_loop, daemon=True).start()
+        # One poller owns the PLC traffic; /status/ only reads its snapshot.
+        # Only serving processes start anything (MODBUS_POLLER_ROLE): migrate, shell,
+        # tests and run_poller itself (which starts its own shards) stay quiet.
+        from .poller import process_role, start_feed, start_poller
+        role = process_role()
+        if role == "off":
+            return
+        from .snapshot import store
+        from .stream import broadcaster
+        store.subscribe(broadcaster.notify)
+        if role == "service":
+            start_feed()
+        elif role == "follow":
+            start_feed("socket")    # the elected thread-mode poller serves the socket only
+        elif role == "thread":
+            start_poller()
@@ -0,0 +1,123 @@
+# backend/modbus_reader/breaker.py
+"""
+Per-device circuit breakers, shared by the async poller links and the sync
+connection pool (writes, resets, recipe downloads).
+
+closed    -> requests go through; K consecutive failures open the circuit
+open      -> requests fail immediately until the retry time
+half_open -> exactly one probe is let through; success closes the circuit,
+             failure re-opens it with twice the previous wait (capped)
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# -------- CONFIG --------
+FAILURE_THRESHOLD = int(os.getenv("MODBUS_BREAKER_FAILURES", "3"))     # consecutive failures before opening
+OPEN_INITIAL      = float(os.getenv("MODBUS_BREAKER_OPEN", "1.0"))     # first open period (seconds)
+OPEN_MAX          = float(os.getenv("MODBUS_BREAKER_OPEN_MAX", "60"))  # cap for the doubling
+PROBE_TIMEOUT     = 10.0   # a probe that never reports back frees the slot after this long
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+Key = Tuple[str, int, int]   # (host, port, unit id)
+
+
+class CircuitBreaker:
+    def __init__(self, key: Key, threshold: int = FAILURE_THRESHOLD,
+                 open_initial: float = OPEN_INITIAL, open_max: float = OPEN_MAX):
+        self.key = key
+        self.threshold = max(1, threshold)
+        self.open_initial = open_initial
+        self.open_max = open_max
+        self.state = CLOSED
+        self.failures = 0          # consecutive failures while closed
+        self.opens = 0             # consecutive open periods (drives the backoff)
+        self.opens_total = 0
+        self.retry_at = 0.0
+        self.probe_until = 0.0
+        self.last_error: Optional[str] = None
+        self.last_ok: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """May a request go to the device now? (Takes the probe slot when half-open.)"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now < self.retry_at:
+                return False
+            if self.state == HALF_OPEN and now < self.probe_until:
+                return False   # a probe is already in flight
+            self.state = HALF_OPEN
+            self.probe_until = now + PROBE_TIMEOUT
+            return True
+
+    def success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"[Breaker] {self._name()}: closed")
+            self.state = CLOSED
+            self.failures = self.opens = 0
+            self.last_ok = time.time()
+
+    def failure(self, error: object = None):
+        with self._lock:
+            if error is not None:
+                self.last_error = str(error)
+            if self.state == CLOSED:
+                self.failures += 1
+                if self.failures < self.threshold:
+                    return
+            self.opens += 1
+            self.opens_total += 1
+            wait = min(self.open_max, self.open_initial * (2 ** (self.opens - 1)))
+            self.state = OPEN
+            self.failures = 0
+            self.retry_at = time.monotonic() + wait
+            print(f"[Breaker] {self._name()}: open for {wait:.1f}s ({self.last_error})")
+
+    def retry_in(self) -> float:
+        return max(0.0, self.retry_at - time.monotonic()) if self.state == OPEN else 0.0
+
+    def health(self) -> Dict[str, object]:
+        return {"state": self.state, "failures": self.failures,
+                "retry_in": round(self.retry_in(), 3), "last_error": self.last_error,
+                "last_ok": self.last_ok}
+
+    def _name(self) -> str:
+        return "{}:{}/{}".format(*self.key)
+
+
+class BreakerBoard:
+    """One breaker per (host, port, unit id); device names map onto them for /status/."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers: Dict[Key, CircuitBreaker] = {}
+        self._names: Dict[str, Key] = {}
+
+    def get(self, host: str, port: int, unit_id: int, name: Optional[str] = None) -> CircuitBreaker:
+        key = (host, int(port), int(unit_id))
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(key)
+            if name is not None:
+                self._names[name] = key
+            return breaker
+
+    def for_device(self, name: str) -> Optional[CircuitBreaker]:
+        with self._lock:
+            key = self._names.get(name)
+            return self._breakers.get(key) if key is not None else None
+
+    def devices(self) -> Dict[str, CircuitBreaker]:
+        with self._lock:
+            return {name: self._breakers[key] for name, key in self._names.items()}
+
+
+board = BreakerBoard()
@@ -0,0 +1,127 @@
+# backend/modbus_reader/changes.py
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .register_map import ReadPlan
+from .snapshot import store
+
+# -------- CONFIG --------
+CHANGE_LOG_SIZE = int(os.getenv("MODBUS_CHANGE_LOG", "10000"))   # events kept for /changes/?since=
+
+ChangeEvent = Tuple[int, str, str, float, object]   # (seq, device, tag, ts, value)
+
+
+class ChangeDetector:
+    """
+    Report-by-exception stage between decode and publish.
+    A cycle whose raw registers equal the previous cycle's costs one list compare.
+    Otherwise each tag whose registers moved is checked against its deadband
+    (absolute and/or percent of the last reported value); survivors become change
+    events with a global sequence number.
+    """
+
+    def __init__(self, log_size: int = CHANGE_LOG_SIZE):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._log: Deque[ChangeEvent] = deque(maxlen=log_size)
+        self._raw: Dict[str, list] = {}                     # device -> last raw registers
+        self._reported: Dict[str, Dict[str, object]] = {}   # device -> tag -> last reported value
+
+    @staticmethod
+    def _passes(tag, old, new) -> bool:
+        if old is None or new is None or not isinstance(new, (int, float)):
+            return old != new
+        delta = abs(new - old)
+        if tag.deadband and delta <= tag.deadband:
+            return False
+        if tag.deadband_pct and delta <= abs(old) * tag.deadband_pct / 100.0:
+            return False
+        return delta != 0
+
+    def detect(self, device: str, data: Dict[str, object], plan: ReadPlan,
+               ts: float) -> Dict[str, object]:
+        """Changed tag values for this cycle (all tags on a device's first cycle)."""
+        raw = data.get("raw") or []
+        values = data.get("tags") or {}
+        with self._lock:
+            if self._raw.get(device) == raw:
+                return {}
+            self._raw[device] = raw
+            reported = self._reported.setdefault(device, {})
+
+            changed: Dict[str, object] = {}
+            for tag in plan.tags:
+                new = values.get(tag.name)
+                if tag.name not in reported or self._passes(tag, reported[tag.name], new):
+                    reported[tag.name] = new
+                    changed[tag.name] = new
+            self._append(device, changed, ts)
+            return changed
+
+    def _append(self, device: str, changed: Dict[str, object], ts: float):
+        for name, value in changed.items():
+            self._seq += 1
+            self._log.append((self._seq, device, name, ts, value))
+
+    def record(self, device: str, changed: Dict[str, object], ts: float) -> int:
+        """
+        Sequence changes that were detected in another process (a poller shard).
+        Returns the new head seq.
+        """
+        with self._lock:
+            self._append(device, changed, ts)
+            return self._seq
+
+    def ingest(self, snap: Dict[str, object]):
+        """
+        Snapshot-store listener for web workers fed by the poller service: mirror the
+        service's events under the service's seqs. A gap (reconnect) restarts the log,
+        so since() reports older seqs as missed.
+        """
+        changed = snap.get("changes")
+        if not changed:
+            return
+        head = snap["change_seq"]
+        first = head - len(changed) + 1
+        with self._lock:
+            if first != self._seq + 1:
+                self._log.clear()
+            for seq, (name, value) in enumerate(changed.items(), first):
+                self._log.append((seq, snap["device"], name, snap["ts"], value))
+            self._seq = head
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def since(self, seq: int, device: Optional[str] = None) -> Tuple[List[ChangeEvent], bool]:
+        """
+        Events after `seq` (optionally for one device).
+        The flag is True when `seq` is older than the log, i.e. the caller missed
+        events and should reload the full snapshot first.
+        """
+        with self._lock:
+            if not self._log:
+                return [], False
+            first = self._log[0][0]
+            # seqs in the log are contiguous, so the start index is arithmetic
+            tail = list(islice(self._log, max(0, seq - first + 1), None))
+        missed = seq < first - 1
+        if device is not None:
+            tail = [e for e in tail if e[1] == device]
+        return tail, missed
+
+
+detector = ChangeDetector()
+
+
+def publish_cycle(data: Dict[str, object], device: str, plan: ReadPlan) -> Dict[str, object]:
+    """Run change detection on a decoded cycle and publish it (with "changes" / "change_seq")."""
+    ts = time.time()
+    changed = detector.detect(device, data, plan, ts)
+    return store.publish({**data, "changes": changed, "change_seq": detector.seq},
+                         device=device, ts=ts)
@@ -0,0 +1,145 @@
+# backend/modbus_reader/connections.py
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from . import metrics
+from .breaker import board
+
+if TYPE_CHECKING:
+    from pymodbus.client import ModbusTcpClient
+    from .devices import Device
+
+Key = Tuple[str, int, int]   # (host, port, unit id)
+
+# RTU devices are on a serial line, which only the async poller (transports.SerialLine)
+# drives. These sync helpers are TCP-only.
+SERIAL_PORT = re.compile(r"^(/dev/.+|COM\d+)$", re.IGNORECASE)
+
+
+class ConnectionUnavailable(Exception):
+    """Raised when a device can't be reached (connect failed or its circuit is open)."""
+
+
+class TransportUnsupported(Exception):
+    """Raised when a sync (TCP) request targets an RTU device: it would reach a different host."""
+
+
+@lru_cache(maxsize=1)
+def configured_devices() -> List["Device"]:
+    """The poller's device list (read once), to tell which targets are RTU."""
+    from .devices import load_devices   # devices -> modbus -> connections
+    try:
+        return load_devices()
+    except (OSError, ValueError, TypeError) as e:
+        print("[Connections] can't read the device list:", repr(e))
+        return []
+
+
+def check_tcp(host: str, device: Optional[str] = None):
+    """
+    Refuse to open a TCP socket for an RTU device: `host` is a serial port, or the
+    device list has the target on RTU - `device` by name when the caller knows it
+    (MODBUS_HOST may be unrelated to an RTU default device), else by host.
+    """
+    if SERIAL_PORT.match(host) or any(
+            d.transport == "rtu" and (d.name == device or d.host == host) for d in configured_devices()):
+        raise TransportUnsupported(
+            f"{device or host}: writes and one-off reads are TCP-only; not supported on RTU transport")
+
+
+class PooledConnection:
+    """
+    One long-lived ModbusTcpClient plus the device's circuit breaker.
+    The lock serializes requests: a pymodbus sync client is not thread-safe.
+    """
+
+    def __init__(self, host: str, port: int, unit_id: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.unit_id = unit_id
+        self.timeout = timeout
+        self.lock = threading.RLock()
+        self.client = None
+        self.breaker = board.get(host, port, unit_id)
+
+    def ensure_connected(self) -> "ModbusTcpClient":
+        """Return a connected client, reconnecting if the socket dropped."""
+        if self.client is not None and self.client.connected:
+            return self.client
+
+        self.close()
+        from pymodbus.client import ModbusTcpClient   # imported on first use: web workers may never write
+        client = ModbusTcpClient(self.host, port=self.port, timeout=self.timeout)
+        if not client.connect():
+            self.breaker.failure("connect failed")
+            metrics.connect_failures_total.inc(f"{self.host}:{self.port}")
+            try:
+                client.close()
+            except Exception:
+                pass
+            raise ConnectionUnavailable(f"connect to {self.host}:{self.port} failed")
+
+        self.client = client
+        return client
+
+    def close(self):
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+            self.client = None
+
+
+class ConnectionManager:
+    """Keeps one persistent connection per (host, port, unit id)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conns: Dict[Key, PooledConnection] = {}
+
+    def get(self, host: str, port: int, unit_id: int, timeout: float = 1.0) -> PooledConnection:
+        key = (host, int(port), int(unit_id))
+        with self._lock:
+            conn = self._conns.get(key)
+            if conn is None:
+                conn = PooledConnection(host, int(port), int(unit_id), timeout)
+                self._conns[key] = conn
+            return conn
+
+    @contextmanager
+    def session(self, host: str, port: int, unit_id: int, timeout: float = 1.0,
+                device: Optional[str] = None):
+        """
+        Exclusive use of the pooled client for a group of requests.
+        Fails fast while the device's circuit is open; any exception drops the
+        socket and counts against the breaker. `device` names the target for check_tcp.
+        """
+        check_tcp(host, device)
+        conn = self.get(host, port, unit_id, timeout)
+        if not conn.breaker.allow():
+            raise ConnectionUnavailable(
+                f"{host}:{port} circuit open, retry in {conn.breaker.retry_in():.1f}s")
+        with conn.lock:
+            client = conn.ensure_connected()
+            try:
+                yield client
+            except Exception as e:
+                conn.close()
+                conn.breaker.failure(repr(e))
+                raise
+            conn.breaker.success()
+
+    def close_all(self):
+        with self._lock:
+            conns = list(self._conns.values())
+            self._conns.clear()
+        for conn in conns:
+            with conn.lock:
+                conn.close()
+
+
+connections = ConnectionManager()
@@ -0,0 +1,131 @@
+# backend/modbus_reader/decode.py
+"""
+Batch register decoding.
+
+A whole register block is packed to bytes once and every tag in it is pulled out
+by a single precompiled struct format (gaps become pad bytes), instead of one
+struct call and a few bytes() objects per value.
+
+Word/byte order trick: packing the words with byte order P and unpacking the value
+with endianness U gives all four layouts without shuffling words by hand:
+    ABCD (word big,    byte big)    -> P=">" U=">"
+    CDAB (word little, byte big)    -> P="<" U="<"
+    BADC (word big,    byte little) -> P="<" U=">"
+    DCBA (word little, byte little) -> P=">" U="<"
+"""
+import struct
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+# type -> (registers, struct code)
+TYPES = {
+    "int16":   (1, "h"),
+    "uint16":  (1, "H"),
+    "int32":   (2, "i"),
+    "uint32":  (2, "I"),
+    "float32": (2, "f"),
+    "float64": (4, "d"),
+}
+
+
+def _endianness(word_order: str, byte_order: str) -> Tuple[str, str]:
+    """(pack char for the words, unpack char for the values)"""
+    pack = ">" if word_order == byte_order else "<"
+    unpack = ">" if word_order == "big" else "<"
+    return pack, unpack
+
+
+@lru_cache(maxsize=None)
+def _words_struct(pack: str, count: int) -> struct.Struct:
+    return struct.Struct(f"{pack}{count}H")
+
+
+@lru_cache(maxsize=None)
+def _array_structs(type_: str, word_order: str, byte_order: str,
+                   n: int) -> Tuple[struct.Struct, struct.Struct]:
+    words, code = TYPES[type_]
+    pack, unpack = _endianness(word_order.lower(), byte_order.lower())
+    return _words_struct(pack, n * words), struct.Struct(f"{unpack}{n}{code}")
+
+
+def decode_array(regs: Sequence[int], type_: str = "float32",
+                 word_order: str = "big", byte_order: str = "big") -> Tuple:
+    """Decode a flat register list as consecutive values of one type (trailing odd words ignored)."""
+    n = len(regs) // TYPES[type_][0]
+    if n == 0:
+        return ()
+    words, values = _array_structs(type_, word_order, byte_order, n)
+    return values.unpack(words.pack(*regs[:n * TYPES[type_][0]]))
+
+
+class BlockDecoder:
+    """
+    Precompiled decoder for one read block.
+    decode(regs) returns the values of `tags` (same order), already scaled.
+    """
+
+    def __init__(self, start: int, count: int, tags: Sequence):
+        self.tags = list(tags)
+        self._packers: Dict[str, struct.Struct] = {}
+        # (pack char, struct, byte offset, tag indexes, scales or None)
+        self._groups: List[Tuple[str, struct.Struct, int, List[int], object]] = []
+
+        by_order: Dict[Tuple[str, str], List[int]] = {}
+        for i, tag in enumerate(self.tags):
+            by_order.setdefault(_endianness(tag.word_order, tag.byte_order), []).append(i)
+
+        for (pack, unpack), idxs in by_order.items():
+            self._packers.setdefault(pack, _words_struct(pack, count))
+            idxs.sort(key=lambda i: self.tags[i].address)
+            # Overlapping tags can't share one format; split into runs that don't overlap
+            run: List[int] = []
+            for i in idxs:
+                if run and self.tags[i].address < self.tags[run[-1]].end:
+                    self._add_group(start, pack, unpack, run)
+                    run = []
+                run.append(i)
+            if run:
+                self._add_group(start, pack, unpack, run)
+
+    def _add_group(self, start: int, pack: str, unpack: str, run: List[int]):
+        first = self.tags[run[0]].address
+        fmt = [unpack]
+        pos = first
+        for i in run:
+            tag = self.tags[i]
+            if tag.address > pos:
+                fmt.append(f"{2 * (tag.address - pos)}x")
+            fmt.append(TYPES[tag.type][1])
+            pos = tag.end
+        scales = [self.tags[i].scale for i in run]
+        if all(s == 1.0 for s in scales):
+            scales = None
+        self._groups.append((pack, struct.Struct("".join(fmt)), 2 * (first - start), run, scales))
+
+    def decode(self, regs: Sequence[int]) -> List[object]:
+        bufs = {pack: st.pack(*regs) for pack, st in self._packers.items()}
+        out: List[object] = [None] * len(self.tags)
+        for pack, st, offset, run, scales in self._groups:
+            values = st.unpack_from(bufs[pack], offset)
+            if scales is None:
+                for i, v in zip(run, values):
+                    out[i] = v
+            else:
+                for i, v, s in zip(run, values, scales):
+                    out[i] = v * s
+        return out
+
+
+def encode_value(value, type_: str = "float32", word_order: str = "big",
+                 byte_order: str = "big", scale: float = 1.0) -> List[int]:
+    """Inverse of decode_array for one value: engineering value -> registers (scale undone)."""
+    words, code = TYPES[type_]
+    pack, unpack = _endianness(word_order.lower(), byte_order.lower())
+    raw = value / scale if scale != 1.0 else value
+    if code in "hHiI":
+        raw = int(round(raw))
+    try:
+        data = struct.pack(f"{unpack}{code}", raw)
+    except struct.error as e:
+        raise ValueError(f"{value!r} does not fit {type_}: {e}") from None
+    return list(_words_struct(pack, words).unpack(data))
@@ -0,0 +1,78 @@
+# backend/modbus_reader/devices.py
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from . import modbus
+from .snapshot import DEFAULT_DEVICE
+
+# JSON list of devices; when unset, the single MODBUS_HOST device is polled.
+# [{"name": "press-1", "host": "192.168.1.20", "port": 502, "unit_id": 1,
+#   "interval": 1.0, "timeout": 1.0, "tag_map": "/etc/bina/press.json"},
+#  {"name": "winder-3", "transport": "rtu", "host": "/dev/ttyUSB0", "unit_id": 3,
+#   "baudrate": 19200, "parity": "E"}, ...]
+# RTU devices use "host" for the serial port; units on one port share the bus.
+DEVICES_FILE = os.getenv("MODBUS_DEVICES_FILE", "")
+
+
+@dataclass
+class Device:
+    name: str
+    host: str
+    port: int = 502
+    unit_id: int = 1
+    interval: float = 1.0    # seconds between cycles for this device
+    timeout: float = 1.0     # budget for one whole cycle (connect + all reads)
+    tag_map: str = ""        # register map file; "" = MODBUS_TAG_MAP / built-in map
+    transport: str = "tcp"   # "tcp" or "rtu"
+    baudrate: int = 9600     # rtu only; the first device on a port sets the line
+    parity: str = "N"
+    bytesize: int = 8
+    stopbits: int = 1
+
+
+def load_devices(path: str = DEVICES_FILE, default_interval: float = 1.0) -> List[Device]:
+    if not path:
+        rtu = modbus.MODBUS_TRANSPORT == "rtu"
+        return [Device(name=DEFAULT_DEVICE,
+                       host=modbus.MODBUS_SERIAL_PORT if rtu else modbus.MODBUS_HOST,
+                       port=0 if rtu else modbus.MODBUS_PORT,
+                       unit_id=modbus.DEVICE_ID, interval=default_interval,
+                       timeout=modbus.MODBUS_TIMEOUT, transport=modbus.MODBUS_TRANSPORT,
+                       baudrate=modbus.MODBUS_BAUDRATE, parity=modbus.MODBUS_PARITY)]
+
+    with open(path) as f:
+        entries = json.load(f)
+
+    devices = []
+    seen = set()
+    for entry in entries:
+        dev = Device(**entry)
+        if dev.name in seen:
+            raise ValueError(f"duplicate device name in {path}: {dev.name}")
+        seen.add(dev.name)
+        devices.append(dev)
+    return devices
+
+
+def shard_devices(devices: List[Device], shards: int) -> List[List[Device]]:
+    """
+    Split devices across `shards` poller processes, balancing polls per second.
+    Devices behind the same host:port (a gateway with several unit ids, or an
+    RS-485 line) stay together so one endpoint is never polled from two processes.
+    """
+    groups: Dict[Tuple[str, int], List[Device]] = {}
+    for dev in devices:
+        groups.setdefault((dev.host, dev.port), []).append(dev)
+
+    def load(group: List[Device]) -> float:
+        return sum(1.0 / max(d.interval, 0.001) for d in group)
+
+    out: List[List[Device]] = [[] for _ in range(max(1, shards))]
+    totals = [0.0] * len(out)
+    for group in sorted(groups.values(), key=load, reverse=True):
+        i = totals.index(min(totals))
+        out[i].extend(group)
+        totals[i] += load(group)
+    return [shard for shard in out if shard]
@@ -0,0 +1,215 @@
+# backend/modbus_reader/encoding.py
+"""
+Compact encodings and delta payloads for /status/.
+
+JSON stays the default. A client can ask for something smaller with the Accept
+header (or ?format=, which wins):
+
+  application/json                  the snapshot as before
+  application/msgpack               same document as MessagePack (needs `msgpack`)
+  application/vnd.binaiot.packed    tag values as a float32 array behind a fixed header
+
+Packed layout (little-endian):
+
+  header   "BI" | u8 version | u8 flags | u32 seq | u32 change_seq | f64 ts | f32 age
+           | u32 schema | u16 n
+  INDEX    u16 length + tag names, utf-8, joined by "\\n"  (omitted when ?schema= matches)
+  DELTA    n x u16 positions in the tag index
+  values   n x f32 (NaN = no value)
+  RAW      u16 count + count x i32 raw registers (-1 = not read)
+
+`schema` is a crc32 of the tag names, so a client keeps the index from its first
+response and sends ?schema=<id> afterwards. ts/age are NaN when nothing was polled.
+float32 is exact for 16-bit registers and float32 tags; 32-bit integers above 2**24
+and float64 tags lose precision - use JSON or MessagePack for those.
+"""
+import importlib.util
+import json
+import math
+import struct
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+PACKED = "application/vnd.binaiot.packed"
+
+FORMATS = {"json": JSON, "msgpack": MSGPACK, "packed": PACKED}
+_ACCEPT_ALIASES = {"application/x-msgpack": MSGPACK}
+
+VERSION = 1
+FLAG_INDEX, FLAG_DELTA, FLAG_RAW, FLAG_STALE = 1, 2, 4, 8
+
+_HEADER = struct.Struct("<2sBBIIdfIH")
+_LEN = struct.Struct("<H")
+NAN = float("nan")
+
+
+@lru_cache(maxsize=None)
+def _has_msgpack() -> bool:
+    """msgpack is optional: application/msgpack is only offered when it is installed."""
+    return importlib.util.find_spec("msgpack") is not None
+
+
+@lru_cache(maxsize=None)
+def _msgpack():
+    """Imported on the first msgpack response, not by every worker that loads the views."""
+    import msgpack
+    return msgpack
+
+
+def available() -> List[str]:
+    return [JSON, PACKED] + ([MSGPACK] if _has_msgpack() else [])
+
+
+def negotiate(accept: str = "", fmt: Optional[str] = None) -> Optional[str]:
+    """
+    Media type for a response. `fmt` (?format=) wins over the Accept header; an
+    unknown or unavailable ?format= returns None (406). Accept falls back to JSON.
+    """
+    offered = available()
+    if fmt:
+        wanted = FORMATS.get(fmt)
+        return wanted if wanted in offered else None
+    best, best_q = JSON, 0.0
+    for part in accept.split(","):
+        kind, _, params = part.strip().partition(";")
+        kind = _ACCEPT_ALIASES.get(kind.strip().lower(), kind.strip().lower())
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if kind in offered and q > best_q:
+            best, best_q = kind, q
+    return best
+
+
+@lru_cache(maxsize=64)
+def _index(names: Tuple[str, ...]) -> Tuple[int, bytes, Dict[str, int]]:
+    blob = "\n".join(names).encode("utf-8")
+    return zlib.crc32(blob), blob, {name: i for i, name in enumerate(names)}
+
+
+def schema_id(names) -> int:
+    return _index(tuple(names))[0]
+
+
+@lru_cache(maxsize=64)
+def _array(code: str, n: int) -> struct.Struct:
+    return struct.Struct(f"<{n}{code}")
+
+
+def _float(value) -> float:
+    if value is None or isinstance(value, str):
+        return NAN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def delta(snap: Dict[str, object], events: List[tuple], missed: bool) -> Dict[str, object]:
+    """
+    /status/?since= payload: only the tags that changed after the client's seq,
+    with their current values. `events` come from detector.since(seq, device); a
+    missed seq (or no snapshot yet) gets the full tag set with "full": true.
+    The client continues from the returned "change_seq".
+    """
+    tags = snap.get("tags") or {}
+    out = {k: snap.get(k) for k in ("device", "seq", "ts", "age", "stale", "health") if k in snap}
+    out["change_seq"] = snap.get("change_seq", 0)
+    if missed or not snap.get("seq"):
+        out["full"] = True
+        out["tags"] = dict(tags)
+        return out
+    changed = {e[2] for e in events}
+    out["full"] = False
+    out["tags"] = {name: tags.get(name) for name in tags if name in changed}
+    return out
+
+
+def pack(payload: Dict[str, object], names: List[str], client_schema: Optional[int] = None,
+         raw: bool = False) -> Tuple[bytes, int]:
+    """
+    Status or delta payload -> packed bytes. `names` is the device's full tag order
+    (the index that delta positions refer to). Returns (body, schema id).
+    """
+    schema, blob, positions = _index(tuple(names))
+    tags = payload.get("tags") or {}
+    is_delta = payload.get("full") is False
+    flags = FLAG_DELTA if is_delta else 0
+    if payload.get("stale"):
+        flags |= FLAG_STALE
+    if client_schema != schema:
+        flags |= FLAG_INDEX
+    raw_regs = payload.get("raw") if raw and not is_delta else None
+    if raw_regs is not None:
+        flags |= FLAG_RAW
+
+    if is_delta:
+        sent = [name for name in tags if name in positions]
+    else:
+        sent = list(names)
+    ts, age = payload.get("ts"), payload.get("age")
+    parts = [_HEADER.pack(b"BI", VERSION, flags, payload.get("seq") or 0,
+                          payload.get("change_seq") or 0,
+                          NAN if ts is None else ts, NAN if age is None else age,
+                          schema, len(sent))]
+    if flags & FLAG_INDEX:
+        parts.append(_LEN.pack(len(blob)))
+        parts.append(blob)
+    if is_delta:
+        parts.append(_array("H", len(sent)).pack(*(positions[name] for name in sent)))
+    parts.append(_array("f", len(sent)).pack(*(_float(tags.get(name)) for name in sent)))
+    if raw_regs is not None:
+        parts.append(_LEN.pack(len(raw_regs)))
+        parts.append(_array("i", len(raw_regs)).pack(*(-1 if r is None else r for r in raw_regs)))
+    return b"".join(parts), schema
+
+
+def unpack(body: bytes, index: Optional[List[str]] = None) -> Dict[str, object]:
+    """Inverse of pack() (for clients and the benchmark). Pass the cached index if it was omitted."""
+    magic, version, flags, seq, change_seq, ts, age, schema, n = _HEADER.unpack_from(body)
+    if magic != b"BI" or version != VERSION:
+        raise ValueError("not a packed status payload")
+    off = _HEADER.size
+    if flags & FLAG_INDEX:
+        (length,) = _LEN.unpack_from(body, off)
+        off += _LEN.size
+        index = body[off:off + length].decode("utf-8").split("\n") if length else []
+        off += length
+    if index is None:
+        raise ValueError("payload has no tag index; pass the cached one")
+    if flags & FLAG_DELTA:
+        names = [index[i] for i in _array("H", n).unpack_from(body, off)]
+        off += 2 * n
+    else:
+        names = index[:n]
+    values = _array("f", n).unpack_from(body, off)
+    off += 4 * n
+    out = {"seq": seq, "change_seq": change_seq,
+           "ts": None if math.isnan(ts) else ts, "age": None if math.isnan(age) else age,
+           "stale": bool(flags & FLAG_STALE), "full": not flags & FLAG_DELTA,
+           "schema": schema, "index": index,
+           "tags": {k: None if math.isnan(v) else v for k, v in zip(names, values)}}
+    if flags & FLAG_RAW:
+        (count,) = _LEN.unpack_from(body, off)
+        off += _LEN.size
+        out["raw"] = [None if r < 0 else r for r in _array("i", count).unpack_from(body, off)]
+    return out
+
+
+def encode(payload: Dict[str, object], content_type: str, names: List[str],
+           client_schema: Optional[int] = None, raw: bool = False) -> Tuple[bytes, Dict[str, str]]:
+    """Payload -> (body, extra response headers) for a negotiated content type."""
+    if content_type == PACKED:
+        body, schema = pack(payload, names, client_schema, raw)
+        return body, {"X-Tag-Schema": str(schema)}
+    if content_type == MSGPACK:
+        return _msgpack().packb(payload), {}
+    return json.dumps(payload).encode("utf-8"), {}   # what JsonResponse sends
@@ -0,0 +1,125 @@
+# backend/modbus_reader/export.py
+"""
+Streaming bulk export of tag history (/history/export/).
+
+Rows come from HistoryStore.export_rows() one chunk at a time and each chunk is
+encoded and sent before the next is read, so memory is bounded by EXPORT_CHUNK
+whatever the range:
+
+  csv      header line first (sent at once), then device,tag,ts,time,value rows;
+           ts is epoch seconds, time the same instant in ISO 8601 UTC
+  parquet  one row group per chunk, footer at the end (needs `pyarrow`);
+           columns device, tag (dictionary-encoded), time (timestamp[us, UTC]), value
+"""
+import csv
+import io
+import os
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Tuple
+
+from asgiref.sync import sync_to_async
+
+# -------- CONFIG --------
+EXPORT_CHUNK = int(os.getenv("MODBUS_EXPORT_CHUNK", "50000"))   # rows per read / CSV write / Parquet row group
+
+Row = Tuple[str, str, float, float]   # (device, tag, ts, value)
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+@lru_cache(maxsize=None)
+def _pyarrow():
+    """pyarrow is optional (Parquet is only offered when installed) and slow to import: load on first use."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        return None
+
+
+def available(fmt: str) -> bool:
+    return fmt == "csv" or (fmt == "parquet" and _pyarrow() is not None)
+
+
+def csv_chunks(chunks: Iterable[List[Row]]) -> Iterator[bytes]:
+    yield b"device,tag,ts,time,value\r\n"
+    utc = timezone.utc
+    for rows in chunks:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerows((d, t, ts, datetime.fromtimestamp(ts, utc).isoformat(timespec="microseconds"), v)
+                         for d, t, ts, v in rows)
+        yield buf.getvalue().encode()
+
+
+class _Sink:
+    """Write-only file that hands over what the Parquet writer produced so far."""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        out, self.parts = b"".join(self.parts), []
+        return out
+
+
+def parquet_chunks(chunks: Iterable[List[Row]]) -> Iterator[bytes]:
+    pa = _pyarrow()
+    schema = pa.schema([("device", pa.dictionary(pa.int32(), pa.string())),
+                        ("tag", pa.dictionary(pa.int32(), pa.string())),
+                        ("time", pa.timestamp("us", tz="UTC")),
+                        ("value", pa.float64())])
+    sink = _Sink()
+    writer = pa.parquet.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    try:
+        for rows in chunks:
+            device, tag, ts, value = zip(*rows)
+            table = pa.table([pa.array(device).dictionary_encode(), pa.array(tag).dictionary_encode(),
+                              pa.array([round(t * 1e6) for t in ts], pa.timestamp("us", tz="UTC")),
+                              pa.array(value, pa.float64())], schema=schema)
+            writer.write_table(table, row_group_size=len(rows))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()   # footer
+
+
+def encode(fmt: str, chunks: Iterable[List[Row]]) -> Iterator[bytes]:
+    return parquet_chunks(chunks) if fmt == "parquet" else csv_chunks(chunks)
+
+
+async def aiterate(body: Iterator[bytes]):
+    """
+    The same body for ASGI, which would otherwise read a sync iterator to the end
+    before sending anything. Each chunk is produced in a worker thread.
+    """
+    step = sync_to_async(next, thread_sensitive=False)
+    try:
+        while True:
+            chunk = await step(body, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        body.close()
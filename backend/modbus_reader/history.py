@@ -0,0 +1,333 @@
+# backend/modbus_reader/history.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from .spool import Spool
+
+# -------- CONFIG --------
+HISTORY_DB = os.getenv("MODBUS_HISTORY_DB", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "history.sqlite3"))
+FLUSH_INTERVAL = float(os.getenv("MODBUS_HISTORY_FLUSH", "2.0"))    # seconds between batched commits
+RETENTION_DAYS = float(os.getenv("MODBUS_HISTORY_DAYS", "90"))
+RING_SIZE      = int(os.getenv("MODBUS_HISTORY_RING", "3600"))      # recent samples kept in memory per tag
+MAX_POINTS     = 5000
+SPOOL_DIR      = os.getenv("MODBUS_SPOOL_DIR", HISTORY_DB + ".spool")   # "" = write straight to SQLite
+DRAIN_BYTES    = 1024 * 1024                                        # spooled bytes per replay transaction
+MAX_BACKOFF    = 60.0                                               # seconds between retries while SQLite fails
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id     INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    tag    TEXT NOT NULL,
+    UNIQUE (device, tag)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    series INTEGER NOT NULL,
+    ts     REAL NOT NULL,
+    value  REAL NOT NULL,
+    PRIMARY KEY (series, ts)
+) WITHOUT ROWID;
+"""
+
+Sample = Tuple[float, float]   # (ts, value)
+
+
+class HistoryStore:
+    """
+    Append-only tag history.
+    record() only queues samples (the poller never waits on disk). A writer thread
+    appends each batch to the spool (see spool.py) and a drainer thread replays the
+    spool into SQLite; when SQLite is locked, full or failing the batches pile up
+    in the spool and go in bulk once it recovers. The newest RING_SIZE samples per
+    tag stay in memory so recent-range queries don't touch SQLite at all.
+    """
+
+    def __init__(self, path: str = HISTORY_DB, ring_size: int = RING_SIZE, spool_dir: str = SPOOL_DIR):
+        self.path = path
+        self.ring_size = ring_size
+        self.spool = Spool(spool_dir) if spool_dir else None
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, str, float, float]] = []
+        self._rings: Dict[Tuple[str, str], Deque[Sample]] = {}
+        self._series: Dict[Tuple[str, str], int] = {}
+        self._local = threading.local()
+        self._thread: Optional[threading.Thread] = None
+        self._drainer: Optional[threading.Thread] = None
+
+    # ---- connections (one per thread; WAL lets readers run during commits) ----
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _series_id(self, conn: sqlite3.Connection, device: str, tag: str,
+                   create: bool = True, created: Optional[Dict[Tuple[str, str], int]] = None) -> Optional[int]:
+        """
+        Series id for (device, tag). Ids inserted in the caller's transaction go to
+        `created`, not the cache: until that commits the row may still roll back and
+        SQLite would hand the same id to the next new series.
+        """
+        key = (device, tag)
+        sid = self._series.get(key)
+        if sid is None and created is not None:
+            sid = created.get(key)
+        if sid is None:
+            row = conn.execute("SELECT id FROM series WHERE device=? AND tag=?", key).fetchone()
+            if row is None:
+                if not create:
+                    return None
+                sid = conn.execute("INSERT INTO series (device, tag) VALUES (?, ?)", key).lastrowid
+                if created is not None:
+                    created[key] = sid
+                    return sid
+            else:
+                sid = row[0]
+            self._series[key] = sid
+        return sid
+
+    # ---- writing ----
+    def record(self, snap: Dict[str, object]):
+        """
+        Snapshot-store listener: queue the numeric values that changed this cycle
+        (report-by-exception, so a steady line writes almost nothing).
+        """
+        self._add(snap, persist=True)
+
+    def remember(self, snap: Dict[str, object]):
+        """
+        Listener for processes that read history but don't own the database
+        (web workers fed by the poller service): fill the rings only.
+        """
+        self._add(snap, persist=False)
+
+    def _add(self, snap: Dict[str, object], persist: bool):
+        device, ts = snap["device"], snap["ts"]
+        tags = snap["changes"] if "changes" in snap else (snap.get("tags") or {})
+        with self._lock:
+            for tag, value in tags.items():
+                if not isinstance(value, (int, float)) or value != value:   # skip None / NaN
+                    continue
+                key = (device, tag)
+                ring = self._rings.get(key)
+                if ring is None:
+                    ring = self._rings[key] = deque(maxlen=self.ring_size)
+                ring.append((ts, float(value)))
+                if persist:
+                    self._pending.append((device, tag, ts, float(value)))
+
+    def _insert(self, batch: List[Tuple[str, str, float, float]]) -> int:
+        conn = self._conn()
+        created: Dict[Tuple[str, str], int] = {}
+        with conn:
+            rows = [(self._series_id(conn, d, t, created=created), ts, v) for d, t, ts, v in batch]
+            conn.executemany("INSERT OR REPLACE INTO samples (series, ts, value) VALUES (?, ?, ?)", rows)
+        self._series.update(created)   # committed: safe to cache
+        return len(rows)
+
+    def _take(self) -> List[Tuple[str, str, float, float]]:
+        with self._lock:
+            batch, self._pending = self._pending, []
+        return batch
+
+    def spool_pending(self) -> int:
+        """Move everything queued so far into the spool (one record per batch)."""
+        batch = self._take()
+        if batch:
+            self.spool.append(json.dumps(batch, separators=(",", ":")).encode())
+        return len(batch)
+
+    def drain(self) -> int:
+        """
+        Replay the spool into SQLite, DRAIN_BYTES per transaction. Raises while the
+        database fails; whatever wasn't committed stays spooled. Samples are keyed
+        by (series, ts), so records replayed twice after a crash just overwrite.
+        """
+        total = 0
+        while True:
+            records, pos = self.spool.read(DRAIN_BYTES)
+            if not records:
+                return total
+            total += self._insert([tuple(row) for r in records for row in json.loads(r)])
+            self.spool.ack(pos)
+
+    def flush(self) -> int:
+        """Commit everything queued so far (through the spool if there is one)."""
+        if self.spool is None:
+            batch = self._take()
+            return self._insert(batch) if batch else 0
+        self.spool_pending()
+        self.spool.sync()
+        try:
+            return self.drain()
+        except Exception as e:
+            print(f"[History] flush failed, {self.spool.backlog()} bytes left in the spool:", repr(e))
+            return 0
+
+    def prune(self, older_than: float):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM samples WHERE ts < ?", (older_than,))
+
+    def _maybe_prune(self, last_prune: float) -> float:
+        if time.time() - last_prune > 3600:
+            self.prune(time.time() - RETENTION_DAYS * 86400)
+            return time.time()
+        return last_prune
+
+    def _writer_loop(self):
+        last_prune = 0.0
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                if self.spool is not None:
+                    self.spool_pending()   # disk append only; SQLite is the drainer's problem
+                    continue
+                self.flush()
+                last_prune = self._maybe_prune(last_prune)
+            except Exception as e:
+                print("[History] flush failed:", repr(e))
+                traceback.print_exc()
+
+    def _drain_loop(self):
+        last_prune, delay, failing = 0.0, FLUSH_INTERVAL, False
+        while True:
+            time.sleep(delay)
+            try:
+                n = self.drain()
+                if failing:
+                    print(f"[History] database back, replayed {n} spooled samples")
+                failing, delay = False, FLUSH_INTERVAL
+                last_prune = self._maybe_prune(last_prune)
+            except Exception as e:
+                if not failing:
+                    print("[History] database unavailable, spooling:", repr(e))
+                failing, delay = True, min(delay * 2, MAX_BACKOFF)
+
+    def start(self) -> bool:
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+        self._thread.start()
+        if self.spool is not None:
+            self._drainer = threading.Thread(target=self._drain_loop, name="history-drain", daemon=True)
+            self._drainer.start()
+        return True
+
+    # ---- reading ----
+    def query(self, device: str, tag: str, start: float, end: float,
+              points: int = 500) -> Dict[str, object]:
+        """
+        Downsample [start, end) into at most `points` equal-width buckets.
+        Returns columnar lists: t (bucket start), min, max, avg, n.
+        Samples are change events, so empty buckets mean "unchanged".
+        """
+        points = max(1, min(int(points), MAX_POINTS))
+        width = max((end - start) / points, 1e-6)
+        buckets: Dict[int, List[float]] = {}    # index -> [min, max, sum, n]
+
+        def add(b: int, lo: float, hi: float, total: float, n: int):
+            cur = buckets.get(b)
+            if cur is None:
+                buckets[b] = [lo, hi, total, n]
+            else:
+                cur[0] = min(cur[0], lo)
+                cur[1] = max(cur[1], hi)
+                cur[2] += total
+                cur[3] += n
+
+        # Recent part straight from the ring (also covers samples not flushed yet)
+        with self._lock:
+            ring = list(self._rings.get((device, tag), ()))
+        ring_from = ring[0][0] if ring else end
+        for ts, v in ring:
+            if start <= ts < end:
+                add(int((ts - start) / width), v, v, v, 1)
+
+        # Older part from SQLite, aggregated in the query
+        if start < ring_from:
+            conn = self._conn()
+            sid = self._series_id(conn, device, tag, create=False)
+            if sid is not None:
+                rows = conn.execute(
+                    "SELECT CAST((ts - ?) / ? AS INTEGER) AS b, MIN(value), MAX(value), SUM(value), COUNT(*)"
+                    " FROM samples WHERE series = ? AND ts >= ? AND ts < ? GROUP BY b",
+                    (start, width, sid, start, min(end, ring_from))).fetchall()
+                for b, lo, hi, total, n in rows:
+                    add(b, lo, hi, total, n)
+
+        out = {"t": [], "min": [], "max": [], "avg": [], "n": []}
+        for b in sorted(buckets):
+            lo, hi, total, n = buckets[b]
+            out["t"].append(round(start + b * width, 3))
+            out["min"].append(lo)
+            out["max"].append(hi)
+            out["avg"].append(total / n)
+            out["n"].append(n)
+        return {"device": device, "tag": tag, "start": start, "end": end,
+                "bucket": width, **out}
+
+    # ---- export ----
+    def _export_conn(self) -> sqlite3.Connection:
+        # own connection: an export generator may be resumed on different threads (ASGI)
+        return sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+
+    def series(self, devices: List[str], tags: Optional[List[str]] = None) -> List[Tuple[int, str, str]]:
+        """(id, device, tag) of the stored series matching the filters, ordered by device, tag."""
+        sql = "SELECT id, device, tag FROM series WHERE device IN (%s)" % ",".join("?" * len(devices))
+        params = list(devices)
+        if tags:
+            sql += " AND tag IN (%s)" % ",".join("?" * len(tags))
+            params += tags
+        conn = self._export_conn()
+        try:
+            return conn.execute(sql + " ORDER BY device, tag", params).fetchall()
+        except sqlite3.OperationalError:   # no database yet
+            return []
+        finally:
+            conn.close()
+
+    def export_rows(self, series: List[Tuple[int, str, str]], start: float, end: float,
+                    chunk: int = 50000) -> Iterator[List[Tuple[str, str, float, float]]]:
+        """
+        Raw samples of `series` in [start, end) as lists of up to `chunk`
+        (device, tag, ts, value) rows, one series after the other in time order.
+        Pages through the (series, ts) key, so memory stays at one chunk and no
+        read transaction is held between pages. Samples still queued or spooled
+        are not in SQLite yet and not exported.
+        """
+        conn = self._export_conn()
+        try:
+            buf: List[Tuple[str, str, float, float]] = []
+            for sid, device, tag in series:
+                after, op = start, ">="
+                while True:
+                    limit = chunk - len(buf)
+                    rows = conn.execute(
+                        f"SELECT ts, value FROM samples WHERE series = ? AND ts {op} ? AND ts < ?"
+                        " ORDER BY ts LIMIT ?", (sid, after, end, limit)).fetchall()
+                    buf.extend((device, tag, ts, v) for ts, v in rows)
+                    if len(buf) >= chunk:
+                        yield buf
+                        buf = []
+                    if len(rows) < limit:
+                        break
+                    after, op = rows[-1][0], ">"
+            if buf:
+                yield buf
+        finally:
+            conn.close()
+
+
+history = HistoryStore()
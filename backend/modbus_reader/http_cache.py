@@ -0,0 +1,70 @@
+# backend/modbus_reader/http_cache.py
+"""
+Pre-rendered response bodies and ETag validators for the polled read endpoints.
+
+A body is rendered once per data version (snapshot seq, settings table state) and
+kept per process; clients that send the version's ETag back in If-None-Match get
+a 304 with no body. Entries are replaced when the version moves on and dropped
+explicitly by clear() (model saves).
+"""
+import threading
+import zlib
+from typing import Dict, Hashable, Optional, Tuple
+
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+
+# -------- CONFIG --------
+MAX_ENTRIES = 256   # distinct (endpoint, query) keys kept per process
+
+
+def etag(*parts: object) -> str:
+    """Weak ETag for a data version (weak: age/health metadata may differ between 200s)."""
+    key = "\x1f".join(str(p) for p in parts)
+    return 'W/"%08x"' % zlib.crc32(key.encode("utf-8"))
+
+
+def not_modified(request, tag: str) -> Optional[HttpResponseNotModified]:
+    """304 response if the request's If-None-Match already has `tag` (weak comparison)."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return None
+    strip = lambda t: t[2:] if t.startswith("W/") else t
+    wanted = strip(tag)
+    if not any(t == "*" or strip(t) == wanted for t in parse_etags(header)):
+        return None
+    response = HttpResponseNotModified()
+    response["ETag"] = tag
+    return response
+
+
+class ResponseCache:
+    """key -> (version, rendered body). Thread-safe; the oldest key goes when full."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, Tuple[object, bytes]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: object) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, version: object, body: bytes) -> bytes:
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (version, body)
+        return body
+
+    def clear(self, *args, **kwargs):
+        """Drop everything (usable directly as a signal receiver)."""
+        with self._lock:
+            self._entries = {}
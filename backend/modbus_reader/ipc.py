@@ -0,0 +1,197 @@
+# backend/modbus_reader/ipc.py
+"""
+Snapshot feed between the poller service (run_poller) and the web workers.
+The service listens on a Unix socket; every worker keeps one connection open and
+receives each published snapshot as a length-prefixed JSON frame, plus
+{"op": "alarms", ...} frames with the alarm events the service evaluated. A new
+connection first gets the latest snapshot of every device and the latest alarm
+frame. The other direction carries the few things a worker learns that the
+service's aggregators need (the same framing): {"op": "reset", "device",
+"address"} after a counter reset.
+"""
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import traceback
+from typing import Dict, Optional, Set
+
+from .snapshot import store
+
+# -------- CONFIG --------
+POLLER_SOCKET   = os.getenv("MODBUS_POLLER_SOCKET", "/tmp/binaiot-poller.sock")
+RECONNECT_DELAY = 1.0               # seconds between attempts to reach the service
+MAX_BACKLOG     = 4 * 1024 * 1024   # bytes queued for one slow worker before it is dropped
+
+_HEADER = struct.Struct(">I")
+
+
+def encode(snap: Dict[str, object]) -> bytes:
+    body = json.dumps(snap, separators=(",", ":")).encode()
+    return _HEADER.pack(len(body)) + body
+
+
+def _recv_exact(sock: socket.socket, n: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+class SnapshotHub:
+    """
+    Service side. notify() is a snapshot-store listener (any thread); frames are
+    encoded once and written to every connected worker from the hub's loop.
+    """
+
+    def __init__(self, path: str = POLLER_SOCKET):
+        self.path = path
+        self._latest: Dict[object, bytes] = {}    # device, or ("op", op) for messages
+        self._latest_lock = threading.Lock()     # notify() runs on publisher threads, _handle on the loop
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def notify(self, snap: Dict[str, object]):
+        self._send(encode(snap), snap["device"])
+
+    def send(self, msg: Dict[str, object]):
+        """Broadcast an {"op": ...} message; the last one per op is replayed to new workers."""
+        self._send(encode(msg), ("op", msg["op"]))
+
+    def _send(self, frame: bytes, key):
+        with self._latest_lock:
+            self._latest[key] = frame
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._broadcast, frame)
+
+    def _broadcast(self, frame: bytes):
+        for writer in list(self._writers):
+            if writer.transport.get_write_buffer_size() > MAX_BACKLOG:
+                print("[IPC] dropping a worker that stopped reading")
+                self._writers.discard(writer)
+                writer.close()
+                continue
+            writer.write(frame)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        with self._latest_lock:
+            frames = list(self._latest.values())
+        for frame in frames:
+            writer.write(frame)
+        self._writers.add(writer)
+        try:
+            while True:
+                header = await reader.readexactly(_HEADER.size)
+                self._message(json.loads(await reader.readexactly(_HEADER.unpack(header)[0])))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass                         # EOF: the worker left
+        except ValueError as e:
+            print("[IPC] bad message from a worker:", repr(e))
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _message(self, msg: Dict[str, object]):
+        if msg.get("op") == "reset":
+            from .production import production
+            production.note_reset(str(msg["device"]), int(msg["address"]))
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        print(f"[IPC] serving snapshots on {self.path}")
+        async with server:
+            await server.serve_forever()
+
+    def count(self) -> int:
+        return len(self._writers)
+
+
+class SnapshotFeed:
+    """Worker side: one thread that mirrors the service's snapshots into the local store."""
+
+    def __init__(self, path: str = POLLER_SOCKET):
+        self.path = path
+        self.connected = False
+        self._thread: Optional[threading.Thread] = None
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+
+    def _read_loop(self, sock: socket.socket):
+        while True:
+            header = _recv_exact(sock, _HEADER.size)
+            if header is None:
+                return
+            body = _recv_exact(sock, _HEADER.unpack(header)[0])
+            if body is None:
+                return
+            msg = json.loads(body)
+            if "op" in msg:
+                self._message(msg)
+            else:
+                store.ingest(msg)
+
+    def _message(self, msg: Dict[str, object]):
+        if msg["op"] == "alarms":
+            from .alarms import alarms
+            alarms.ingest(msg)
+
+    def _run(self):
+        warned = False
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                self._sock, self.connected, warned = sock, True, False
+                print(f"[IPC] connected to poller service at {self.path}")
+                self._read_loop(sock)
+                print("[IPC] poller service closed the feed")
+            except OSError as e:
+                if not warned:
+                    print(f"[IPC] poller service unavailable at {self.path}:", repr(e))
+                    warned = True
+            except Exception as e:
+                print("[IPC] feed failed:", repr(e))
+                traceback.print_exc()
+            finally:
+                self._sock, self.connected = None, False
+                sock.close()
+            time.sleep(RECONNECT_DELAY)
+
+    def start(self) -> bool:
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(target=self._run, name="snapshot-feed", daemon=True)
+        self._thread.start()
+        return True
+
+    def send(self, msg: Dict[str, object]) -> bool:
+        """
+        Message the service: over the feed connection, or a one-off connection while
+        the feed is reconnecting.
+        """
+        frame = encode(msg)
+        with self._send_lock:
+            sock = self._sock
+            try:
+                if sock is not None:
+                    sock.sendall(frame)
+                    return True
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as one_off:
+                    one_off.connect(self.path)
+                    one_off.sendall(frame)
+                return True
+            except OSError as e:
+                print(f"[IPC] can't reach the poller service at {self.path}:", repr(e))
+                return False
+
+
+feed = SnapshotFeed()
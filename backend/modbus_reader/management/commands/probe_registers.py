@@ -0,0 +1,119 @@
+# backend/modbus_reader/management/commands/probe_registers.py
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from modbus_reader import modbus, probe
+from modbus_reader.decode import TYPES, decode_array
+from modbus_reader.devices import DEVICES_FILE, load_devices
+from modbus_reader.register_map import get_plan
+from modbus_reader.snapshot import DEFAULT_DEVICE
+
+
+def _client(dev, timeout: float):
+    if dev.transport == "rtu":
+        from pymodbus.client import ModbusSerialClient   # needs pyserial
+        return ModbusSerialClient(dev.host, baudrate=dev.baudrate, parity=dev.parity,
+                                  bytesize=dev.bytesize, stopbits=dev.stopbits, timeout=timeout, retries=0)
+    from pymodbus.client import ModbusTcpClient
+    return ModbusTcpClient(dev.host, port=dev.port, timeout=timeout, retries=0)
+
+
+def _reader(client, unit_id: int):
+    def read(address, count):
+        if not client.connected and not client.connect():
+            raise ConnectionError("connect failed")
+        rr = modbus._read_holding(client, address, count, unit_id)
+        if rr.isError():
+            if getattr(rr, "exception_code", None):   # the device answered: address rejected
+                return None
+            client.close()
+            raise IOError(str(rr))
+        return rr.registers
+    return read
+
+
+class Command(BaseCommand):
+    help = ("Scan a device's holding registers, detect readable ranges and the float32 "
+            "word order, and write a register map for MODBUS_TAG_MAP / a device's tag_map.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--device", default=DEFAULT_DEVICE, help="name in the devices file")
+        parser.add_argument("--devices-file", default=DEVICES_FILE)
+        parser.add_argument("--host", help="override the device's host (serial port for rtu)")
+        parser.add_argument("--port", type=int)
+        parser.add_argument("--unit", type=int, help="override the device's unit id")
+        parser.add_argument("--start", type=int, default=0)
+        parser.add_argument("--end", type=int, default=65536, help="one past the last register to scan")
+        parser.add_argument("--max-skip", type=int, default=probe.MAX_SKIP,
+                            help="largest step over unreadable registers")
+        parser.add_argument("--samples", type=int, default=3, help="extra reads of the readable ranges")
+        parser.add_argument("--sample-interval", type=float, default=1.0)
+        parser.add_argument("--timeout", type=float, default=0.5, help="seconds per request")
+        parser.add_argument("--order", choices=sorted(probe.ORDER_NAMES.values()),
+                            help="skip detection and use this float32 word/byte order")
+        parser.add_argument("--output", default="", help="map file to write (default register_map.<device>.json)")
+        parser.add_argument("--dry-run", action="store_true", help="print the map instead of writing it")
+
+    def handle(self, *args, **opts):
+        devices = {d.name: d for d in load_devices(opts["devices_file"])}
+        dev = devices.get(opts["device"])
+        if dev is None:
+            raise CommandError(f"unknown device {opts['device']!r} (have: {', '.join(devices)})")
+        for key, field in (("host", "host"), ("port", "port"), ("unit", "unit_id")):
+            if opts[key] is not None:
+                setattr(dev, field, opts[key])
+
+        client = _client(dev, opts["timeout"])
+        scanner = probe.RegisterScanner(_reader(client, dev.unit_id), max_skip=opts["max_skip"])
+        where = f"{dev.host}:{dev.port} unit {dev.unit_id}" if dev.transport == "tcp" else f"{dev.host} unit {dev.unit_id}"
+        self.stdout.write(f"Scanning {where}, registers {opts['start']}..{opts['end'] - 1}")
+        started = time.monotonic()
+        try:
+            spans = scanner.scan(opts["start"], opts["end"])
+            if not spans:
+                raise CommandError(f"no readable registers after {scanner.requests} requests")
+            self.stdout.write(f"  {scanner.requests} requests in {time.monotonic() - started:.1f}s, readable: "
+                              + ", ".join(f"{s}..{e - 1}" for s, e in spans))
+            samples = {a: [v] for a, v in scanner.regs.items()}
+            for _ in range(opts["samples"]):
+                time.sleep(opts["sample_interval"])
+                scanner.sample(spans, samples)
+        finally:
+            client.close()
+
+        runs = probe.islands(samples)
+        scores = probe.detect_order(samples, runs)
+        names = {v: k for k, v in probe.ORDER_NAMES.items()}
+        order = names[opts["order"]] if opts["order"] else max(probe.ORDERS, key=lambda o: scores[o])
+        self.stdout.write("  float32 order scores: " + ", ".join(
+            f"{probe.ORDER_NAMES[o]} {scores[o]:.1f}" for o in probe.ORDERS)
+            + f" -> {probe.ORDER_NAMES[order]}")
+        ranked = sorted(scores.values(), reverse=True)
+        if not opts["order"] and ranked[0] - ranked[1] <= 0.1 * abs(ranked[0]):
+            self.stdout.write(self.style.WARNING(
+                "  the word order is a close call: check the values below, or pass --order"))
+
+        plan = get_plan(dev.tag_map or None)
+        spec, notes = probe.build_map(samples, plan.tags, order, plan.max_gap)
+        spec["probe"] = probe.probe_info(scanner, spans, scores, device=dev.name, host=dev.host,
+                                         unit_id=dev.unit_id, samples=opts["samples"] + 1)
+        for note in notes:
+            self.stdout.write(f"  note: {note}")
+        for tag in spec["tags"]:
+            regs = [samples.get(a, [0])[-1] for a in range(tag["address"], tag["address"] + TYPES[tag["type"]][0])]
+            value = decode_array(regs, tag["type"], tag.get("word_order", order[0]),
+                                 tag.get("byte_order", order[1]))[0]
+            self.stdout.write(f"  {tag['name']:<12} {tag['address']:>5}  {tag['type']:<8} {value!r:<24} {regs}")
+
+        text = json.dumps(spec, indent=2)
+        if opts["dry_run"]:
+            self.stdout.write(text)
+            return
+        path = opts["output"] or f"register_map.{dev.name}.json"
+        with open(path, "w") as f:
+            f.write(text + "\n")
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(spec['tags'])} tags to {path}; poll with MODBUS_TAG_MAP={path} "
+            f"(or \"tag_map\" in the devices file) - no fallback probing at runtime"))
@@ -0,0 +1,33 @@
+# backend/modbus_reader/management/commands/run_poller.py
+from django.core.management.base import BaseCommand
+
+from modbus_reader.aio_poller import MAX_CONCURRENCY
+from modbus_reader.devices import DEVICES_FILE, load_devices
+from modbus_reader.ipc import POLLER_SOCKET
+from modbus_reader.poller import POLL_INTERVAL
+from modbus_reader.service import SHARDS, PollerService
+
+
+class Command(BaseCommand):
+    help = ("Run the Modbus poller as its own service: devices are sharded across processes "
+            "and web workers started with MODBUS_POLLER_MODE=service read snapshots from it.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shards", type=int, default=SHARDS,
+                            help="poller processes (0 = one per CPU core)")
+        parser.add_argument("--socket", default=POLLER_SOCKET, help="Unix socket the web workers read")
+        parser.add_argument("--devices-file", default=DEVICES_FILE)
+        parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY,
+                            help="devices polled at once per shard")
+        parser.add_argument("--metrics-port", type=int, default=None,
+                            help="Prometheus port for the service; shard i uses port + 1 + i")
+
+    def handle(self, *args, **opts):
+        devices = load_devices(opts["devices_file"], default_interval=POLL_INTERVAL)
+        service = PollerService(devices, shards=opts["shards"],
+                                max_concurrency=opts["max_concurrency"],
+                                socket_path=opts["socket"], metrics_port=opts["metrics_port"])
+        try:
+            service.run()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,188 @@
+# backend/modbus_reader/metrics.py
+"""
+In-process counters/histograms for the poller, rendered in Prometheus text format.
+Each metric keeps a dict of label-tuple -> value under its own lock, so an update
+is a dict lookup and an add.
+"""
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from .breaker import STATE_CODES, board
+from .history import history
+from .snapshot import store
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _labels(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ""
+    body = ",".join('{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                    for n, v in zip(names, values))
+    return "{" + body + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help_, tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set_total(self, *labels, value: float):
+        """For collect hooks mirroring a count kept elsewhere (which only ever grows)."""
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, list] = {}   # labels -> [bucket counts..., +Inf, sum]
+
+    def observe(self, value: float, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        out = []
+        names = self.labelnames + ("le",)
+        for key, row in items:
+            total = 0
+            for le, n in zip(self.buckets + ("+Inf",), row[:-1]):
+                total += n
+                out.append(f"{self.name}_bucket{_labels(names, key + (le,))} {total}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {row[-1]}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {total}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[object] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def on_collect(self, callback: Callable[[], None]):
+        """Run `callback` before every render (for gauges computed at scrape time)."""
+        self._collectors.append(callback)
+
+    def render(self) -> str:
+        for callback in self._collectors:
+            callback()
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_seconds = registry.add(Histogram(
+    "modbus_request_seconds", "Round trip of one read request", ("device", "block")))
+requests_total = registry.add(Counter(
+    "modbus_requests_total", "Read requests by result (ok, error, exception)", ("device", "result")))
+fallback_total = registry.add(Counter(
+    "modbus_fallback_total", "Reads that had to retry at a fallback address", ("device", "block")))
+cycle_seconds = registry.add(Histogram(
+    "modbus_poll_cycle_seconds", "Duration of one scan of a device's scan group", ("device", "group")))
+cycle_timeouts_total = registry.add(Counter(
+    "modbus_cycle_timeouts_total", "Scans that exceeded the device timeout", ("device",)))
+overruns_total = registry.add(Counter(
+    "modbus_scan_overruns_total", "Scan slots skipped because the previous scan was still running",
+    ("device", "group")))
+connect_failures_total = registry.add(Counter(
+    "modbus_connect_failures_total", "Failed connection attempts", ("device",)))
+breaker_state = registry.add(Gauge(
+    "modbus_breaker_state", "Circuit breaker per device (0 closed, 1 half-open, 2 open)", ("device",)))
+breaker_opens_total = registry.add(Counter(
+    "modbus_breaker_opens_total", "Times the device's circuit opened since start", ("device",)))
+snapshot_age = registry.add(Gauge(
+    "modbus_snapshot_age_seconds", "Age of the newest snapshot at scrape time", ("device",)))
+spool_backlog = registry.add(Gauge(
+    "modbus_spool_backlog_bytes", "History spooled on disk but not yet in the database"))
+spool_evicted = registry.add(Gauge(
+    "modbus_spool_evicted_bytes", "Undrained spool bytes dropped at the size limit since start"))
+
+
+def _collect_snapshot_age():
+    now = time.time()
+    for device in store.devices():
+        snap = store.get(device)
+        if snap is not None:
+            snapshot_age.set(device, value=round(now - snap["ts"], 3))
+
+
+def _collect_breakers():
+    for device, breaker in board.devices().items():
+        breaker_state.set(device, value=STATE_CODES[breaker.state])
+        breaker_opens_total.set_total(device, value=breaker.opens_total)
+
+
+def _collect_spool():
+    if history.spool is not None:
+        spool_backlog.set(value=history.spool.backlog())
+        spool_evicted.set(value=history.spool.evicted_bytes)
+
+
+registry.on_collect(_collect_snapshot_age)
+registry.on_collect(_collect_breakers)
+registry.on_collect(_collect_spool)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve this process's registry on its own port (for processes without Django)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
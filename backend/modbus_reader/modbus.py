@@ -1,39 +1,45 @@
 # /home/davin/Desktop/BinaIOT/backend/modbus_reader/modbus.py
-from pymodbus.client import ModbusTcpClient
+import os
+import time
 import traceback
 import struct
-from typing import List, Optional, Dict
+from typing import TYPE_CHECKING, List, Optional, Dict
 
-# -------- CONFIG --------
-MODBUS_HOST = "192.168.1.20"
-MODBUS_PORT = 502
-DEVICE_ID   = 1
+from . import metrics
+from .connections import connections, ConnectionUnavailable, TransportUnsupported
+from .decode import decode_array
+from .register_map import WORD_ORDER, BYTE_ORDER, ReadBlock, ReadPlan, get_plan
+from .snapshot import DEFAULT_DEVICE
 
-# Block 1: 125..128 (4 regs -> 2 floats)
-REG1_START, REG1_COUNT = 125, 4
+if TYPE_CHECKING:
+    from pymodbus.client import ModbusTcpClient
 
-# Block 2: 428..438 (10 regs -> 5 floats). If empty/zeros, also try 427..
-REG2_START_PRIMARY  = 428
-REG2_START_FALLBACK = 427
-REG2_COUNT          = 10
+# -------- CONFIG --------
+# Same env names as the reset endpoints so both share one pooled connection
+MODBUS_HOST    = os.getenv("MODBUS_HOST", "192.168.1.20")
+MODBUS_PORT    = int(os.getenv("MODBUS_PORT", "502"))
+DEVICE_ID      = int(os.getenv("MODBUS_SLAVE_ID", "1"))
+MODBUS_TIMEOUT = 1.0
+# RS-485: MODBUS_TRANSPORT=rtu polls the default device on MODBUS_SERIAL_PORT instead of MODBUS_HOST
+MODBUS_TRANSPORT   = os.getenv("MODBUS_TRANSPORT", "tcp")
+MODBUS_SERIAL_PORT = os.getenv("MODBUS_SERIAL_PORT", "/dev/ttyUSB0")
+MODBUS_BAUDRATE    = int(os.getenv("MODBUS_BAUDRATE", "9600"))
+MODBUS_PARITY      = os.getenv("MODBUS_PARITY", "N")
 
-# Decode options (adjust if numbers look swapped)
-WORD_ORDER = "big"    # "big"  => high word first  (AB CD)
-                      # "little" => low word first (CD AB)
-BYTE_ORDER = "big"    # "big"  => each 16-bit word is big-endian (A,B)
-                      # "little" => each 16-bit word is little-endian (B,A)
+# Register layout and decode options live in register_map.py (MODBUS_TAG_MAP)
 
 # Keeps your original keys + combined arrays
 last_values: Dict[str, object] = {
     "float1": 0.0,
     "float2": 0.0,
-    "values": [],   # all floats in read order
-    "raw": []       # all raw registers in read order
+    "values": [],   # all tag values in map order
+    "raw": [],      # all raw registers in map order
+    "tags": {},     # tag name -> value
 }
 
 
 # -------- HELPERS --------
-def _read_holding(client: ModbusTcpClient, address: int, count: int, unit_id: int):
+def _read_holding(client: "ModbusTcpClient", address: int, count: int, unit_id: int):
     """
     Cross-version wrapper for pymodbus read_holding_registers.
     Prefers device_id= (pymodbus >= 3.10, incl. 3.11.1), then falls back.
@@ -70,24 +76,10 @@ def _decode_float32_from_pair(reg_hi: int, reg_lo: int,
                               byte_order: str = BYTE_ORDER) -> Optional[float]:
     """
     Turn two 16-bit registers into one IEEE754 float32.
-    Handles both word and byte orderings.
+    Handles both word and byte orderings (see decode.py).
     """
     try:
-        # Arrange the two 16-bit words according to word order
-        if word_order.lower() == "big":
-            words = (reg_hi, reg_lo)    # AB CD
-        else:
-            words = (reg_lo, reg_hi)    # CD AB
-
-        # Turn words into bytes according to byte order
-        def word_to_bytes(w: int) -> bytes:
-            high = (w >> 8) & 0xFF
-            low  = w & 0xFF
-            return bytes([high, low]) if byte_order.lower() == "big" else bytes([low, high])
-
-        b = word_to_bytes(words[0]) + word_to_bytes(words[1])
-        # Interpret the arranged bytes as a big-endian float (we already arranged the bytes)
-        return struct.unpack(">f", b)[0]
+        return decode_array((reg_hi, reg_lo), "float32", word_order, byte_order)[0]
     except Exception:
         return None
 
@@ -96,105 +88,170 @@ def _regs_to_float_list(regs: List[int],
                         word_order: str = WORD_ORDER,
                         byte_order: str = BYTE_ORDER) -> List[float]:
     """Decode a flat register list into float32s (2 regs per float)."""
+    try:
+        return list(decode_array(regs, "float32", word_order, byte_order))
+    except struct.error:
+        pass
+    # a word out of 0..65535 somewhere: decode pairwise and stop at the first bad one
     out: List[float] = []
-    for i in range(0, len(regs), 2):
-        pair = regs[i:i+2]
-        if len(pair) < 2:
-            break
-        f = _decode_float32_from_pair(pair[0], pair[1], word_order, byte_order)
+    for i in range(0, len(regs) - 1, 2):
+        f = _decode_float32_from_pair(regs[i], regs[i + 1], word_order, byte_order)
         if f is None:
-            # stop at first decode failure to avoid partial garbage
             break
         out.append(f)
     return out
 
 
-# -------- PUBLIC API --------
-def read_modbus() -> Optional[Dict[str, object]]:
-    client = ModbusTcpClient(MODBUS_HOST, port=MODBUS_PORT, timeout=1.0)
-    try:
-        if not client.connect():
-            print("[Modbus] connect() returned False")
-            return None
+# -------- READ CYCLE --------
+# The cycle is written once as a generator: it yields (address, count) requests and is
+# sent back each response. _drive_sync / _drive_async run it over a sync or async client.
+def _response_ok(rr) -> bool:
+    return (rr is not None
+            and not (hasattr(rr, "isError") and rr.isError())
+            and bool(getattr(rr, "registers", None)))
+
 
-        combined_regs: List[int] = []
-        combined_floats: List[float] = []
+def _read_cycle(blocks: List[ReadBlock], device: str = DEFAULT_DEVICE):
+    """Read `blocks`; returns ({tag: registers}, {tag: value}) or None if every block failed."""
+    regs_by_tag: Dict[str, List[int]] = {}
+    value_by_tag: Dict[str, object] = {}
+    ok_blocks = 0
 
-        # ===== Block 1: 125..128 =====
+    def _take(block, regs):
+        for tag, value in zip(block.tags, block.decoder.decode(regs)):
+            regs_by_tag[tag.name] = regs[tag.address - block.start:tag.end - block.start]
+            value_by_tag[tag.name] = value
+
+    def _read(block):
+        started = time.perf_counter()
         try:
-            rr1 = _read_holding(client, REG1_START, REG1_COUNT, DEVICE_ID)
+            rr = yield block.start, block.count
         except Exception as e:
-            print("[Modbus] read_holding_registers() raised (block1):", repr(e))
-            traceback.print_exc()
+            metrics.requests_total.inc(device, "exception")
+            print(f"[Modbus] read_holding_registers() raised (block @ {block.start}):", repr(e))
+            raise   # let the caller drop this socket
+        metrics.request_seconds.observe(time.perf_counter() - started, device, block.start)
+        if not _response_ok(rr):
+            metrics.requests_total.inc(device, "error")
+            print(f"[Modbus] block {block.start}..{block.end - 1} failed: {rr}")
             return None
+        metrics.requests_total.inc(device, "ok")
+        return rr.registers
 
-        if rr1 is None:
-            print("[Modbus] read returned None (block1)")
-            return None
-        if hasattr(rr1, "isError") and rr1.isError():
-            code = getattr(rr1, "exception_code", None)
-            print(f"[Modbus] device error (block1): {rr1} (code={code})")
-            return None
-        if not getattr(rr1, "registers", None):
-            print("[Modbus] no registers in response (block1)")
-            return None
+    for block in blocks:
+        regs = yield from _read(block)
+        if regs is not None:
+            ok_blocks += 1
+            _take(block, regs)
 
-        regs1 = rr1.registers  # len 4
-        combined_regs.extend(regs1)
+        if not block.fallback:
+            continue
+        # Fallback-capable tags that failed or read back all zeros: try their alternative address
+        probe = [regs_by_tag.get(t.name) for t in block.tags if t.fallback_address is not None]
+        if regs is not None and any(v for r in probe for v in r):
+            continue
+        for fb in block.fallback:
+            metrics.fallback_total.inc(device, block.start)
+            fb_regs = yield from _read(fb)
+            if fb_regs is None:
+                print(f"[Modbus] block {block.start} failed and fallback {fb.start} too")
+                continue
+            ok_blocks += 1
+            _take(fb, fb_regs)
+
+    if ok_blocks == 0:
+        return None
+    return regs_by_tag, value_by_tag
 
-        floats1 = _regs_to_float_list(regs1)
-        if len(floats1) < 2:
-            print("[Modbus] decode produced fewer than 2 floats for block1")
-            return None
 
-        f1, f2 = floats1[0], floats1[1]
-        combined_floats += [f1, f2]
+def assemble(plan: ReadPlan, regs_by_tag: Dict[str, List[int]],
+             value_by_tag: Dict[str, object]) -> Dict[str, object]:
+    """Build the /status/ shape (map order) from per-tag registers and values."""
+    tag_values: Dict[str, object] = {}
+    values: List[object] = []
+    raw: List[Optional[int]] = []
+    for tag in plan.tags:
+        regs = regs_by_tag.get(tag.name)
+        value = value_by_tag.get(tag.name)
+        tag_values[tag.name] = value
+        values.append(value)
+        raw.extend(regs if regs else [None] * tag.count)
 
-        # ===== Block 2: 428..438 (fallback 427) =====
-        def _read_block2(start_addr: int):
+    return {
+        "float1": tag_values.get("float1"),
+        "float2": tag_values.get("float2"),
+        "values": values,
+        "raw": raw,
+        "tags": tag_values,
+    }
+
+
+def _drive_sync(client, unit_id: int, blocks: List[ReadBlock], device: str = DEFAULT_DEVICE):
+    cycle = _read_cycle(blocks, device)
+    try:
+        request = next(cycle)
+        while True:
+            try:
+                rr = _read_holding(client, request[0], request[1], unit_id)
+            except Exception as e:
+                request = cycle.throw(e)
+            else:
+                request = cycle.send(rr)
+    except StopIteration as done:
+        return done.value
+
+
+async def _drive_async(client, unit_id: int, blocks: List[ReadBlock],
+                       device: str = DEFAULT_DEVICE):
+    cycle = _read_cycle(blocks, device)
+    try:
+        request = next(cycle)
+        while True:
             try:
-                return _read_holding(client, start_addr, REG2_COUNT, DEVICE_ID)
-            except Exception as ex:
-                print(f"[Modbus] read_holding_registers() raised (block2 @ {start_addr}):", repr(ex))
-                traceback.print_exc()
-                return None
-
-        rr2 = _read_block2(REG2_START_PRIMARY)
-        use_fallback = False
-
-        if (rr2 is None or (hasattr(rr2, "isError") and rr2.isError())
-            or not getattr(rr2, "registers", None)
-            or all(v == 0 for v in rr2.registers)):
-            use_fallback = True
-            rr2 = _read_block2(REG2_START_FALLBACK)
-
-        if rr2 and not (hasattr(rr2, "isError") and rr2.isError()) and getattr(rr2, "registers", None):
-            regs2 = rr2.registers  # len 10
-            combined_regs.extend(regs2)
-            combined_floats += _regs_to_float_list(regs2)
-        else:
-            if use_fallback:
-                print(f"[Modbus] block2 failed at {REG2_START_PRIMARY} and fallback {REG2_START_FALLBACK}")
+                # _read_holding only picks the keyword spelling; the async client returns a coroutine
+                rr = await _read_holding(client, request[0], request[1], unit_id)
+            except Exception as e:
+                request = cycle.throw(e)
             else:
-                print(f"[Modbus] block2 failed at {REG2_START_PRIMARY}")
+                request = cycle.send(rr)
+    except StopIteration as done:
+        return done.value
+
+
+async def read_blocks_async(client, unit_id: int, blocks: List[ReadBlock],
+                            device: str = DEFAULT_DEVICE):
+    """Read some blocks over a connected AsyncModbusTcpClient; see _read_cycle for the result."""
+    return await _drive_async(client, unit_id, blocks, device)
 
-        # Update shared snapshot
-        last_values["float1"] = f1
-        last_values["float2"] = f2
-        last_values["values"] = combined_floats
-        last_values["raw"]    = combined_regs
 
-        return last_values
+async def read_device_async(client, unit_id: int,
+                            plan: Optional[ReadPlan] = None) -> Optional[Dict[str, object]]:
+    """One full read cycle over a connected AsyncModbusTcpClient."""
+    plan = plan or get_plan()
+    parts = await _drive_async(client, unit_id, plan.blocks)
+    return assemble(plan, *parts) if parts is not None else None
 
+
+# -------- PUBLIC API --------
+def read_modbus() -> Optional[Dict[str, object]]:
+    try:
+        with connections.session(MODBUS_HOST, MODBUS_PORT, DEVICE_ID,
+                                 timeout=MODBUS_TIMEOUT, device=DEFAULT_DEVICE) as client:
+            plan = get_plan()
+            parts = _drive_sync(client, DEVICE_ID, plan.blocks)
+            if parts is None:
+                raise ConnectionUnavailable("no block answered")   # counts against the breaker
+    except (ConnectionUnavailable, TransportUnsupported) as e:
+        print("[Modbus]", e)
+        return None
     except Exception as e:
         print("[Modbus] unexpected error:", repr(e))
         traceback.print_exc()
         return None
-    finally:
-        try:
-            client.close()
-        except Exception:
-            pass
+
+    # Update shared snapshot
+    last_values.update(assemble(plan, *parts))
+    return last_values
 
 
 def get_last_values() -> Dict[str, object]:
@@ -1,31 +1,205 @@
-from pymodbus.client import ModbusTcpClient
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Tuple
+
+from . import modbus
+from .connections import connections, ConnectionUnavailable, check_tcp
+from .decode import encode_value
+from .register_map import MAX_GAP, MAX_READ_REGS, ReadPlan, get_plan
+from .snapshot import DEFAULT_DEVICE
+
+# -------- CONFIG --------
+MAX_WRITE_REGS = 123    # protocol limit for one FC16 request
+WRITE_TIMEOUT  = 2.0    # seconds a caller waits for its batch (queueing + I/O)
+
+Run = Tuple[int, List[int]]   # (start address, register values)
+
 
 def _write_register(client, address, value, slave_id):
-    try:
-        return client.write_register(address=address, value=value, unit=slave_id)
-    except TypeError:
-        return client.write_register(address=address, value=value, slave=slave_id)
+    # device_id= is pymodbus >= 3.10, slave=/unit= are the older spellings
+    for kw in ("device_id", "slave", "unit"):
+        try:
+            return client.write_register(address=address, value=value, **{kw: slave_id})
+        except TypeError:
+            continue
+    return client.write_register(address, value)
+
+def _write_registers(client, address, values, slave_id):
+    for kw in ("device_id", "slave", "unit"):
+        try:
+            return client.write_registers(address=address, values=values, **{kw: slave_id})
+        except TypeError:
+            continue
+    return client.write_registers(address, values)
 
 def _read_registers(client, address, count, slave_id):
+    for kw in ("device_id", "slave", "unit"):
+        try:
+            return client.read_holding_registers(address=address, count=count, **{kw: slave_id})
+        except TypeError:
+            continue
+    return client.read_holding_registers(address, count=count)
+
+
+def plan_writes(regs_by_addr: Dict[int, int], max_count: int = MAX_WRITE_REGS) -> List[Run]:
+    """Contiguous addresses -> one FC16 run each (never bridging a gap: that would clobber it)."""
+    runs: List[Run] = []
+    for address in sorted(regs_by_addr):
+        if runs and runs[-1][0] + len(runs[-1][1]) == address and len(runs[-1][1]) < max_count:
+            runs[-1][1].append(regs_by_addr[address])
+        else:
+            runs.append((address, [regs_by_addr[address]]))
+    return runs
+
+
+def plan_verify(runs: List[Run], max_gap: int = MAX_GAP,
+                max_count: int = MAX_READ_REGS) -> List[Tuple[int, int]]:
+    """Read spans (start, count) that cover every written run, bridging small gaps."""
+    spans: List[List[int]] = []
+    for start, values in runs:
+        end = start + len(values)
+        if spans and start - spans[-1][1] <= max_gap and end - spans[-1][0] <= max_count:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end])
+    return [(s, e - s) for s, e in spans]
+
+
+def write_batch(host, port, slave_id, regs_by_addr: Dict[int, int], timeout=2,
+                verify: bool = True) -> Tuple[bool, object]:
+    """
+    Write many holding registers over the pooled connection: one FC16 per contiguous
+    run, then one read per coalesced span to verify. Returns (ok, detail) like
+    write_zero_and_verify; detail lists the runs and any mismatching addresses.
+    """
+    runs = plan_writes(regs_by_addr)
     try:
-        return client.read_holding_registers(address=address, count=count, unit=slave_id)
-    except TypeError:
-        return client.read_holding_registers(address=address, count=count, slave=slave_id)
+        with connections.session(host, port, slave_id, timeout=timeout) as client:
+            for start, values in runs:
+                if len(values) == 1:
+                    wr = _write_register(client, start, values[0], slave_id)   # FC6 is shorter
+                else:
+                    wr = _write_registers(client, start, values, slave_id)
+                if wr.isError():
+                    return False, f"write_error@{start}:{wr}"
+            detail = {"writes": [[start, len(values)] for start, values in runs]}
+            if not verify:
+                return True, detail
 
-def write_zero_and_verify(host, port, slave_id, address, timeout=2):
-    client = ModbusTcpClient(host, port=port, timeout=timeout)
-    if not client.connect():
+            readback: Dict[int, int] = {}
+            for start, count in plan_verify(runs):
+                rr = _read_registers(client, start, count, slave_id)
+                if rr.isError():
+                    return True, {**detail, "verify": "read_error"}
+                readback.update(zip(range(start, start + count), rr.registers))
+            mismatches = {a: [v, readback.get(a)] for a, v in regs_by_addr.items()
+                          if readback.get(a) != v}
+            return True, {**detail, "verify": "ok" if not mismatches else "mismatch",
+                          "mismatches": mismatches}
+    except ConnectionUnavailable:
         return False, "connect_failed"
+    except Exception as e:
+        return False, f"io_error:{e!r}"
+
+
+class WriteQueue:
+    """
+    Serializes writes per process and coalesces whatever is queued for the same
+    device into one batch, so concurrent resets / recipe pushes share the FC16 calls
+    and the verify read. Writes that set an address to different values are never
+    merged: the later one goes out in its own batch after the earlier, and each
+    caller gets the result of the batch that carried its values.
+    """
 
+    def __init__(self):
+        self._queue: "queue.Queue[Tuple[tuple, Dict[int, int], Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, host, port, slave_id, regs_by_addr: Dict[int, int], timeout=2) -> Future:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="modbus-writer", daemon=True)
+                self._thread.start()
+        future: Future = Future()
+        self._queue.put(((host, int(port), int(slave_id), timeout), dict(regs_by_addr), future))
+        return future
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            by_device: Dict[tuple, List[Tuple[Dict[int, int], Future]]] = {}
+            for key, regs, future in items:
+                by_device.setdefault(key, []).append((regs, future))
+            for (host, port, slave_id, timeout), batch in by_device.items():
+                for merged, futures in _rounds(batch):
+                    result = write_batch(host, port, slave_id, merged, timeout=timeout)
+                    for future in futures:
+                        future.set_result(result)
+
+
+def _rounds(batch: List[Tuple[Dict[int, int], Future]]) -> List[Tuple[Dict[int, int], List[Future]]]:
+    """Merge queued writes in order; one that conflicts with the current round starts the next."""
+    rounds: List[Tuple[Dict[int, int], List[Future]]] = []
+    for regs, future in batch:
+        if not rounds or any(rounds[-1][0].get(a, v) != v for a, v in regs.items()):
+            rounds.append(({}, []))
+        rounds[-1][0].update(regs)
+        rounds[-1][1].append(future)
+    return rounds
+
+
+writes = WriteQueue()
+
+
+def write_registers_and_verify(host, port, slave_id, regs_by_addr: Dict[int, int],
+                               timeout=2, device: Optional[str] = None) -> Tuple[bool, object]:
+    """
+    Queue a batch and wait for it (at most timeout + WRITE_TIMEOUT).
+    Raises TransportUnsupported for RTU devices (see check_tcp) before anything is queued.
+    """
+    check_tcp(host, device)
     try:
-        wr = _write_register(client, address, 0, slave_id)
-        if wr.isError():
-            return False, f"write_error:{wr}"
-
-        rr = _read_registers(client, address, 1, slave_id)
-        if rr.isError():
-            return True, {"wrote": 0, "verify": "read_error"}
-        val = rr.registers[0] if rr.registers else None
-        return True, {"wrote": 0, "readback": val}
-    finally:
-        client.close()
+        return writes.submit(host, port, slave_id, regs_by_addr, timeout).result(timeout + WRITE_TIMEOUT)
+    except FutureTimeout:
+        return False, "write_timeout"
+
+
+def encode_tags(values: Dict[str, object], plan: Optional[ReadPlan] = None) -> Dict[int, int]:
+    """Tag/value pairs -> register address/value pairs using the register map's type and scale."""
+    plan = plan or get_plan()
+    by_name = {t.name: t for t in plan.tags}
+    regs: Dict[int, int] = {}
+    for name, value in values.items():
+        tag = by_name.get(name)
+        if tag is None:
+            raise KeyError(f"unknown tag: {name}")
+        words = encode_value(value, tag.type, tag.word_order, tag.byte_order, tag.scale)
+        regs.update(zip(range(tag.address, tag.end), words))
+    return regs
+
+
+def write_tags(values: Dict[str, object], host=None, port=None, slave_id=None,
+               plan: Optional[ReadPlan] = None, timeout=2) -> Tuple[bool, object]:
+    """Write engineering values by tag name (defaults: the MODBUS_HOST device and map)."""
+    return write_registers_and_verify(
+        host or modbus.MODBUS_HOST, port or modbus.MODBUS_PORT,
+        slave_id if slave_id is not None else modbus.DEVICE_ID,
+        encode_tags(values, plan), timeout, device=None if host else DEFAULT_DEVICE)
+
+
+def write_zero_and_verify(host, port, slave_id, address, timeout=2, device: Optional[str] = None):
+    # Goes through this process's write queue, whose pooled connection is separate from
+    # the poller's (a second TCP session to the PLC, kept open between writes)
+    ok, detail = write_registers_and_verify(host, port, slave_id, {address: 0}, timeout, device)
+    if not ok:
+        return ok, detail
+    if detail.get("verify") == "read_error":
+        return True, {"wrote": 0, "verify": "read_error"}
+    return True, {"wrote": 0, "readback": 0 if detail["verify"] == "ok" else detail["mismatches"][address][1]}
@@ -0,0 +1,159 @@
+# backend/modbus_reader/poller.py
+import os
+import sys
+import tempfile
+import threading
+
+from .changes import detector
+from .devices import load_devices
+from .history import history
+from .production import production
+from .snapshot import store
+
+# -------- CONFIG --------
+POLL_INTERVAL = float(os.getenv("MODBUS_POLL_INTERVAL", "1.0"))   # seconds between cycles
+STALE_AFTER   = float(os.getenv("MODBUS_STALE_AFTER", "5.0"))     # /status/ flags data older than this
+# "thread":  one serving process per host (see POLLER_LOCK) polls in a background thread and
+#            feeds the others over MODBUS_POLLER_SOCKET (single-process dev, small deployments)
+# "service": processes only subscribe to `manage.py run_poller` over MODBUS_POLLER_SOCKET
+# "off":     no polling and no subscription
+POLLER_MODE   = os.getenv("MODBUS_POLLER_MODE", "thread")
+# where "service" processes read /status/ from: "socket" (their copy of the ipc feed) or
+# "shm" (the shared-memory segment); events always come over the socket
+SNAPSHOT_BACKEND = os.getenv("MODBUS_SNAPSHOT_BACKEND", "socket")
+# which processes act on POLLER_MODE at all:
+# "auto": web servers only (runserver's serving process, gunicorn/uvicorn/daphne/...);
+#         other management commands, test runs and scripts start nothing
+# "web":  this process does, whatever it is (scripts, benchmarks)
+# "none": this process never polls or subscribes
+POLLER_ROLE   = os.getenv("MODBUS_POLLER_ROLE", "auto")
+SERVER_PROGRAMS = {"gunicorn", "uvicorn", "daphne", "hypercorn", "uwsgi", "granian", "mod_wsgi"}
+SERVER_COMMANDS = {"runserver"}
+# thread mode: the serving process holding an flock on this file polls, the rest follow it
+POLLER_LOCK   = os.getenv("MODBUS_POLLER_LOCK", os.path.join(tempfile.gettempdir(), "binaiot-poller.lock"))
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def is_web_process(argv=None) -> bool:
+    """Is this process serving HTTP (as opposed to a management command, test run or script)?"""
+    argv = sys.argv if argv is None else argv
+    program = os.path.basename(argv[0]) if argv else ""
+    if program == "__main__.py":            # python -m <package>
+        program = os.path.basename(os.path.dirname(argv[0]))
+    if program in ("manage.py", "django-admin", "django"):
+        if argv[1:2] and argv[1] in SERVER_COMMANDS:
+            # the autoreloader's parent only watches files; its child (RUN_MAIN) serves
+            return os.environ.get("RUN_MAIN") == "true" or "--noreload" in argv
+        return False
+    return program in SERVER_PROGRAMS
+
+
+_lock_file = None
+
+
+def _elect(path: str = POLLER_LOCK) -> bool:
+    """
+    Try to become this host's poller: a non-blocking flock on `path`, held for the
+    life of the process. The kernel drops it when the holder exits, so the next
+    worker gunicorn/uwsgi starts takes over.
+    """
+    global _lock_file
+    if _lock_file is not None:
+        return True
+    try:
+        import fcntl
+    except ImportError:                      # no flock (Windows): single-process dev servers only
+        return True
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    _lock_file = f
+    return True
+
+
+def process_role() -> str:
+    """
+    What this process should start: "thread" (poll here), "follow" (thread mode, but
+    another process on this host won the election: read its feed), "service"
+    (subscribe to run_poller) or "off".
+    """
+    if POLLER_ROLE == "none" or (POLLER_ROLE == "auto" and not is_web_process()):
+        return "off"
+    if POLLER_MODE == "thread" and POLLER_ROLE == "auto" and not _elect():
+        print(f"[Poller] another process holds {POLLER_LOCK}: following its snapshot feed")
+        return "follow"
+    return POLLER_MODE
+
+
+def start_poller(interval: float = POLL_INTERVAL) -> bool:
+    """
+    Start the background poller for this process: one thread running the asyncio
+    engine over every configured device. The elected poller of a multi-worker server
+    also serves its snapshots to the followers. Returns False if it is already running.
+    """
+    from .aio_poller import MAX_CONCURRENCY, run_forever   # pymodbus is only loaded where it polls
+    from .alarms import alarms
+    global _thread
+    with _thread_lock:
+        if _thread is not None and _thread.is_alive():
+            return False
+        devices = load_devices(default_interval=interval)
+        store.subscribe(history.record)
+        history.start()
+        production.restore()
+        store.subscribe(production.observe)
+        production.start()
+        store.subscribe(alarms.observe)      # evaluated here only; followers get the events
+        _thread = threading.Thread(target=run_forever, args=(devices, MAX_CONCURRENCY),
+                                   name="modbus-poller", daemon=True)
+        _thread.start()
+        if _lock_file is not None:
+            _serve_followers()
+        return True
+
+
+def _serve_followers():
+    import asyncio
+    from .alarms import alarms
+    from .ipc import SnapshotHub
+    hub = SnapshotHub()
+    store.subscribe(hub.notify)
+    alarms.sink = hub.send
+    threading.Thread(target=asyncio.run, args=(hub.serve(),), name="snapshot-hub", daemon=True).start()
+
+
+_segment = None
+
+
+def _forward_reset(device: str, address: int):
+    """Reset hints from this worker's write path go to the process that owns the aggregates."""
+    from .ipc import feed
+    feed.send({"op": "reset", "device": device, "address": address})
+
+
+def start_feed(backend: str = SNAPSHOT_BACKEND) -> bool:
+    """
+    Take snapshots from the poller service instead of polling in this process. The
+    change log, alarms, history rings, production and SSE always follow the socket
+    feed, which delivers every snapshot; with the shm backend /status/ reads come
+    from the shared segment instead of a per-worker copy.
+    """
+    global _segment
+    store.subscribe(detector.ingest)
+    store.subscribe(history.remember)
+    production.restore()               # the service writes the checkpoints
+    store.subscribe(production.observe)
+    production.forward = _forward_reset
+    if backend == "shm":
+        from .shm import SegmentReader
+        with _thread_lock:
+            if _segment is None:
+                _segment = SegmentReader()
+                store.attach(_segment)
+    from .ipc import feed
+    return feed.start()
@@ -0,0 +1,281 @@
+# backend/modbus_reader/probe.py
+"""
+Register-map discovery for a new machine (manage.py probe_registers).
+
+1. scan: walk the holding-register space with reads of up to 125 registers. A
+   failed read is halved until the first unreadable register is pinned down; from
+   there single-register probes gallop ahead (1, 2, 4 .. max_skip) to the next
+   readable one and a bisection finds where the readable range starts again. A
+   fully readable space costs ~N/125 requests, each boundary ~2*log2(125) more.
+   Readable islands shorter than max_skip inside a long unreadable stretch can be
+   jumped over; lower --max-skip for such devices.
+2. sample: re-read the readable ranges a few times, so values that move count too.
+3. detect: non-zero runs are decoded as float32 at both alignments in each of the
+   four word/byte orders. A float "looks right" when it is finite, not denormal
+   and within 1e-6..1e9 (a short mantissa counts extra, setpoints and integers
+   have one). The device-wide order is the one with the best total; runs that
+   don't decode to plausible floats become uint16 tags.
+
+The resulting map keeps the current map's tags in order and name (the UI reads
+"values"/"raw" by position), settles each fallback_address on whichever address
+actually has data, and appends the tags found elsewhere. A tag whose word/byte
+order differs from the rest of the current map is a per-tag override: it keeps
+its own order, everything else follows the detected one.
+"""
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .register_map import MAX_GAP, MAX_READ_REGS, Tag
+
+# -------- CONFIG --------
+MAX_SKIP    = 32     # largest gallop step over unreadable registers
+MIN_SCORE   = 0.5    # mean plausibility per float for a run to be taken as float32
+ORDERS      = [("big", "big"), ("little", "big"), ("big", "little"), ("little", "little")]   # ABCD CDAB BADC DCBA
+ORDER_NAMES = {("big", "big"): "ABCD", ("little", "big"): "CDAB",
+               ("big", "little"): "BADC", ("little", "little"): "DCBA"}
+
+Reader = Callable[[int, int], Optional[List[int]]]   # (address, count) -> registers, None = rejected
+Range = Tuple[int, int]                              # [start, end)
+
+
+class RegisterScanner:
+    """
+    Adaptive scan over a reader that returns None for a rejected request (Modbus
+    exception: illegal data address) and raises on I/O errors; a request that still
+    fails after `retries` retries counts as rejected (some devices just stay silent).
+    """
+
+    def __init__(self, read: Reader, max_count: int = MAX_READ_REGS, max_skip: int = MAX_SKIP,
+                 retries: int = 1):
+        self.read = read
+        self.max_count = max_count
+        self.max_skip = max(1, max_skip)
+        self.retries = retries
+        self.requests = 0
+        self.regs: Dict[int, int] = {}
+
+    def _read(self, address: int, count: int) -> Optional[List[int]]:
+        for attempt in range(self.retries + 1):
+            self.requests += 1
+            try:
+                regs = self.read(address, count)
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"[Probe] {address}+{count}: {e!r}; treating as unreadable")
+                    return None
+                continue
+            if regs is not None and len(regs) >= count:
+                return list(regs[:count])
+            return None
+        return None
+
+    def _next_readable(self, bad: int, end: int) -> int:
+        """`bad` is unreadable: first readable address after it (or `end`)."""
+        step = 1
+        while True:
+            nxt = bad + step
+            if nxt >= end:
+                # the tail shorter than a step: bisect it against `end` too
+                nxt = end - 1
+                if nxt <= bad or self._read(nxt, 1) is None:
+                    return end
+                break
+            if self._read(nxt, 1) is not None:
+                break
+            bad, step = nxt, min(step * 2, self.max_skip)
+        lo, hi = bad, nxt          # lo unreadable, hi readable
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self._read(mid, 1) is None:
+                lo = mid
+            else:
+                hi = mid
+        return hi
+
+    def scan(self, start: int = 0, end: int = 65536) -> List[Range]:
+        address, size = start, self.max_count
+        while address < end:
+            n = min(size, end - address)
+            regs = self._read(address, n)
+            if regs is not None:
+                self.regs.update(zip(range(address, address + n), regs))
+                address += n
+                size = min(size * 2, self.max_count)
+            elif n > 1:
+                size = n // 2   # narrow down on the first unreadable register
+            else:
+                address = self._next_readable(address, end)
+                size = self.max_count
+        return ranges(self.regs)
+
+    def sample(self, spans: Sequence[Range],
+               seen: Optional[Dict[int, List[int]]] = None) -> Dict[int, List[int]]:
+        """Read `spans` once more; address -> values so far (the scan's, then `seen`'s)."""
+        if seen is None:
+            seen = {a: [v] for a, v in self.regs.items()}
+        for s, e in spans:
+            for address in range(s, e, self.max_count):
+                n = min(self.max_count, e - address)
+                regs = self._read(address, n)
+                if regs is not None:
+                    for a, v in zip(range(address, address + n), regs):
+                        seen.setdefault(a, []).append(v)
+        return seen
+
+
+def ranges(regs: Dict[int, object]) -> List[Range]:
+    out: List[Range] = []
+    for a in sorted(regs):
+        if out and out[-1][1] == a:
+            out[-1] = (out[-1][0], a + 1)
+        else:
+            out.append((a, a + 1))
+    return out
+
+
+def islands(samples: Dict[int, List[int]], max_zeros: int = 1) -> List[Range]:
+    """Runs of registers that were non-zero in some sample, bridging up to `max_zeros` zeros."""
+    live = sorted(a for a, vs in samples.items() if any(vs))
+    out: List[Range] = []
+    for a in live:
+        if out and a - out[-1][1] <= max_zeros and all(x in samples for x in range(out[-1][1], a)):
+            out[-1] = (out[-1][0], a + 1)
+        else:
+            out.append((a, a + 1))
+    return out
+
+
+# ---- float32 detection ----
+def _bits(hi: int, lo: int, word_order: str, byte_order: str) -> int:
+    if byte_order == "little":
+        hi, lo = ((hi & 0xFF) << 8) | (hi >> 8), ((lo & 0xFF) << 8) | (lo >> 8)
+    return (hi << 16) | lo if word_order == "big" else (lo << 16) | hi
+
+
+def plausibility(bits: int) -> float:
+    if bits & 0x7FFFFFFF == 0:
+        return 0.0                      # 0.0 says nothing
+    exp = (bits >> 23) & 0xFF
+    if not 107 <= exp <= 157:           # denormal/inf/nan, or outside ~1e-6 .. ~1e9
+        return -1.0
+    return 1.5 if bits & 0xFFF == 0 else 1.0
+
+
+def float_score(samples: Dict[int, List[int]], first: int, end: int,
+                order: Tuple[str, str]) -> Tuple[float, int]:
+    """(total plausibility, floats judged) of float32s at first, first+2, .. < end."""
+    total, judged = 0.0, 0
+    for a in range(first, end - 1, 2):
+        hi, lo = samples.get(a), samples.get(a + 1)
+        if hi is None or lo is None:
+            continue
+        for h, l in zip(hi, lo):
+            if h or l:
+                total += plausibility(_bits(h, l, *order))
+                judged += 1
+    return total, judged
+
+
+def _best_alignment(samples, island: Range, order) -> Tuple[int, float, int]:
+    s, e = island
+    best = None
+    for first in (s, s - 1):            # a float may start with a zero word (e.g. CDAB 15.0)
+        end = e + ((e - first) % 2)     # round the run up to whole pairs
+        score, judged = float_score(samples, first, end, order)
+        if best is None or score > best[1]:
+            best = (first, score, judged)
+    return best
+
+
+def detect_order(samples: Dict[int, List[int]], runs: Sequence[Range]) -> Dict[Tuple[str, str], float]:
+    """Total best-alignment score per (word_order, byte_order) over all runs."""
+    return {order: sum(_best_alignment(samples, run, order)[1] for run in runs) for order in ORDERS}
+
+
+def layout(samples: Dict[int, List[int]], runs: Sequence[Range],
+           order: Tuple[str, str]) -> List[Tuple[int, str]]:
+    """(address, type) for every value in `runs`: float32 pairs where they look right, else uint16."""
+    out: List[Tuple[int, str]] = []
+    for run in runs:
+        first, score, judged = _best_alignment(samples, run, order)
+        if judged and score / judged >= MIN_SCORE:
+            end = run[1] + ((run[1] - first) % 2)
+            for a in range(first, end - 1, 2):
+                if any(samples.get(a, ())) or any(samples.get(a + 1, ())):
+                    out.append((a, "float32"))
+        else:
+            out.extend((a, "uint16") for a in range(*run) if any(samples.get(a, ())))
+    return out
+
+
+# ---- map ----
+def _has_data(samples: Dict[int, List[int]], address: int, count: int) -> bool:
+    regs = [samples.get(a) for a in range(address, address + count)]
+    return all(r is not None for r in regs) and any(v for r in regs for v in r)
+
+
+def _readable(samples: Dict[int, List[int]], address: int, count: int) -> bool:
+    return all(a in samples for a in range(address, address + count))
+
+
+def _fit(samples: Dict[int, List[int]], address: int, type_: str, count: int,
+         order: Tuple[str, str]) -> float:
+    """How well a tag at `address` matches the data: float32 by plausibility, others by being non-zero."""
+    if not _readable(samples, address, count):
+        return float("-inf")
+    if type_ == "float32":
+        return float_score(samples, address, address + 2, order)[0]
+    return 1.0 if _has_data(samples, address, count) else 0.0
+
+
+def build_map(samples: Dict[int, List[int]], current: Sequence[Tag], order: Tuple[str, str],
+              max_gap: int = MAX_GAP) -> Tuple[dict, List[str]]:
+    """Map JSON (load_tag_map format) plus notes for the operator."""
+    notes: List[str] = []
+    tags: List[dict] = []
+    taken = set()
+    orders = Counter((tag.word_order, tag.byte_order) for tag in current)
+    prevailing = orders.most_common(1)[0][0] if orders else order
+    for tag in current:
+        own = (tag.word_order, tag.byte_order)
+        tag_order = own if own != prevailing else order
+        address = tag.address
+        if tag.fallback_address is not None:
+            fits = {a: _fit(samples, a, tag.type, tag.count, tag_order) for a in (tag.address, tag.fallback_address)}
+            if fits[tag.fallback_address] > fits[tag.address]:
+                address = tag.fallback_address
+                notes.append(f"{tag.name}: data is at the fallback {address}, not {tag.address}")
+        if not _readable(samples, address, tag.count):
+            notes.append(f"{tag.name}: {address}..{address + tag.count - 1} not readable")
+        elif not _has_data(samples, address, tag.count):
+            notes.append(f"{tag.name}: {address} read zero in every sample")
+        elif tag.type == "float32" and _fit(samples, address, tag.type, tag.count, tag_order) < 0:
+            notes.append(f"{tag.name}: {address} doesn't look like a float32 in {ORDER_NAMES[tag_order]} "
+                         f"(an integer?); kept as float32")
+        entry = {"name": tag.name, "address": address, "type": tag.type}
+        if tag_order != order:
+            entry["word_order"], entry["byte_order"] = tag_order
+        for key in ("scale", "deadband", "deadband_pct", "scan"):
+            value, default = getattr(tag, key), Tag.__dataclass_fields__[key].default
+            if value != default:
+                entry[key] = value
+        tags.append(entry)
+        taken.update(range(address, address + tag.count))
+
+    for address, type_ in layout(samples, islands(samples), order):
+        count = 2 if type_ == "float32" else 1
+        if taken.intersection(range(address, address + count)):
+            continue
+        tags.append({"name": f"hr{address}", "address": address, "type": type_})
+        taken.update(range(address, address + count))
+
+    spec = {"word_order": order[0], "byte_order": order[1], "max_gap": max_gap, "tags": tags}
+    return spec, notes
+
+
+def probe_info(scanner: RegisterScanner, spans: Sequence[Range], scores: Dict, **extra) -> dict:
+    """Provenance kept in the map file under "probe" (load_tag_map ignores it)."""
+    return {"at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "requests": scanner.requests,
+            "readable": [list(r) for r in spans],
+            "order_scores": {ORDER_NAMES[o]: round(s, 1) for o, s in scores.items()}, **extra}
@@ -0,0 +1,360 @@
+# backend/modbus_reader/production.py
+"""
+Incremental production-counter aggregates, fed by the poll stream.
+
+Each configured counter register (by default the pcs/set registers the reset
+endpoints zero) is diffed against its previous reading on every snapshot:
+
+  raw went up              -> that many pieces
+  raw went down near max   -> rollover (pieces = raw + 2**bits - previous)
+  raw went down otherwise  -> reset (/reset-psc/, or on the panel); pieces = raw
+
+The pieces go into rolling-rate windows and minute / shift / day rollups held in
+memory, so /production/ reads precomputed numbers instead of scanning history.
+A bucket also tracks "run" seconds (a piece was counted within RUN_TIMEOUT) and
+"seen" seconds (polled at all), giving availability, and performance when an
+ideal rate is configured. OEE here is availability x performance; these
+registers carry no reject count, so quality is taken as 1.
+
+The owning process (poller thread or run_poller) writes a JSON checkpoint every
+CHECKPOINT_INTERVAL and on shutdown; web workers fed by the service restore it at
+start and keep their own copy current from the feed. Reset hints noted in a web
+worker are forwarded to the owning process (see `forward`).
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .history import HISTORY_DB
+
+# -------- CONFIG --------
+COUNTERS       = os.getenv("MODBUS_COUNTERS", "pcs:125,set:127")   # name:address[:bits], bits 16 (default) or 32
+IDEAL_RATES    = os.getenv("MODBUS_IDEAL_RATE", "")                # "pcs=30": ideal pieces/minute per counter
+SHIFTS         = os.getenv("MODBUS_SHIFTS", "06:00,14:00,22:00")   # local shift start times
+RATE_WINDOWS   = (60, 300, 900)                                    # seconds
+RUN_TIMEOUT    = float(os.getenv("MODBUS_RUN_TIMEOUT", "60"))      # no piece for this long = stopped
+MAX_SAMPLE_GAP = 30.0      # a longer gap between polls is "not seen", not run or idle time
+RESET_GRACE    = 30.0      # a drop this soon after note_reset() is a reset, even near max
+MINUTES_KEPT   = 24 * 60
+SHIFTS_KEPT    = 21
+DAYS_KEPT      = 62
+CHECKPOINT_PATH     = os.getenv("MODBUS_COUNTER_CHECKPOINT",
+                                os.path.join(os.path.dirname(HISTORY_DB), "counters.json"))
+CHECKPOINT_INTERVAL = float(os.getenv("MODBUS_COUNTER_CHECKPOINT_EVERY", "30"))
+
+
+@dataclass
+class CounterSpec:
+    name: str
+    address: int
+    bits: int = 16
+    ideal_rate: Optional[float] = None   # pieces per minute at full speed
+
+    @property
+    def registers(self) -> int:
+        return self.bits // 16
+
+
+def parse_counters(text: str = COUNTERS, ideal: str = IDEAL_RATES) -> List[CounterSpec]:
+    rates = dict(item.split("=", 1) for item in ideal.split(",") if "=" in item)
+    specs = []
+    for item in filter(None, (s.strip() for s in text.split(","))):
+        name, address, *rest = item.split(":")
+        bits = int(rest[0]) if rest else 16
+        if bits not in (16, 32):
+            raise ValueError(f"counter {name}: bits must be 16 or 32")
+        rate = rates.get(name)
+        specs.append(CounterSpec(name, int(address), bits, float(rate) if rate else None))
+    return specs
+
+
+# ---- periods: ts -> (start, end) ----
+def minute_period(ts: float) -> Tuple[float, float]:
+    start = ts - ts % 60
+    return start, start + 60
+
+
+def day_period(ts: float) -> Tuple[float, float]:
+    day = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day.timestamp(), (day + timedelta(days=1)).timestamp()
+
+
+def _parse_shifts(text: str) -> List[Tuple[int, int]]:
+    starts = sorted((int(h), int(m)) for h, m in (s.strip().split(":") for s in text.split(",") if s.strip()))
+    return starts or [(0, 0)]
+
+
+_SHIFT_STARTS = _parse_shifts(SHIFTS)
+
+
+def shift_period(ts: float) -> Tuple[float, float]:
+    now = datetime.fromtimestamp(ts)
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    # every boundary from yesterday's last to tomorrow's first, in order
+    bounds = [(day - timedelta(days=1)).replace(hour=h, minute=m) for h, m in _SHIFT_STARTS[-1:]]
+    bounds += [day.replace(hour=h, minute=m) for h, m in _SHIFT_STARTS]
+    bounds += [(day + timedelta(days=1)).replace(hour=h, minute=m) for h, m in _SHIFT_STARTS[:1]]
+    for start, end in zip(bounds, bounds[1:]):
+        if start <= now < end:
+            return start.timestamp(), end.timestamp()
+    return bounds[-2].timestamp(), bounds[-1].timestamp()
+
+
+Bucket = List[float]   # [start, pieces, run seconds, seen seconds]
+
+
+class Rollup:
+    """Current bucket of one period kind plus the last `keep` closed ones."""
+
+    def __init__(self, period: Callable[[float], Tuple[float, float]], keep: int):
+        self.period = period
+        self.current: Optional[Bucket] = None
+        self.end = 0.0
+        self.closed: Deque[Bucket] = deque(maxlen=keep)
+
+    def add(self, ts: float, pieces: int, run: float, seen: float):
+        cur = self.current
+        if cur is None or not cur[0] <= ts < self.end:   # boundary math only once per period
+            if cur is not None:
+                self.closed.append(cur)
+            start, self.end = self.period(ts)
+            cur = self.current = [start, 0, 0.0, 0.0]
+        cur[1] += pieces
+        cur[2] += run
+        cur[3] += seen
+
+    def dump(self) -> Dict[str, object]:
+        return {"current": self.current, "closed": list(self.closed)}
+
+    def load(self, data: Dict[str, object]):
+        self.closed.extend(data.get("closed") or [])
+        self.current = data.get("current")
+        if self.current is not None:
+            self.end = self.period(self.current[0])[1]
+
+
+class CounterState:
+    def __init__(self, spec: CounterSpec):
+        self.spec = spec
+        self.total = 0                  # pieces since the first reading (survives resets)
+        self.last_raw: Optional[int] = None
+        self.last_ts: Optional[float] = None
+        self.last_piece: Optional[float] = None
+        self.resets = 0
+        self.rollovers = 0
+        self.windows: Dict[int, Deque[Tuple[float, int]]] = {w: deque() for w in RATE_WINDOWS}
+        self.minutes = Rollup(minute_period, MINUTES_KEPT)
+        self.shifts = Rollup(shift_period, SHIFTS_KEPT)
+        self.days = Rollup(day_period, DAYS_KEPT)
+
+    def update(self, raw: int, ts: float, reset_hint: bool = False) -> int:
+        """Fold one reading in; returns the pieces it added."""
+        prev, prev_ts = self.last_raw, self.last_ts
+        self.last_raw, self.last_ts = raw, ts
+        if prev is None or prev_ts is None or ts <= prev_ts:
+            return 0
+        modulus = 1 << self.spec.bits
+        if raw >= prev:
+            pieces = raw - prev
+        elif not reset_hint and prev >= modulus - modulus // 8 and raw < modulus // 8:
+            pieces = raw + modulus - prev
+            self.rollovers += 1
+        else:
+            pieces = raw
+            self.resets += 1
+
+        gap = ts - prev_ts
+        seen = gap if gap <= MAX_SAMPLE_GAP else 0.0
+        if pieces:
+            self.last_piece = ts
+        running = self.last_piece is not None and ts - self.last_piece <= RUN_TIMEOUT
+        run = seen if running else 0.0
+
+        self.total += pieces
+        for window, samples in self.windows.items():
+            samples.append((ts, self.total))
+            while samples[0][0] < ts - window:
+                samples.popleft()
+        for rollup in (self.minutes, self.shifts, self.days):
+            rollup.add(ts, pieces, run, seen)
+        return pieces
+
+    def rate(self, window: int) -> float:
+        """Pieces per minute over the last `window` seconds."""
+        samples = self.windows[window]
+        if len(samples) < 2:
+            return 0.0
+        (t0, n0), (t1, n1) = samples[0], samples[-1]
+        return (n1 - n0) * 60.0 / (t1 - t0) if t1 > t0 else 0.0
+
+    def bucket(self, b: Optional[Bucket]) -> Optional[Dict[str, object]]:
+        if b is None:
+            return None
+        start, pieces, run, seen = b
+        availability = run / seen if seen else None
+        performance = None
+        if self.spec.ideal_rate and run:
+            performance = pieces / (self.spec.ideal_rate * run / 60.0)
+        oee = availability * performance if availability is not None and performance is not None else None
+        return {"start": start, "pieces": int(pieces), "run_s": round(run, 1), "seen_s": round(seen, 1),
+                "availability": availability, "performance": performance, "oee": oee}
+
+    def dump(self) -> Dict[str, object]:
+        return {"total": self.total, "last_raw": self.last_raw, "last_ts": self.last_ts,
+                "last_piece": self.last_piece, "resets": self.resets, "rollovers": self.rollovers,
+                "minutes": self.minutes.dump(), "shifts": self.shifts.dump(), "days": self.days.dump()}
+
+    def load(self, data: Dict[str, object]):
+        for key in ("total", "last_raw", "last_ts", "last_piece", "resets", "rollovers"):
+            setattr(self, key, data.get(key, getattr(self, key)))
+        for key in ("minutes", "shifts", "days"):
+            getattr(self, key).load(data.get(key) or {})
+
+
+class ProductionAggregator:
+    def __init__(self, specs: Optional[List[CounterSpec]] = None, path: str = CHECKPOINT_PATH):
+        self.specs = parse_counters() if specs is None else specs
+        self.path = path
+        self._lock = threading.Lock()
+        self._states: Dict[Tuple[str, str], CounterState] = {}
+        self._slots: Dict[str, List[Tuple[CounterSpec, Optional[int]]]] = {}   # device -> raw index per counter
+        self._maps: Optional[Dict[str, str]] = None
+        self._reset_at: Dict[Tuple[str, int], float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.forward: Optional[Callable[[str, int], object]] = None   # fed processes: to the owner
+
+    # ---- where each counter sits in a device's raw list ----
+    def _tag_map(self, device: str) -> str:
+        if self._maps is None:
+            from .devices import load_devices
+            try:
+                self._maps = {d.name: d.tag_map for d in load_devices()}
+            except Exception as e:
+                print("[Production] can't read devices, using the default map:", repr(e))
+                self._maps = {}
+        return self._maps.get(device, "")
+
+    def _slots_for(self, device: str) -> List[Tuple[CounterSpec, Optional[int]]]:
+        slots = self._slots.get(device)
+        if slots is None:
+            from .register_map import get_plan
+            offsets, off = {}, 0
+            for tag in get_plan(self._tag_map(device)).tags:   # raw follows map order
+                for i in range(tag.count):
+                    offsets.setdefault(tag.address + i, off + i)
+                off += tag.count
+            slots = []
+            for spec in self.specs:
+                index = offsets.get(spec.address)
+                if index is None or offsets.get(spec.address + spec.registers - 1) != index + spec.registers - 1:
+                    print(f"[Production] {device}: counter {spec.name} @{spec.address} is not in the register map")
+                    index = None
+                slots.append((spec, index))
+            self._slots[device] = slots
+        return slots
+
+    # ---- feeding ----
+    def observe(self, snap: Dict[str, object]):
+        """Snapshot-store listener."""
+        raw = snap.get("raw") or []
+        device, ts = snap["device"], snap["ts"]
+        with self._lock:
+            for spec, index in self._slots_for(device):
+                if index is None or index + spec.registers > len(raw):
+                    continue
+                words = raw[index:index + spec.registers]
+                if any(w is None for w in words):
+                    continue   # block failed this cycle
+                value = words[0] if spec.registers == 1 else (words[0] << 16) | words[1]
+                state = self._states.get((device, spec.name))
+                if state is None:
+                    state = self._states[(device, spec.name)] = CounterState(spec)
+                hint = ts - self._reset_at.get((device, spec.address), -RESET_GRACE) < RESET_GRACE
+                state.update(value, ts, hint)
+
+    def note_reset(self, device: str, address: int):
+        """The register was just zeroed by us: its next drop is a reset, never a rollover."""
+        with self._lock:
+            self._reset_at[(device, address)] = time.time()
+        if self.forward is not None:
+            self.forward(device, address)
+
+    # ---- reading ----
+    def summary(self, device: str, minutes: int = 0, shifts: int = 0, days: int = 0) -> Dict[str, object]:
+        """Precomputed aggregates for one device; minutes/shifts/days = closed buckets to include."""
+        out: Dict[str, object] = {}
+        with self._lock:
+            for spec in self.specs:
+                state = self._states.get((device, spec.name))
+                if state is None:
+                    continue
+                entry = {
+                    "total": state.total, "raw": state.last_raw, "ts": state.last_ts,
+                    "resets": state.resets, "rollovers": state.rollovers,
+                    "running": state.last_piece is not None and state.last_ts is not None
+                               and state.last_ts - state.last_piece <= RUN_TIMEOUT,
+                    "rate_per_min": {f"{w // 60}m": round(state.rate(w), 3) for w in RATE_WINDOWS},
+                    "minute": state.bucket(state.minutes.current),
+                    "shift": state.bucket(state.shifts.current),
+                    "day": state.bucket(state.days.current),
+                }
+                for key, rollup, n in (("minutes", state.minutes, minutes),
+                                       ("shifts", state.shifts, shifts), ("days", state.days, days)):
+                    if n > 0:
+                        entry[key] = [state.bucket(b) for b in list(rollup.closed)[-n:]]
+                out[spec.name] = entry
+        return {"device": device, "counters": out}
+
+    # ---- checkpoints ----
+    def checkpoint(self) -> int:
+        with self._lock:
+            data = {f"{device}\x1f{name}": state.dump() for (device, name), state in self._states.items()}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"ts": time.time(), "counters": data}, f)
+        os.replace(tmp, self.path)   # readers never see a half-written file
+        return len(data)
+
+    def restore(self) -> int:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            print("[Production] checkpoint unreadable, starting empty:", repr(e))
+            return 0
+        specs = {s.name: s for s in self.specs}
+        with self._lock:
+            for key, saved in (data.get("counters") or {}).items():
+                device, _, name = key.partition("\x1f")
+                if name in specs and (device, name) not in self._states:
+                    state = self._states[(device, name)] = CounterState(specs[name])
+                    state.load(saved)
+        return len(self._states)
+
+    def _checkpoint_loop(self):
+        while True:
+            time.sleep(CHECKPOINT_INTERVAL)
+            try:
+                self.checkpoint()
+            except Exception as e:
+                print("[Production] checkpoint failed:", repr(e))
+                traceback.print_exc()
+
+    def start(self) -> bool:
+        """Checkpoint periodically (only the process that owns the poll stream)."""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(target=self._checkpoint_loop, name="production-checkpoint", daemon=True)
+        self._thread.start()
+        return True
+
+
+production = ProductionAggregator()
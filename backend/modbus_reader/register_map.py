@@ -0,0 +1,201 @@
+# backend/modbus_reader/register_map.py
+import json
+import os
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional
+
+from .decode import TYPES, BlockDecoder
+
+# -------- CONFIG --------
+# JSON tag map; when unset the built-in map (the original two blocks) is used.
+TAG_MAP_FILE = os.getenv("MODBUS_TAG_MAP", "")
+
+MAX_READ_REGS = 125   # protocol limit for one FC3 request
+MAX_GAP       = int(os.getenv("MODBUS_MAX_GAP", "16"))   # unused regs we'd rather read than pay a round trip for
+
+# Scan classes: name -> interval, or {"interval": s, "max_interval": s} to let a stable
+# group slow down (doubling) up to max_interval. "default" = the device's own interval.
+DEFAULT_SCAN = "default"
+SCAN_CLASSES = {
+    "fast":   0.2,
+    "normal": 1.0,
+    "slow":   {"interval": 30.0, "max_interval": 120.0},
+}
+
+# Decode options (adjust if numbers look swapped)
+WORD_ORDER = "big"    # "big"  => high word first  (AB CD)
+                      # "little" => low word first (CD AB)
+BYTE_ORDER = "big"    # "big"  => each 16-bit word is big-endian (A,B)
+                      # "little" => each 16-bit word is little-endian (B,A)
+
+@dataclass
+class Tag:
+    name: str
+    address: int
+    type: str = "float32"
+    word_order: str = WORD_ORDER
+    byte_order: str = BYTE_ORDER
+    scale: float = 1.0
+    # Alternative start address tried when the primary registers read back all zero
+    fallback_address: Optional[int] = None
+    # Report-by-exception: ignore moves within +-deadband and/or +-deadband_pct % of the last value
+    deadband: float = 0.0
+    deadband_pct: float = 0.0
+    scan: str = DEFAULT_SCAN   # scan class name (see SCAN_CLASSES)
+
+    def __post_init__(self):
+        if self.type not in TYPES:
+            raise ValueError(f"tag {self.name}: unknown type {self.type!r}")
+        self.word_order = self.word_order.lower()
+        self.byte_order = self.byte_order.lower()
+
+    @property
+    def count(self) -> int:
+        return TYPES[self.type][0]
+
+    @property
+    def end(self) -> int:
+        """One past the last register of this tag."""
+        return self.address + self.count
+
+
+@dataclass
+class ReadBlock:
+    start: int
+    count: int
+    tags: List[Tag] = field(default_factory=list)
+    # Re-read plan for this block's fallback-capable tags (see Tag.fallback_address)
+    fallback: List["ReadBlock"] = field(default_factory=list)
+    decoder: Optional[BlockDecoder] = field(default=None, repr=False)
+
+    @property
+    def end(self) -> int:
+        return self.start + self.count
+
+
+@dataclass
+class ScanGroup:
+    """Tags sharing a scan class, with their own coalesced reads."""
+    name: str
+    interval: Optional[float]       # None = the device's interval
+    max_interval: Optional[float]   # > interval enables adaptive slowdown
+    tags: List[Tag]
+    blocks: List[ReadBlock]
+
+
+@dataclass
+class ReadPlan:
+    tags: List[Tag]          # map order (this is the order of "values"/"raw")
+    blocks: List[ReadBlock]  # coalesced requests for a full read, sorted by address
+    max_gap: int = MAX_GAP
+    groups: List[ScanGroup] = field(default_factory=list)   # per scan class, fastest first
+
+
+def plan_reads(tags: List[Tag], max_gap: int = MAX_GAP,
+               max_count: int = MAX_READ_REGS) -> List[ReadBlock]:
+    """
+    Merge tags into as few read requests as possible.
+    Neighbours are merged while the hole between them is <= max_gap registers
+    and the request stays within max_count registers.
+    """
+    blocks: List[ReadBlock] = []
+    for tag in sorted(tags, key=lambda t: (t.address, t.end)):
+        if tag.count > max_count:
+            raise ValueError(f"tag {tag.name} is wider than one request")
+        cur = blocks[-1] if blocks else None
+        if (cur is not None
+                and tag.address - cur.end <= max_gap
+                and max(cur.end, tag.end) - cur.start <= max_count):
+            cur.count = max(cur.end, tag.end) - cur.start
+            cur.tags.append(tag)
+        else:
+            blocks.append(ReadBlock(start=tag.address, count=tag.count, tags=[tag]))
+
+    for block in blocks:
+        block.decoder = BlockDecoder(block.start, block.count, block.tags)
+        moved = [replace(t, address=t.fallback_address, fallback_address=None)
+                 for t in block.tags if t.fallback_address is not None]
+        if moved:
+            block.fallback = plan_reads(moved, max_gap, max_count)
+    return blocks
+
+
+def _scan_spec(name: str, spec) -> ScanGroup:
+    if isinstance(spec, dict):
+        interval = float(spec["interval"])
+        max_interval = spec.get("max_interval")
+        max_interval = float(max_interval) if max_interval is not None else None
+    else:
+        interval, max_interval = float(spec), None
+    return ScanGroup(name=name, interval=interval, max_interval=max_interval, tags=[], blocks=[])
+
+
+def build_plan(tags: List[Tag], max_gap: int = MAX_GAP,
+               scan_classes: Optional[Dict[str, object]] = None) -> ReadPlan:
+    classes = dict(SCAN_CLASSES if scan_classes is None else scan_classes)
+    groups: Dict[str, ScanGroup] = {}
+    for tag in tags:
+        group = groups.get(tag.scan)
+        if group is None:
+            if tag.scan == DEFAULT_SCAN and tag.scan not in classes:
+                group = ScanGroup(DEFAULT_SCAN, None, None, [], [])
+            elif tag.scan in classes:
+                group = _scan_spec(tag.scan, classes[tag.scan])
+            else:
+                raise ValueError(f"tag {tag.name}: unknown scan class {tag.scan!r}")
+            groups[tag.scan] = group
+        group.tags.append(tag)
+    for group in groups.values():
+        group.blocks = plan_reads(group.tags, max_gap)
+    ordered = sorted(groups.values(), key=lambda g: (g.interval is None, g.interval or 0.0))
+    return ReadPlan(tags=tags, blocks=plan_reads(tags, max_gap), max_gap=max_gap, groups=ordered)
+
+
+# -------- LOADING --------
+def default_tags() -> List[Tag]:
+    """The original hard-coded layout: 125..128 (2 floats) and 428..437 (5 floats, fallback 427)."""
+    tags = [Tag("float1", 125), Tag("float2", 127)]
+    for i in range(5):
+        tags.append(Tag(f"float{i + 3}", 428 + 2 * i, fallback_address=427 + 2 * i))
+    return tags
+
+
+def load_tag_map(path: str = TAG_MAP_FILE) -> ReadPlan:
+    """
+    Build a ReadPlan from a JSON map:
+        {"max_gap": 16, "word_order": "big", "byte_order": "big",
+         "scan_classes": {"fast": 0.2, "slow": {"interval": 30, "max_interval": 120}},
+         "tags": [{"name": "speed", "address": 125, "type": "float32", "scale": 1.0,
+                   "deadband": 0.05, "scan": "fast"}, ...]}
+    Per-tag word_order/byte_order override the map-level defaults; scan_classes
+    extends/overrides SCAN_CLASSES.
+    """
+    if not path:
+        return build_plan(default_tags())
+
+    with open(path) as f:
+        spec = json.load(f)
+
+    max_gap = int(spec.get("max_gap", MAX_GAP))
+    defaults = {k: spec[k] for k in ("word_order", "byte_order") if k in spec}
+    tags: List[Tag] = []
+    seen = set()
+    for entry in spec["tags"]:
+        tag = Tag(**{**defaults, **entry})
+        if tag.name in seen:
+            raise ValueError(f"duplicate tag name in {path}: {tag.name}")
+        seen.add(tag.name)
+        tags.append(tag)
+    return build_plan(tags, max_gap, {**SCAN_CLASSES, **spec.get("scan_classes", {})})
+
+
+_plans: Dict[str, ReadPlan] = {}
+
+
+def get_plan(path: Optional[str] = None) -> ReadPlan:
+    """Cached plan for a map file ("" / None = the default map)."""
+    key = path or TAG_MAP_FILE
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans[key] = load_tag_map(key)
+    return plan
@@ -0,0 +1,115 @@
+# backend/modbus_reader/service.py
+"""
+Standalone poller service (manage.py run_poller).
+Devices are sharded across worker processes, each running the asyncio engine over
+its slice, so decode work spreads over cores and PLC traffic no longer scales with
+the number of web workers. Shards hand every snapshot to the parent over a queue;
+the parent sequences change events, writes history once and feeds the web workers
+through the ipc socket (and the shared-memory segment when that backend is on).
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+from typing import List, Optional
+
+from . import metrics
+from .aio_poller import MAX_CONCURRENCY, run_forever
+from .alarms import alarms
+from .changes import detector
+from .devices import Device, shard_devices
+from .history import history
+from .ipc import POLLER_SOCKET, SnapshotHub
+from .poller import SNAPSHOT_BACKEND
+from .production import production
+from .shm import SegmentWriter
+from .snapshot import store
+
+# -------- CONFIG --------
+SHARDS        = int(os.getenv("MODBUS_POLLER_SHARDS", "0"))   # 0 = one per CPU core
+RESTART_DELAY = 2.0                                            # seconds before a crashed shard is respawned
+
+
+def _shard_main(index: int, devices: List[Device], queue, max_concurrency: int,
+                metrics_port: Optional[int]):
+    """Entry point of one shard process."""
+    store.subscribe(queue.put)
+    if metrics_port:
+        metrics.start_http_server(metrics_port)
+    print(f"[Service] shard {index}: {len(devices)} devices (pid {os.getpid()})")
+    run_forever(devices, max_concurrency)
+
+
+class PollerService:
+    def __init__(self, devices: List[Device], shards: int = SHARDS,
+                 max_concurrency: int = MAX_CONCURRENCY, socket_path: str = POLLER_SOCKET,
+                 metrics_port: Optional[int] = None):
+        shards = shards or os.cpu_count() or 1
+        self.shards = shard_devices(devices, min(shards, len(devices)))
+        self.max_concurrency = max_concurrency
+        self.metrics_port = metrics_port
+        self.hub = SnapshotHub(socket_path)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._queue = self._ctx.Queue()
+        self._procs: List[Optional[multiprocessing.Process]] = [None] * len(self.shards)
+
+    def _spawn(self, i: int):
+        port = self.metrics_port + 1 + i if self.metrics_port else None
+        proc = self._ctx.Process(target=_shard_main, name=f"poller-shard-{i}", daemon=True,
+                                 args=(i, self.shards[i], self._queue, self.max_concurrency, port))
+        proc.start()
+        self._procs[i] = proc
+
+    def _drain(self):
+        """Shard snapshots -> global change seq -> local store (history + hub listeners)."""
+        while True:
+            snap = self._queue.get()
+            device, ts = snap["device"], snap["ts"]
+            seq = detector.record(device, snap.get("changes") or {}, ts)
+            store.publish({**snap, "change_seq": seq}, device=device, ts=ts)
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(RESTART_DELAY)
+            for i, proc in enumerate(self._procs):
+                if proc is not None and not proc.is_alive():
+                    print(f"[Service] shard {i} exited with {proc.exitcode}; restarting")
+                    self._spawn(i)
+
+    async def _main(self):
+        await asyncio.gather(self.hub.serve(), self._supervise())
+
+    def run(self):
+        store.subscribe(history.record)
+        production.restore()
+        store.subscribe(production.observe)
+        store.subscribe(self.hub.notify)
+        store.subscribe(alarms.observe)      # once per host; workers ingest the events
+        alarms.sink = self.hub.send
+        if SNAPSHOT_BACKEND == "shm":
+            store.subscribe(SegmentWriter().write)
+        history.start()
+        production.start()
+        if self.metrics_port:
+            metrics.start_http_server(self.metrics_port)
+        threading.Thread(target=self._drain, name="shard-drain", daemon=True).start()
+        for i in range(len(self.shards)):
+            self._spawn(i)
+        print(f"[Service] {sum(map(len, self.shards))} devices across {len(self.shards)} shards")
+
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            asyncio.run(self._main())
+        finally:
+            for proc in self._procs:
+                if proc is not None and proc.is_alive():
+                    proc.terminate()
+            for proc in self._procs:
+                if proc is not None:
+                    proc.join(timeout=5)
+            history.flush()
+            production.checkpoint()
+            if os.path.exists(self.hub.path):
+                os.unlink(self.hub.path)
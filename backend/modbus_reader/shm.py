@@ -0,0 +1,275 @@
+# backend/modbus_reader/shm.py
+"""
+Latest snapshot per device in a fixed-layout shared memory file (mmap).
+One writer (the poller service) owns the file; every web worker maps it read-only
+and serves /status/ straight from it, with no socket round trip and no per-worker
+copy of the data.
+
+Status only: a slot holds the latest snapshot, so a reader polling it would miss
+whatever was overwritten in between. The change log, alarms, history and SSE
+follow the ipc socket feed, which delivers every snapshot.
+
+Layout: header | directory (device names) | slots. Each slot is guarded by a
+seqlock: the writer makes the slot seq odd, writes, then makes it even again; a
+reader retries until it sees the same even seq before and after copying.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# -------- CONFIG --------
+SHM_PATH       = os.getenv("MODBUS_SNAPSHOT_SHM", "/dev/shm/binaiot-snapshots")
+MAX_DEVICES    = int(os.getenv("MODBUS_SHM_DEVICES", "256"))
+MAX_TAGS       = int(os.getenv("MODBUS_SHM_TAGS", "256"))       # per device
+MAX_RAW        = int(os.getenv("MODBUS_SHM_RAW", "1024"))       # registers per device
+SCHEMA_BYTES   = 8192                                           # JSON list of tag names per slot
+NAME_BYTES     = 64
+READ_RETRIES   = 100
+
+MAGIC, VERSION = 0x42494E41, 1
+_HEADER = struct.Struct("<IHHHHIIQI")   # magic, version, devices, tags, raw, schema bytes, slot size, epoch, dir gen
+# slot seq, ts, snapshot seq, change seq, schema gen, tag count, raw count, schema length
+_SLOT = struct.Struct("<QdQQIHHI")
+
+NONE, FLOAT, INT = 0, 1, 2
+
+
+@lru_cache(maxsize=None)
+def _array(code: str, n: int) -> struct.Struct:
+    """Unpacks only the used part of a slot's fixed-size array."""
+    return struct.Struct(f"<{n}{code}")
+
+
+class _Layout:
+    def __init__(self, devices: int, tags: int, raw: int):
+        self.devices, self.tags, self.raw = devices, tags, raw
+        self.values = struct.Struct(f"<{tags}d")
+        self.kinds = struct.Struct(f"<{tags}B")
+        self.changed = struct.Struct(f"<{tags}B")
+        self.regs = struct.Struct(f"<{raw}i")
+        self.schema_at = _SLOT.size
+        self.values_at = self.schema_at + SCHEMA_BYTES
+        self.kinds_at = self.values_at + self.values.size
+        self.changed_at = self.kinds_at + self.kinds.size
+        self.regs_at = self.changed_at + self.changed.size
+        self.slot_size = (self.regs_at + self.regs.size + 7) // 8 * 8
+        self.dir_at = _HEADER.size
+        self.slots_at = (self.dir_at + devices * NAME_BYTES + 63) // 64 * 64
+        self.size = self.slots_at + devices * self.slot_size
+
+    def slot(self, i: int) -> int:
+        return self.slots_at + i * self.slot_size
+
+
+class SegmentWriter:
+    """Snapshot-store listener that mirrors every publish into the segment."""
+
+    def __init__(self, path: str = SHM_PATH, devices: int = MAX_DEVICES,
+                 tags: int = MAX_TAGS, raw: int = MAX_RAW):
+        self.path = path
+        self.layout = _Layout(devices, tags, raw)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, self.layout.size)
+            self._buf = mmap.mmap(fd, self.layout.size)
+        finally:
+            os.close(fd)
+        self._lock = threading.Lock()
+        self._slots: Dict[str, int] = {}
+        self._schemas: Dict[int, Tuple[List[str], int, int]] = {}   # slot -> (names, gen, length)
+        self._warned = set()
+        self._buf[:] = bytes(self.layout.size)
+        self._epoch = time.time_ns()
+        self._dir_gen = 0
+        self._write_header()
+
+    def _write_header(self):
+        lay = self.layout
+        _HEADER.pack_into(self._buf, 0, MAGIC, VERSION, lay.devices, lay.tags, lay.raw,
+                          SCHEMA_BYTES, lay.slot_size, self._epoch, self._dir_gen)
+
+    def _slot_for(self, device: str) -> Tuple[Optional[int], bool]:
+        i = self._slots.get(device)
+        if i is not None:
+            return i, False
+        if len(self._slots) >= self.layout.devices:
+            self._warn(device, f"segment full ({self.layout.devices} devices)")
+            return None, False
+        i = self._slots[device] = len(self._slots)
+        return i, True
+
+    def _publish_name(self, device: str, i: int):
+        """Directory entry goes in after the slot's first write, so readers never see an empty slot."""
+        off = self.layout.dir_at + i * NAME_BYTES
+        self._buf[off:off + NAME_BYTES] = device.encode()[:NAME_BYTES].ljust(NAME_BYTES, b"\0")
+        self._dir_gen += 1
+        self._write_header()
+
+    def _warn(self, device: str, why: str):
+        if device not in self._warned:
+            self._warned.add(device)
+            print(f"[SHM] {device}: {why}; extra data not shared")
+
+    def write(self, snap: Dict[str, object]):
+        lay, buf = self.layout, self._buf
+        device = snap["device"]
+        tags: Dict[str, object] = snap.get("tags") or {}
+        raw: List[Optional[int]] = snap.get("raw") or []
+        changes = snap.get("changes") or {}
+        names = list(tags)
+        if len(names) > lay.tags or len(raw) > lay.raw:
+            self._warn(device, f"{len(names)} tags / {len(raw)} registers exceed the slot")
+            names, raw = names[:lay.tags], raw[:lay.raw]
+
+        values, kinds, changed = [0.0] * lay.tags, [NONE] * lay.tags, [0] * lay.tags
+        for j, name in enumerate(names):
+            v = tags[name]
+            if isinstance(v, int) and not isinstance(v, bool):
+                values[j], kinds[j] = float(v), INT
+            elif isinstance(v, float):
+                values[j], kinds[j] = v, FLOAT
+            if name in changes:
+                changed[j] = 1
+        regs = [-1 if r is None else r for r in raw] + [-1] * (lay.raw - len(raw))
+
+        with self._lock:
+            i, new = self._slot_for(device)
+            if i is None:
+                return
+            off = lay.slot(i)
+            schema = self._schemas.get(i)
+            schema_bytes = None
+            if schema is None or schema[0] != names:
+                schema_bytes = json.dumps(names).encode()
+                if len(schema_bytes) > SCHEMA_BYTES:
+                    self._warn(device, "tag names exceed the schema area")
+                    return
+                schema = self._schemas[i] = (names, (schema[1] + 1) if schema else 1, len(schema_bytes))
+
+            seq = struct.unpack_from("<Q", buf, off)[0]
+            struct.pack_into("<Q", buf, off, seq + 1)          # odd: write in progress
+            if schema_bytes is not None:
+                buf[off + lay.schema_at:off + lay.schema_at + len(schema_bytes)] = schema_bytes
+            lay.values.pack_into(buf, off + lay.values_at, *values)
+            lay.kinds.pack_into(buf, off + lay.kinds_at, *kinds)
+            lay.changed.pack_into(buf, off + lay.changed_at, *changed)
+            lay.regs.pack_into(buf, off + lay.regs_at, *regs)
+            _SLOT.pack_into(buf, off, seq + 1, snap["ts"], snap["seq"], snap.get("change_seq", 0),
+                            schema[1], len(names), len(raw), schema[2])
+            struct.pack_into("<Q", buf, off, seq + 2)          # even: consistent again
+            if new:
+                self._publish_name(device, i)
+
+    def close(self):
+        self._buf.close()
+
+
+class SegmentReader:
+    """Read-only view of a segment; get()/devices() match SnapshotStore."""
+
+    def __init__(self, path: str = SHM_PATH):
+        self.path = path
+        self._buf: Optional[mmap.mmap] = None
+        self.layout: Optional[_Layout] = None
+        self._epoch = self._dir_gen = -1
+        self._slots: Dict[str, int] = {}
+        self._schemas: Dict[int, Tuple[int, List[str]]] = {}   # slot -> (schema gen, names)
+        self._lock = threading.Lock()                          # only taken to (re)map
+
+    def _attach(self) -> bool:
+        buf = self._buf
+        if buf is not None and _HEADER.unpack_from(buf, 0)[7:] == (self._epoch, self._dir_gen):
+            return True
+        with self._lock:
+            return self._remap()
+
+    def _remap(self) -> bool:
+        if self._buf is None:
+            try:
+                fd = os.open(self.path, os.O_RDONLY)
+            except FileNotFoundError:
+                return False
+            try:
+                size = os.fstat(fd).st_size
+                if size < _HEADER.size:
+                    return False
+                self._buf = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+        magic, version, devices, tags, raw, _, _, epoch, dir_gen = _HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION:
+            return False
+        if epoch != self._epoch:                  # writer restarted: new layout / slot order
+            self.layout = _Layout(devices, tags, raw)
+            if self.layout.size > len(self._buf):
+                self._buf = None                  # grew; remap next time (old map closes when unused)
+                return False
+            self._epoch, self._dir_gen = epoch, -1
+            self._schemas.clear()
+        if dir_gen != self._dir_gen:
+            slots = {}
+            for i in range(self.layout.devices):
+                off = self.layout.dir_at + i * NAME_BYTES
+                name = bytes(self._buf[off:off + NAME_BYTES]).rstrip(b"\0")
+                if not name:
+                    break
+                slots[name.decode(errors="replace")] = i
+            self._slots, self._dir_gen = slots, dir_gen   # swap, so request threads never see it half-built
+        return True
+
+    def devices(self) -> List[str]:
+        return list(self._slots) if self._attach() else []
+
+    def get(self, device: str) -> Optional[Dict[str, object]]:
+        if not self._attach():
+            return None
+        i = self._slots.get(device)
+        return None if i is None else self._read(device, i)
+
+    def _read(self, device: str, i: int) -> Optional[Dict[str, object]]:
+        lay, buf = self.layout, self._buf
+        off = lay.slot(i)
+        for _ in range(READ_RETRIES):
+            head = _SLOT.unpack_from(buf, off)
+            if head[0] == 0:
+                return None
+            if head[0] & 1:
+                time.sleep(0)                     # writer is mid-update
+                continue
+            _, ts, seq, change_seq, gen, n_tags, n_raw, schema_len = head
+            cached = self._schemas.get(i)
+            names = cached[1] if cached and cached[0] == gen else None
+            schema = None if names else bytes(buf[off + lay.schema_at:off + lay.schema_at + schema_len])
+            values = _array("d", n_tags).unpack_from(buf, off + lay.values_at)
+            kinds = _array("B", n_tags).unpack_from(buf, off + lay.kinds_at)
+            changed = _array("B", n_tags).unpack_from(buf, off + lay.changed_at)
+            regs = _array("i", n_raw).unpack_from(buf, off + lay.regs_at)
+            if struct.unpack_from("<Q", buf, off)[0] != head[0]:
+                continue                          # torn read; the writer was mid-update
+            if names is None:
+                names = json.loads(schema)
+                self._schemas[i] = (gen, names)
+            break
+        else:
+            return None
+
+        tags: Dict[str, object] = {}
+        for name, v, kind in zip(names, values, kinds):
+            tags[name] = None if kind == NONE else int(v) if kind == INT else v
+        return {
+            "float1": tags.get("float1"),
+            "float2": tags.get("float2"),
+            "values": list(tags.values()),
+            "raw": [None if r < 0 else r for r in regs],
+            "tags": tags,
+            "changes": {n: tags[n] for n, c in zip(names, changed) if c},
+            "change_seq": change_seq,
+            "device": device,
+            "seq": seq,
+            "ts": ts,
+        }
@@ -0,0 +1,97 @@
+# backend/modbus_reader/snapshot.py
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_DEVICE = "default"
+
+
+class SnapshotStore:
+    """
+    Latest poll result per device.
+    Written by the background poller, read by the HTTP views (never touches the PLC).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, Dict[str, object]] = {}
+        self._seq = 0
+        self._listeners: List[Callable[[Dict[str, object]], None]] = []
+        self._source = None   # read-through source (shm.SegmentReader) for web workers
+
+    def subscribe(self, callback: Callable[[Dict[str, object]], None]):
+        """Call `callback(snapshot)` after every publish (on the poller's thread; keep it quick)."""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def publish(self, values: Dict[str, object], device: str = DEFAULT_DEVICE,
+                ts: Optional[float] = None) -> Dict[str, object]:
+        """Store a copy of `values` as the newest snapshot for `device`."""
+        snap = dict(values)
+        with self._lock:
+            self._seq += 1
+            snap["device"] = device
+            snap["seq"] = self._seq
+            snap["ts"] = time.time() if ts is None else ts
+            self._snapshots[device] = snap
+        self.notify(snap)
+        return snap
+
+    def ingest(self, snap: Dict[str, object]) -> Dict[str, object]:
+        """
+        Store a snapshot that was already sequenced elsewhere (the poller service),
+        keeping its device/seq/ts as-is. With a source attached only the listeners run.
+        """
+        if self._source is None:
+            with self._lock:
+                self._seq = max(self._seq, snap["seq"])
+                self._snapshots[snap["device"]] = snap
+        self.notify(snap)
+        return snap
+
+    def notify(self, snap: Dict[str, object]):
+        """Run the listeners for a snapshot without storing it."""
+        for callback in self._listeners:
+            try:
+                callback(snap)
+            except Exception as e:
+                print("[Snapshot] listener failed:", repr(e))
+                traceback.print_exc()
+
+    def attach(self, source):
+        """Serve get()/devices() from `source` (e.g. a shared-memory segment) instead of this process."""
+        self._source = source
+
+    def get(self, device: str = DEFAULT_DEVICE) -> Optional[Dict[str, object]]:
+        """Newest snapshot for `device` (or None if nothing was polled yet)."""
+        if self._source is not None:
+            return self._source.get(device)
+        with self._lock:
+            return self._snapshots.get(device)
+
+    def devices(self):
+        if self._source is not None:
+            return self._source.devices()
+        with self._lock:
+            return list(self._snapshots)
+
+
+store = SnapshotStore()
+
+
+def with_age(snap: Optional[Dict[str, object]], stale_after: float,
+             now: Optional[float] = None) -> Dict[str, object]:
+    """
+    Copy of a snapshot with "age" (seconds) and "stale" added.
+    A missing snapshot comes back as stale with ts/age = None.
+    """
+    now = time.time() if now is None else now
+    if snap is None:
+        return {"float1": None, "float2": None, "values": [], "raw": [],
+                "seq": 0, "ts": None, "age": None, "stale": True}
+    out = dict(snap)
+    age = max(0.0, now - snap["ts"])
+    out["age"] = round(age, 3)
+    out["stale"] = age > stale_after
+    return out
@@ -0,0 +1,211 @@
+# backend/modbus_reader/spool.py
+"""
+Bounded on-disk write-ahead spool: store-and-forward between the poll stream and
+a sink that may be slow or down (the history database).
+
+Records are opaque byte strings appended to segment files <id>.seg, each framed as
+[u32 length][u32 crc32][payload]. fsync is batched (at most every FSYNC_INTERVAL
+seconds, and when a segment is rotated). A drainer read()s from its cursor, writes
+the records to the sink and ack()s the position; fully drained segments are
+deleted. When the spool outgrows MAX_BYTES the oldest segments are dropped, drained
+or not - that is the retention limit, everything within it survives an outage or
+a restart (a torn record at the tail of the last segment is cut off on open).
+"""
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import List, Tuple
+
+# -------- CONFIG --------
+SEGMENT_BYTES  = int(float(os.getenv("MODBUS_SPOOL_SEGMENT_MB", "4")) * 1024 * 1024)
+MAX_BYTES      = int(float(os.getenv("MODBUS_SPOOL_MAX_MB", "256")) * 1024 * 1024)
+FSYNC_INTERVAL = float(os.getenv("MODBUS_SPOOL_FSYNC", "1.0"))   # seconds; 0 = fsync every append
+
+FRAME = struct.Struct("<II")   # length, crc32
+Position = Tuple[int, int]     # (segment id, offset)
+
+
+class Spool:
+    def __init__(self, path: str, segment_bytes: int = SEGMENT_BYTES, max_bytes: int = MAX_BYTES,
+                 fsync_interval: float = FSYNC_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_bytes = max(4096, min(segment_bytes, max_bytes // 4))   # keep >= 4 segments
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._sizes: List[List[int]] = []        # [[segment id, bytes], ...] oldest first
+        self._file = None                        # active (last) segment, opened for append
+        self._cursor: Position = (0, 0)
+        self._unsynced = False
+        self._last_sync = 0.0
+        self.evicted_bytes = 0
+        self.appended = 0
+
+    # ---- files ----
+    def _seg_path(self, seg: int) -> str:
+        return os.path.join(self.path, f"{seg:016d}.seg")
+
+    def _open(self):
+        """Called with the lock held: scan the directory once, recover the tail, load the cursor."""
+        if self._file is not None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        segs = sorted(int(n[:-4]) for n in os.listdir(self.path) if n.endswith(".seg") and n[:-4].isdigit())
+        self._sizes = [[seg, os.path.getsize(self._seg_path(seg))] for seg in segs]
+        if not self._sizes:
+            self._sizes = [[1, 0]]
+        else:
+            self._recover_tail()
+        try:
+            with open(os.path.join(self.path, "cursor")) as f:
+                saved = json.load(f)
+            self._cursor = (int(saved["segment"]), int(saved["offset"]))
+        except (OSError, ValueError, KeyError):
+            self._cursor = (self._sizes[0][0], 0)
+        if self._cursor < (self._sizes[0][0], 0):
+            self._cursor = (self._sizes[0][0], 0)
+        self._file = open(self._seg_path(self._sizes[-1][0]), "ab")
+
+    def _recover_tail(self):
+        """Cut a record torn by a crash off the end of the last segment."""
+        seg, size = self._sizes[-1]
+        good = 0
+        with open(self._seg_path(seg), "rb") as f:
+            data = f.read()
+        while good + FRAME.size <= len(data):
+            length, crc = FRAME.unpack_from(data, good)
+            end = good + FRAME.size + length
+            if end > len(data) or zlib.crc32(data[good + FRAME.size:end]) != crc:
+                break
+            good = end
+        if good != size:
+            print(f"[Spool] {self._seg_path(seg)}: dropped {size - good} bytes of torn tail")
+            with open(self._seg_path(seg), "r+b") as f:
+                f.truncate(good)
+            self._sizes[-1][1] = good
+
+    def _sync(self):
+        if self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = False
+        self._last_sync = time.monotonic()
+
+    def _rotate(self):
+        self._sync()
+        self._file.close()
+        seg = self._sizes[-1][0] + 1
+        self._sizes.append([seg, 0])
+        self._file = open(self._seg_path(seg), "ab")
+
+    def _evict(self):
+        total = sum(size for _, size in self._sizes)
+        while total + self.segment_bytes > self.max_bytes and len(self._sizes) > 1:   # room for the new one
+            seg, size = self._sizes.pop(0)
+            os.unlink(self._seg_path(seg))
+            total -= size
+            if self._cursor[0] <= seg:
+                lost = size - (self._cursor[1] if self._cursor[0] == seg else 0)
+                self.evicted_bytes += lost
+                print(f"[Spool] {self.max_bytes} byte limit: dropped {lost} undrained bytes (segment {seg})")
+                self._cursor = (self._sizes[0][0], 0)
+
+    # ---- writing ----
+    def append(self, payload: bytes):
+        """Append one record; it is on disk after the next batched fsync (see sync())."""
+        frame = FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            self._open()
+            if self._sizes[-1][1] and self._sizes[-1][1] + len(frame) > self.segment_bytes:
+                self._rotate()
+                self._evict()
+            self._file.write(frame)
+            self._sizes[-1][1] += len(frame)
+            self._unsynced = True
+            self.appended += 1
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    # ---- draining ----
+    def read(self, max_bytes: int = 1024 * 1024) -> Tuple[List[bytes], Position]:
+        """Records after the cursor (about `max_bytes` of them) and the position to ack() after."""
+        with self._lock:
+            self._open()
+            self._file.flush()   # written but not yet fsynced is still readable
+            segments = [tuple(s) for s in self._sizes if s[0] >= self._cursor[0]]
+            pos = self._cursor
+        records: List[bytes] = []
+        taken = 0
+        for seg, size in segments:
+            offset = pos[1] if seg == pos[0] else 0
+            if offset >= size:
+                continue
+            try:
+                with open(self._seg_path(seg), "rb") as f:
+                    f.seek(offset)
+                    data = f.read(size - offset)
+            except FileNotFoundError:   # evicted meanwhile; ack() skips past it
+                return records, pos
+            at = 0
+            while at + FRAME.size <= len(data) and (taken < max_bytes or not records):
+                length, crc = FRAME.unpack_from(data, at)
+                end = at + FRAME.size + length
+                if end > len(data):
+                    break
+                payload = data[at + FRAME.size:end]
+                if zlib.crc32(payload) != crc:
+                    print(f"[Spool] segment {seg}: bad record at {offset + at}, skipping the rest")
+                    at = size - offset
+                    break
+                records.append(payload)
+                taken += end - at
+                at = end
+            pos = (seg, offset + at)
+            if taken >= max_bytes or offset + at < size:
+                break
+        return records, pos
+
+    def ack(self, pos: Position):
+        """Everything before `pos` reached the sink: move the cursor, delete drained segments."""
+        with self._lock:
+            if pos <= self._cursor:
+                return
+            self._cursor = pos
+            while len(self._sizes) > 1 and self._sizes[0][0] < pos[0]:
+                os.unlink(self._seg_path(self._sizes.pop(0)[0]))
+            if len(self._sizes) > 1 and pos == tuple(self._sizes[0]):   # finished a closed segment
+                os.unlink(self._seg_path(self._sizes.pop(0)[0]))
+                self._cursor = (self._sizes[0][0], 0)
+            tmp = os.path.join(self.path, "cursor.tmp")
+            with open(tmp, "w") as f:
+                json.dump({"segment": self._cursor[0], "offset": self._cursor[1]}, f)
+            os.replace(tmp, os.path.join(self.path, "cursor"))   # replays after a crash are idempotent
+
+    def backlog(self) -> int:
+        """Bytes appended but not drained yet."""
+        with self._lock:
+            if self._file is None:
+                return 0
+            return sum(size - (self._cursor[1] if seg == self._cursor[0] else 0)
+                       for seg, size in self._sizes if seg >= self._cursor[0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            segments, size = len(self._sizes), sum(s for _, s in self._sizes)
+        return {"segments": segments, "bytes": size, "backlog": self.backlog(),
+                "evicted_bytes": self.evicted_bytes}
@@ -0,0 +1,162 @@
+# backend/modbus_reader/stream.py
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from .breaker import CLOSED, board
+from .poller import STALE_AFTER
+from .snapshot import store, with_age
+
+# -------- CONFIG --------
+# With no change for this long an "age" frame goes out: it keeps proxies from closing
+# the socket and tells the UI how old its values are (stale while the PLC is down).
+KEEPALIVE = min(float(os.getenv("MODBUS_STREAM_KEEPALIVE", "15")), STALE_AFTER)
+# Under WSGI a stream holds a worker (thread) for as long as the tab is open, so by default
+# /status/stream/ answers 204 there and clients poll /status/ instead. Set to 1 for
+# threaded workers (gunicorn --threads) with threads to spare.
+STREAM_WSGI = os.getenv("MODBUS_STREAM_WSGI", "0") in ("1", "true", "yes")
+
+
+class Subscriber:
+    def __init__(self, device: str, loop: Optional[asyncio.AbstractEventLoop]):
+        self.device = device
+        self.loop = loop   # None = a WSGI stream waiting on a threading.Event
+        self.event = asyncio.Event() if loop is not None else threading.Event()
+
+
+class Broadcaster:
+    """
+    Fans poller snapshots out to every open stream.
+    notify() runs on the poller thread; it only wakes subscribers of that device,
+    and only when the change detector reported something.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: Set[Subscriber] = set()
+
+    def add(self, device: str, threaded: bool = False) -> Subscriber:
+        sub = Subscriber(device, None if threaded else asyncio.get_running_loop())
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def remove(self, sub: Subscriber):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+    def notify(self, snap: Dict[str, object]):
+        """Snapshot-store listener."""
+        if not snap.get("changes"):
+            return
+        device = snap["device"]
+        with self._lock:
+            subs = [s for s in self._subs if s.device == device]
+        for sub in subs:
+            if sub.loop is None:
+                sub.event.set()
+                continue
+            try:
+                sub.loop.call_soon_threadsafe(sub.event.set)
+            except RuntimeError:   # that client's loop is gone
+                self.remove(sub)
+
+
+broadcaster = Broadcaster()
+
+
+def _diff(new: Dict[str, object], old: Dict[str, object]) -> Optional[Dict[str, object]]:
+    """Changed tags and raw indexes between two snapshots (None if nothing changed)."""
+    old_tags = old.get("tags") or {}
+    tags = {k: v for k, v in (new.get("tags") or {}).items() if k not in old_tags or old_tags[k] != v}
+    old_raw = old.get("raw") or []
+    new_raw = new.get("raw") or []
+    raw = {i: v for i, v in enumerate(new_raw) if i >= len(old_raw) or old_raw[i] != v}
+    if not tags and not raw:
+        return None
+    return {"seq": new["seq"], "ts": new["ts"], "tags": tags, "raw": raw}
+
+
+def _frame(event: str, seq: int, payload: Dict[str, object]) -> str:
+    return f"id: {seq}\nevent: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+def _with_health(device: str, snap: Optional[Dict[str, object]]) -> Dict[str, object]:
+    """with_age(), and stale at once while the device's circuit is open (as /status/ does)."""
+    out = with_age(snap, STALE_AFTER)
+    breaker = board.for_device(device)   # known when this process runs the poller
+    if breaker is not None and breaker.state != CLOSED:
+        out["stale"] = True
+    return out
+
+
+def _age_frame(device: str, snap: Optional[Dict[str, object]]) -> str:
+    """Heartbeat: how old the client's values are, sent while nothing changes."""
+    out = _with_health(device, snap)
+    return _frame("age", out["seq"], {"seq": out["seq"], "ts": out["ts"],
+                                      "age": out["age"], "stale": out["stale"]})
+
+
+def _next_frame(snap: Optional[Dict[str, object]], last: Optional[Dict[str, object]],
+                delta: bool) -> Tuple[Optional[str], Optional[Dict[str, object]]]:
+    """(frame to send or None, snapshot the client now has)."""
+    if snap is None or (last is not None and snap["seq"] == last["seq"]):
+        return None, last
+    if last is None:
+        return _frame("snapshot", snap["seq"], _with_health(snap["device"], snap)), snap
+    changes = _diff(snap, last)
+    if changes is None:
+        return None, last
+    if delta:
+        return _frame("delta", snap["seq"], changes), snap
+    return _frame("snapshot", snap["seq"], _with_health(snap["device"], snap)), snap
+
+
+async def snapshot_events(device: str, delta: bool = False):
+    """
+    Server-Sent Events for one device.
+    First frame is the full snapshot ("snapshot", with age/stale); afterwards a frame
+    is sent only when values change - the full snapshot, or with delta=True just the
+    changed tags/raw indexes ("delta"). After KEEPALIVE seconds without one, an "age"
+    frame reports the age/stale of the latest snapshot.
+    """
+    sub = broadcaster.add(device)
+    last = None
+    try:
+        snap = store.get(device)
+        while True:
+            frame, last = _next_frame(snap, last, delta)
+            if frame is not None:
+                yield frame
+            try:
+                await asyncio.wait_for(sub.event.wait(), KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield _age_frame(device, store.get(device))
+            sub.event.clear()
+            snap = store.get(device)
+    finally:
+        broadcaster.remove(sub)
+
+
+def snapshot_events_sync(device: str, delta: bool = False):
+    """snapshot_events() for WSGI: the same frames, the worker thread blocks between them."""
+    sub = broadcaster.add(device, threaded=True)
+    last = None
+    try:
+        snap = store.get(device)
+        while True:
+            frame, last = _next_frame(snap, last, delta)
+            if frame is not None:
+                yield frame
+            if not sub.event.wait(KEEPALIVE):
+                yield _age_frame(device, store.get(device))
+            sub.event.clear()
+            snap = store.get(device)
+    finally:
+        broadcaster.remove(sub)
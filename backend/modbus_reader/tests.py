@@ -0,0 +1,1586 @@
+import asyncio
+import contextlib
+import dataclasses
+import io
+import json
+import itertools
+import os
+import random
+import selectors
+import shutil
+import socket
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase
+
+from . import aio_poller, connections, encoding, export, ipc, metrics, modbus_utils, poller, probe, shm, stream, transports
+from .aio_poller import AsyncPoller, Scan
+from .alarms import AlarmEngine, Rule
+from .breaker import CLOSED, HALF_OPEN, OPEN, PROBE_TIMEOUT, CircuitBreaker, board
+from .changes import ChangeDetector
+from .connections import ConnectionManager, ConnectionUnavailable, TransportUnsupported, check_tcp
+from .decode import TYPES, BlockDecoder, decode_array, encode_value
+from .management.commands.probe_registers import _reader
+from .devices import Device
+from .history import HistoryStore
+from .modbus_utils import MAX_WRITE_REGS, _rounds, plan_verify, plan_writes, write_batch
+from .production import RESET_GRACE, CounterSpec, ProductionAggregator
+from .register_map import MAX_READ_REGS, ScanGroup, Tag, build_plan, default_tags, load_tag_map, plan_reads
+from .snapshot import SnapshotStore, store, with_age
+from .spool import FRAME, Spool
+from .transports import BusQueue, PacedClient, SerialLine
+
+
+class FakeTcpClient:
+    """Stands in for pymodbus' ModbusTcpClient; `refuse` makes connect() fail."""
+    made = []
+    refuse = False
+
+    def __init__(self, host, port=502, timeout=1.0):
+        self.host, self.port, self.connected = host, port, False
+        FakeTcpClient.made.append(self)
+
+    def connect(self):
+        self.connected = not FakeTcpClient.refuse
+        return self.connected
+
+    def close(self):
+        self.connected = False
+
+
+class SnapshotStoreTests(SimpleTestCase):
+    def test_publish_sequences_and_notifies(self):
+        s = SnapshotStore()
+        seen = []
+        s.subscribe(seen.append)
+        first = s.publish({"float1": 1.0}, device="a", ts=10.0)
+        second = s.publish({"float1": 2.0}, device="b")
+        self.assertEqual((first["seq"], second["seq"]), (1, 2))
+        self.assertEqual(s.get("a")["float1"], 1.0)
+        self.assertEqual(sorted(s.devices()), ["a", "b"])
+        self.assertEqual([snap["device"] for snap in seen], ["a", "b"])
+
+    def test_with_age_flags_old_and_missing_snapshots(self):
+        self.assertFalse(with_age({"ts": 100.0, "seq": 1}, 5.0, now=102.0)["stale"])
+        self.assertTrue(with_age({"ts": 100.0, "seq": 1}, 5.0, now=106.0)["stale"])
+        missing = with_age(None, 5.0)
+        self.assertTrue(missing["stale"])
+        self.assertIsNone(missing["ts"])
+
+
+class StatusViewTests(SimpleTestCase):
+    def test_served_from_the_snapshot_without_touching_the_plc(self):
+        store.publish({"float1": 1.5, "float2": 2.5, "values": [1.5, 2.5], "raw": [1, 2]},
+                      device="t001-live")
+        with mock.patch("modbus_reader.connections.ConnectionManager.session",
+                        side_effect=AssertionError("the view dialed the PLC")):
+            body = self.client.get("/status/", {"device": "t001-live"}).json()
+        self.assertEqual((body["float1"], body["float2"]), (1.5, 2.5))
+        self.assertFalse(body["stale"])
+
+    def test_old_snapshot_is_stale(self):
+        store.publish({"float1": 1.0}, device="t001-old", ts=time.time() - 3600)
+        self.assertTrue(self.client.get("/status/", {"device": "t001-old"}).json()["stale"])
+
+    def test_device_never_polled(self):
+        body = self.client.get("/status/", {"device": "t001-none"}).json()
+        self.assertTrue(body["stale"])
+        self.assertIsNone(body["ts"])
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        FakeTcpClient.made, FakeTcpClient.refuse = [], False
+        patcher = mock.patch("pymodbus.client.ModbusTcpClient", FakeTcpClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = ConnectionManager()
+
+    def test_sessions_share_one_socket(self):
+        for _ in range(3):
+            with self.pool.session("10.2.0.1", 502, 1) as client:
+                self.assertTrue(client.connected)
+        self.assertEqual(len(FakeTcpClient.made), 1)
+
+    def test_reconnects_after_the_socket_dropped(self):
+        with self.pool.session("10.2.0.2", 502, 1) as client:
+            client.connected = False       # peer closed it
+        with self.pool.session("10.2.0.2", 502, 1) as client:
+            self.assertTrue(client.connected)
+        self.assertEqual(len(FakeTcpClient.made), 2)
+
+    def test_an_error_inside_the_session_drops_the_socket(self):
+        with self.assertRaises(IOError):
+            with self.pool.session("10.2.0.3", 502, 1) as client:
+                raise IOError("timeout")
+        self.assertFalse(client.connected)
+        self.assertIsNone(self.pool.get("10.2.0.3", 502, 1).client)
+
+    def test_connect_failure_raises_connection_unavailable(self):
+        FakeTcpClient.refuse = True
+        with self.assertRaises(ConnectionUnavailable):
+            with self.pool.session("10.2.0.4", 502, 1):
+                pass
+
+
+class _JumpSelector(selectors.SelectSelector):
+    def __init__(self, loop):
+        super().__init__()
+        self.loop = loop
+
+    def select(self, timeout=None):
+        if timeout:
+            self.loop.now += timeout   # nothing else can happen before the next timer
+        return super().select(0)
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock jumps to the next timer instead of sleeping."""
+
+    def __init__(self):
+        self.now = 0.0
+        super().__init__(_JumpSelector(self))
+
+    def time(self):
+        return self.now
+
+
+def run_virtual(*coros):
+    """Run `coros` together on a VirtualClockLoop: (their results, virtual seconds taken)."""
+    async def main():
+        return await asyncio.gather(*coros)
+
+    loop = VirtualClockLoop()
+    try:
+        return loop.run_until_complete(main()), loop.now
+    finally:
+        loop.close()
+
+
+class FakeLink:
+    """DeviceLink stand-in: no sockets, a private breaker."""
+
+    def __init__(self, dev):
+        self.dev, self.client, self.line = dev, None, None
+        self.breaker = CircuitBreaker((dev.host, dev.port, dev.unit_id))
+        self.failures = 0
+
+    def failed(self, error=None):
+        self.failures += 1
+        self.breaker.failure(error)
+
+    def close(self):
+        pass
+
+
+class FakePoller(AsyncPoller):
+    """AsyncPoller over FakeLinks; `reads(dev, blocks)` plays the device."""
+
+    def __init__(self, devices, reads, **kwargs):
+        super().__init__(devices, **kwargs)
+        self.reads = reads
+        for st in self.state.values():
+            st.link = FakeLink(st.link.dev)
+
+    async def _read(self, st, blocks):
+        return await self.reads(st.link.dev, blocks)
+
+
+def answer(blocks, value=0):
+    """What a read cycle returns for `blocks`: registers and values per tag."""
+    tags = [t for b in blocks for t in b.tags]
+    return {t.name: [value] * t.count for t in tags}, {t.name: float(value) for t in tags}
+
+
+class AsyncPollerTests(SimpleTestCase):
+    def test_a_hung_device_times_out_without_holding_up_the_others(self):
+        devices = [Device("t003-ok", "10.3.0.1", timeout=1.0), Device("t003-hung", "10.3.0.2", timeout=1.0)]
+
+        async def reads(dev, blocks):
+            await asyncio.sleep(0.1 if dev.name == "t003-ok" else 100)
+            return answer(blocks, 7)
+
+        poller = FakePoller(devices, reads)
+        (ok, hung), elapsed = run_virtual(*(poller.poll_device(d) for d in devices))
+        self.assertEqual(ok["device"], "t003-ok")
+        self.assertEqual(ok["float1"], 7.0)
+        self.assertIsNone(hung)
+        self.assertAlmostEqual(elapsed, 1.0, places=3)
+        self.assertEqual(poller.state["t003-hung"].link.failures, 1)
+
+    def test_concurrency_is_capped(self):
+        devices = [Device(f"t003-c{i}", f"10.3.1.{i}", timeout=5.0) for i in range(5)]
+        in_flight, peak = [0], [0]
+
+        async def reads(dev, blocks):
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            await asyncio.sleep(1.0)
+            in_flight[0] -= 1
+            return answer(blocks)
+
+        poller = FakePoller(devices, reads, max_concurrency=2)
+        results, elapsed = run_virtual(*(poller.poll_device(d) for d in devices))
+        self.assertTrue(all(results))
+        self.assertEqual(peak[0], 2)
+        self.assertAlmostEqual(elapsed, 3.0, places=3)
+
+
+class PlanReadsTests(SimpleTestCase):
+    def test_fills_one_request_up_to_the_protocol_limit(self):
+        tags = [Tag(f"r{a}", a, "uint16") for a in range(MAX_READ_REGS)]
+        blocks = plan_reads(tags)
+        self.assertEqual([(b.start, b.count) for b in blocks], [(0, 125)])
+
+    def test_splits_at_126_registers(self):
+        tags = [Tag(f"r{a}", a, "uint16") for a in range(MAX_READ_REGS + 1)]
+        blocks = plan_reads(tags)
+        self.assertEqual([(b.start, b.count) for b in blocks], [(0, 125), (125, 1)])
+
+    def test_float_never_straddles_the_limit(self):
+        tags = [Tag(f"r{a}", a, "uint16") for a in range(124)] + [Tag("f", 124, "float32")]
+        blocks = plan_reads(tags)
+        self.assertEqual([(b.start, b.count) for b in blocks], [(0, 124), (124, 2)])
+
+    def test_bridges_gaps_up_to_max_gap(self):
+        tags = [Tag("a", 0, "uint16"), Tag("b", 1 + 16, "uint16")]
+        self.assertEqual([(b.start, b.count) for b in plan_reads(tags, max_gap=16)], [(0, 18)])
+
+    def test_splits_gaps_wider_than_max_gap(self):
+        tags = [Tag("a", 0, "uint16"), Tag("b", 1 + 17, "uint16")]
+        self.assertEqual([(b.start, b.count) for b in plan_reads(tags, max_gap=16)], [(0, 1), (18, 1)])
+
+    def test_default_map_reads_two_blocks_with_a_fallback(self):
+        blocks = build_plan(default_tags()).blocks
+        self.assertEqual([(b.start, b.count) for b in blocks], [(125, 4), (428, 10)])
+        self.assertEqual([(b.start, b.count) for b in blocks[1].fallback], [(427, 10)])
+
+
+class TagMapTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def write(self, spec):
+        path = os.path.join(self.tmp, "map.json")
+        with open(path, "w") as f:
+            json.dump(spec, f)
+        return path
+
+    def test_tag_order_overrides_the_map_default(self):
+        plan = load_tag_map(self.write({"word_order": "little", "tags": [
+            {"name": "a", "address": 0}, {"name": "b", "address": 2, "word_order": "big"}]}))
+        self.assertEqual([t.word_order for t in plan.tags], ["little", "big"])
+
+    def test_duplicate_names_are_rejected(self):
+        path = self.write({"tags": [{"name": "a", "address": 0}, {"name": "a", "address": 4}]})
+        with self.assertRaises(ValueError):
+            load_tag_map(path)
+
+
+ORDERS = [("big", "big"), ("little", "big"), ("big", "little"), ("little", "little")]
+
+
+def pair_to_float(hi, lo, word_order="big", byte_order="big"):
+    """The per-pair float32 decoder the batch decoder replaced."""
+    words = (hi, lo) if word_order == "big" else (lo, hi)
+    b = b"".join(bytes([w >> 8, w & 0xFF]) if byte_order == "big" else bytes([w & 0xFF, w >> 8])
+                 for w in words)
+    return struct.unpack(">f", b)[0]
+
+
+def reference_value(tag, regs):
+    """Words and bytes arranged by hand, like the per-pair decoder, for any type."""
+    words = list(regs) if tag.word_order == "big" else list(reversed(regs))
+    b = b"".join(w.to_bytes(2, tag.byte_order) for w in words)
+    return struct.unpack(">" + TYPES[tag.type][1], b)[0] * tag.scale
+
+
+def same(a, b):
+    return a == b or (a != a and b != b)   # NaN bit patterns decode to NaN either way
+
+
+class DecodeTests(SimpleTestCase):
+    def setUp(self):
+        self.rng = random.Random(5)
+
+    def test_decode_array_matches_the_pair_decoder_in_every_order(self):
+        regs = [self.rng.randrange(65536) for _ in range(64)]
+        for order in ORDERS:
+            old = [pair_to_float(regs[i], regs[i + 1], *order) for i in range(0, 64, 2)]
+            new = decode_array(regs, "float32", *order)
+            self.assertTrue(all(map(same, old, new)), order)
+
+    def test_block_decoder_matches_the_reference_for_every_type_and_order(self):
+        tags, address = [], 100
+        for i, (type_, order) in enumerate((t, o) for t in ("int16", "uint16", "int32", "uint32", "float32")
+                                           for o in ORDERS):
+            tags.append(Tag(f"t{i}", address, type_, *order, scale=(1.0, 0.1, 10.0)[i % 3]))
+            address += TYPES[type_][0] + i % 2   # every other tag leaves a gap
+        block = plan_reads(tags, max_gap=4)[0]
+        self.assertEqual(len(plan_reads(tags, max_gap=4)), 1)
+        for _ in range(20):
+            regs = [self.rng.randrange(65536) for _ in range(block.count)]
+            values = BlockDecoder(block.start, block.count, block.tags).decode(regs)
+            for tag, value in zip(block.tags, values):
+                at = tag.address - block.start
+                self.assertTrue(same(value, reference_value(tag, regs[at:at + tag.count])), tag)
+
+    def test_encode_value_round_trips(self):
+        cases = [(-1234, "int16", 1.0), (54321, "uint16", 1.0), (-70000, "int32", 1.0),
+                 (4000000000, "uint32", 1.0), (12.5, "float32", 1.0), (98.7, "uint16", 0.1)]
+        for value, type_, scale in cases:
+            for order in ORDERS:
+                regs = encode_value(value, type_, *order, scale=scale)
+                decoded = decode_array(regs, type_, *order)[0] * scale
+                self.assertAlmostEqual(decoded, value, places=4, msg=(type_, order))
+
+    def test_encode_value_rejects_out_of_range(self):
+        with self.assertRaises(ValueError):
+            encode_value(70000, "uint16")
+
+
+class HistoryStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, "history.sqlite3")
+
+    def count(self, tag):
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM samples JOIN series ON series.id = samples.series "
+                                "WHERE tag = ?", (tag,)).fetchone()[0]
+
+    def test_query_downsamples_the_database_and_the_ring_together(self):
+        h = HistoryStore(self.path, ring_size=30, spool_dir="")
+        for i in range(100):
+            h.record({"device": "d", "ts": float(i), "changes": {"a": float(i)}})
+        h.flush()                      # 0..69 only in SQLite, 70..99 in the ring too
+        out = h.query("d", "a", 0.0, 100.0, points=10)
+        self.assertEqual(out["t"], [10.0 * b for b in range(10)])
+        self.assertEqual(out["n"], [10] * 10)
+        self.assertEqual(out["min"], [10.0 * b for b in range(10)])
+        self.assertEqual(out["max"], [10.0 * b + 9 for b in range(10)])
+        self.assertEqual(out["avg"], [10.0 * b + 4.5 for b in range(10)])
+
+    def test_only_numeric_changes_are_recorded(self):
+        h = HistoryStore(self.path, spool_dir="")
+        h.record({"device": "d", "ts": 1.0, "changes": {"a": 1.0, "b": None, "c": float("nan"), "d": "x"}})
+        self.assertEqual(h.flush(), 1)
+
+    def test_series_id_not_cached_from_a_rolled_back_flush(self):
+        h = HistoryStore(self.path, spool_dir="")
+        with self.assertRaises(sqlite3.IntegrityError):
+            h._insert([("d", "a", 1.0, None)])    # NOT NULL value: the transaction rolls back
+        self.assertNotIn(("d", "a"), h._series)
+
+        h._insert([("d", "b", 1.0, 5.0)])
+        h._insert([("d", "a", 2.0, 7.0)])
+        self.assertNotEqual(h._series[("d", "a")], h._series[("d", "b")])
+        self.assertEqual((self.count("a"), self.count("b")), (1, 1))
+
+    def test_spool_replays_after_a_database_failure(self):
+        h = HistoryStore(self.path, spool_dir=os.path.join(self.tmp, "spool"))
+        h.record({"device": "d", "ts": 1.0, "changes": {"a": 1.0, "b": 2.0}})
+        with mock.patch.object(h, "_insert", side_effect=sqlite3.OperationalError("database is locked")):
+            self.assertEqual(h.flush(), 0)
+        self.assertGreater(h.spool.backlog(), 0)
+
+        h.record({"device": "d", "ts": 2.0, "changes": {"a": 3.0}})
+        self.assertEqual(h.flush(), 3)
+        self.assertEqual(h.spool.backlog(), 0)
+        self.assertEqual((self.count("a"), self.count("b")), (2, 1))
+
+
+class SpoolTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, "spool")
+
+    def spool(self, **kwargs):
+        spool = Spool(self.path, **kwargs)
+        self.addCleanup(spool.close)
+        return spool
+
+    def records(self, spool):
+        records, pos = spool.read(max_bytes=1 << 30)
+        return [int(r) for r in records], pos
+
+    def test_cursor_survives_a_restart(self):
+        spool = self.spool()
+        for i in range(5):
+            spool.append(b"%d" % i)
+        records, pos = spool.read(max_bytes=2 * (FRAME.size + 1))
+        self.assertEqual(records, [b"0", b"1"])
+        spool.ack(pos)
+        spool.close()
+
+        again = self.spool()
+        self.assertEqual(self.records(again)[0], [2, 3, 4])
+        self.assertEqual(again.backlog(), 3 * (FRAME.size + 1))
+
+    def test_a_torn_tail_is_cut_off_on_open(self):
+        spool = self.spool()
+        for i in range(3):
+            spool.append(b"%d" % i)
+        spool.close()
+        seg = os.path.join(self.path, os.listdir(self.path)[0])
+        with open(seg, "ab") as f:        # a crash halfway through the next append
+            f.write(FRAME.pack(100, 0) + b"half")
+
+        again = self.spool()
+        again.append(b"3")
+        self.assertEqual(self.records(again)[0], [0, 1, 2, 3])
+        self.assertEqual(os.path.getsize(seg), 4 * (FRAME.size + 1))
+
+    def test_a_record_with_a_bad_checksum_is_cut_off_too(self):
+        spool = self.spool()
+        spool.append(b"0")
+        spool.append(b"1")
+        spool.close()
+        seg = os.path.join(self.path, os.listdir(self.path)[0])
+        with open(seg, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b"9")
+
+        self.assertEqual(self.records(self.spool())[0], [0])
+
+    def test_oldest_segments_are_evicted_at_the_limit(self):
+        spool = self.spool(segment_bytes=4096, max_bytes=16384)
+        payload = lambda i: b"%08d" % i + b" " * 1000
+        for i in range(100):
+            spool.append(payload(i))
+        stats = spool.stats()
+        self.assertLessEqual(stats["bytes"], 16384)
+        self.assertEqual(stats["evicted_bytes"] + stats["backlog"], 100 * (FRAME.size + len(payload(0))))
+
+        kept, pos = self.records(spool)
+        self.assertEqual(kept, list(range(kept[0], 100)))   # the newest, without holes
+        self.assertGreater(kept[0], 0)
+        spool.ack(pos)
+        self.assertEqual((spool.backlog(), len(os.listdir(self.path)) - 1), (0, 1))   # - the cursor file
+
+    def test_eviction_moves_a_cursor_left_behind(self):
+        spool = self.spool(segment_bytes=4096, max_bytes=16384)
+        payload = b" " * 1000
+        spool.append(payload)
+        records, pos = spool.read()
+        spool.ack(pos)                   # drained the first record only
+        for _ in range(30):
+            spool.append(payload)
+        records, _ = spool.read(max_bytes=1 << 30)
+        self.assertEqual(len(records) * (FRAME.size + len(payload)), spool.backlog())
+        self.assertGreater(spool.evicted_bytes, 0)
+
+
+
+class ExportTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.h = HistoryStore(os.path.join(self.tmp, "history.sqlite3"), spool_dir="")
+        self.h._insert([("t024", "a", float(i), i * 10.0) for i in range(10)] +
+                       [("t024", "b", float(i), -i * 1.0) for i in range(5)] +
+                       [("t024-other", "a", 1.0, 1.0)])
+
+    def test_series_filters_by_device_and_tag(self):
+        self.assertEqual([s[1:] for s in self.h.series(["t024"])], [("t024", "a"), ("t024", "b")])
+        self.assertEqual([s[1:] for s in self.h.series(["t024", "t024-other"], ["a"])],
+                         [("t024", "a"), ("t024-other", "a")])
+        self.assertEqual(HistoryStore(os.path.join(self.tmp, "new.sqlite3"), spool_dir="").series(["t024"]), [])
+
+    def test_rows_are_paged_in_chunks_within_start_and_end(self):
+        chunks = list(self.h.export_rows(self.h.series(["t024"]), 2.0, 8.0, chunk=4))
+        self.assertEqual([len(c) for c in chunks], [4, 4, 1])
+        rows = [r for c in chunks for r in c]
+        self.assertEqual([(tag, ts) for _, tag, ts, _ in rows],
+                         [("a", float(i)) for i in range(2, 8)] + [("b", float(i)) for i in range(2, 5)])
+
+    def test_a_chunk_boundary_at_the_end_of_a_series_loses_nothing(self):
+        chunks = list(self.h.export_rows(self.h.series(["t024"], ["a"]), 0.0, 100.0, chunk=5))
+        self.assertEqual([[r[2] for r in c] for c in chunks], [[0.0, 1.0, 2.0, 3.0, 4.0], [5.0, 6.0, 7.0, 8.0, 9.0]])
+
+    def test_csv_sends_the_header_first_then_a_block_per_chunk(self):
+        body = list(export.csv_chunks([[("d", "a", 1.5, 2.0)], [("d", "b", 2.0, -1.0), ("d", "b", 3.0, 0.5)]]))
+        self.assertEqual(body[0], b"device,tag,ts,time,value\r\n")
+        self.assertEqual(body[1], b"d,a,1.5,1970-01-01T00:00:01.500000+00:00,2.0\r\n")
+        self.assertEqual(body[2].count(b"\r\n"), 2)
+
+    @skipUnless(export.available("parquet"), "pyarrow is not installed")
+    def test_parquet_writes_a_row_group_per_chunk(self):
+        pq = export._pyarrow().parquet
+        chunks = self.h.export_rows(self.h.series(["t024"]), 0.0, 100.0, chunk=6)
+        parts = list(export.parquet_chunks(chunks))
+        self.assertEqual(len(parts), 3 + 1)   # 6 + 6 + 3 rows, then the footer
+        table = pq.ParquetFile(io.BytesIO(b"".join(parts)))
+        self.assertEqual(table.metadata.num_row_groups, 3)
+        out = table.read().to_pydict()
+        self.assertEqual(out["tag"], ["a"] * 10 + ["b"] * 5)
+        self.assertEqual(out["time"][1].timestamp(), 1.0)
+        self.assertEqual(out["value"][:3], [0.0, 10.0, 20.0])
+
+    def test_endpoint_streams_the_requested_range(self):
+        with mock.patch("modbus_reader.views.history", self.h), mock.patch.object(export, "EXPORT_CHUNK", 4):
+            response = self.client.get("/history/export/", {"device": "t024", "tag": "a,b", "start": 3, "end": 5})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('filename="history_t024_3-5.csv"', response["Content-Disposition"])
+            lines = b"".join(response.streaming_content).decode().splitlines()
+            self.assertEqual([line.split(",")[1:3] for line in lines[1:]],
+                             [["a", "3.0"], ["a", "4.0"], ["b", "3.0"], ["b", "4.0"]])
+
+            self.assertEqual(self.client.get("/history/export/", {"device": "nope"}).status_code, 404)
+            self.assertEqual(self.client.get("/history/export/", {"format": "xlsx"}).status_code, 400)
+            self.assertEqual(self.client.get("/history/export/", {"start": 5, "end": 5}).status_code, 400)
+
+
+def parse_frame(frame):
+    fields = dict(line.split(": ", 1) for line in frame.strip().splitlines())
+    return fields["event"], int(fields["id"]), json.loads(fields["data"])
+
+
+class StreamTests(SimpleTestCase):
+    def test_snapshot_then_only_changes(self):
+        first = store.publish({"tags": {"a": 1, "b": 2}, "raw": [1, 2]}, device="stream-a")
+        frame, last = stream._next_frame(first, None, delta=True)
+        event, seq, data = parse_frame(frame)
+        self.assertEqual((event, seq, data["stale"]), ("snapshot", first["seq"], False))
+        self.assertIn("age", data)
+
+        self.assertEqual(stream._next_frame(first, last, delta=True), (None, last))
+        same = store.publish({"tags": {"a": 1, "b": 2}, "raw": [1, 2]}, device="stream-a")
+        self.assertEqual(stream._next_frame(same, last, delta=True), (None, last))
+
+        moved = store.publish({"tags": {"a": 1, "b": 3}, "raw": [1, 3]}, device="stream-a")
+        frame, last = stream._next_frame(moved, last, delta=True)
+        event, _, data = parse_frame(frame)
+        self.assertEqual((event, data["tags"], data["raw"]), ("delta", {"b": 3}, {"1": 3}))
+        self.assertIs(last, moved)
+
+    def test_heartbeat_reports_age_and_stale(self):
+        snap = store.publish({"tags": {"a": 1}}, device="stream-b", ts=time.time() - 60)
+        event, seq, data = parse_frame(stream._age_frame("stream-b", snap))
+        self.assertEqual((event, seq, data["stale"]), ("age", snap["seq"], True))
+        self.assertGreaterEqual(data["age"], 60)
+        self.assertTrue(parse_frame(stream._age_frame("stream-never", None))[2]["stale"])
+
+    def test_open_circuit_is_stale_at_once(self):
+        snap = store.publish({"tags": {"a": 1}}, device="stream-c")
+        breaker = board.get("10.7.0.1", 502, 1, "stream-c")
+        for _ in range(breaker.threshold):
+            breaker.failure("timeout")
+        self.assertTrue(parse_frame(stream._age_frame("stream-c", snap))[2]["stale"])
+
+    def test_idle_stream_sends_age_frames_instead_of_comments(self):
+        store.publish({"tags": {"a": 1}}, device="stream-d")
+        with mock.patch.object(stream, "KEEPALIVE", 0.01):
+            events = stream.snapshot_events_sync("stream-d")
+            try:
+                self.assertEqual(parse_frame(next(events))[0], "snapshot")
+                self.assertEqual(parse_frame(next(events))[0], "age")
+            finally:
+                events.close()
+        self.assertEqual(stream.broadcaster.count(), 0)
+
+
+class ChangeDetectorTests(SimpleTestCase):
+    def setUp(self):
+        self.det = ChangeDetector(log_size=100)
+        self.plan = build_plan([Tag("abs", 0, deadband=0.5), Tag("pct", 2, deadband_pct=10.0), Tag("n", 4)])
+        self.cycle = 0
+
+    def detect(self, abs_, pct, n=0.0, device="d"):
+        self.cycle += 1   # the raw registers have to move for the tags to be looked at
+        data = {"raw": [self.cycle], "tags": {"abs": abs_, "pct": pct, "n": n}}
+        return self.det.detect(device, data, self.plan, float(self.cycle))
+
+    def test_first_cycle_reports_every_tag(self):
+        self.assertEqual(self.detect(1.0, 100.0), {"abs": 1.0, "pct": 100.0, "n": 0.0})
+
+    def test_unchanged_raw_registers_report_nothing(self):
+        data = {"raw": [1, 2], "tags": {"abs": 1.0, "pct": 1.0, "n": 1.0}}
+        self.det.detect("d", data, self.plan, 1.0)
+        self.assertEqual(self.det.detect("d", {**data, "tags": {"abs": 9.0}}, self.plan, 2.0), {})
+
+    def test_absolute_deadband(self):
+        self.detect(1.0, 100.0)
+        self.assertEqual(self.detect(1.5, 100.0), {})          # within +-0.5
+        self.assertEqual(self.detect(1.6, 100.0), {"abs": 1.6})
+        self.assertEqual(self.detect(1.2, 100.0), {})          # measured from the last reported value
+
+    def test_percent_deadband(self):
+        self.detect(1.0, 100.0)
+        self.assertEqual(self.detect(1.0, 109.0), {})          # within 10 % of 100
+        self.assertEqual(self.detect(1.0, 111.0), {"pct": 111.0})
+        self.assertEqual(self.detect(1.0, 101.0), {})          # 10 % of 111
+
+    def test_seqs_are_global_and_ordered(self):
+        self.detect(1.0, 100.0, device="a")
+        self.detect(5.0, 100.0, device="b")
+        self.detect(9.0, 100.0, device="a")
+        events, missed = self.det.since(0)
+        self.assertFalse(missed)
+        self.assertEqual([e[0] for e in events], list(range(1, 8)))
+        self.assertEqual(self.det.seq, 7)
+        self.assertEqual([(e[1], e[2], e[4]) for e in self.det.since(6, "a")[0]], [("a", "abs", 9.0)])
+
+    def test_since_reports_a_gap_once_the_log_wrapped(self):
+        det = ChangeDetector(log_size=3)
+        for i in range(5):
+            det.record("d", {"t": i}, float(i))
+        self.assertEqual(det.since(2), ([(3, "d", "t", 2.0, 2), (4, "d", "t", 3.0, 3), (5, "d", "t", 4.0, 4)], False))
+        events, missed = det.since(1)
+        self.assertTrue(missed)
+        self.assertEqual([e[0] for e in events], [3, 4, 5])
+        self.assertEqual(det.since(5), ([], False))
+
+    def test_ingest_mirrors_seqs_and_clears_the_log_on_a_gap(self):
+        self.det.ingest({"device": "d", "ts": 1.0, "change_seq": 2, "changes": {"a": 1, "b": 2}})
+        self.assertEqual([e[0] for e in self.det.since(0)[0]], [1, 2])
+        self.det.ingest({"device": "d", "ts": 2.0, "change_seq": 3, "changes": {}})   # no changes: ignored
+        self.det.ingest({"device": "d", "ts": 3.0, "change_seq": 9, "changes": {"a": 5}})   # 3..8 lost
+        self.assertEqual(self.det.seq, 9)
+        events, missed = self.det.since(2)
+        self.assertTrue(missed)
+        self.assertEqual(events, [(9, "d", "a", 3.0, 5)])
+
+
+def scan_of(poller, dev, interval, max_interval=None):
+    """Replace the poller's scans with one group of `dev`'s plan at the given intervals."""
+    group = poller.state[dev.name].plan.groups[0]
+    sc = Scan(dev, dataclasses.replace(group, interval=interval, max_interval=max_interval))
+    poller.scans = [sc]
+    return sc
+
+
+async def run_for(poller, seconds):
+    try:
+        await asyncio.wait_for(poller.run(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+class SchedulerTests(SimpleTestCase):
+    def test_settle_doubles_after_adapt_after_unchanged_scans_up_to_the_max(self):
+        sc = Scan(Device("t009-s", "10.9.0.1"), ScanGroup("slow", 1.0, 8.0, [], []))
+        with mock.patch.object(aio_poller, "ADAPT_AFTER", 3):
+            intervals = []
+            for _ in range(13):
+                sc.settle((1, 2))
+                intervals.append(sc.interval)
+            self.assertEqual(intervals, [1.0] * 3 + [2.0] * 3 + [4.0] * 3 + [8.0] * 4)
+            sc.settle((1, 3))
+            self.assertEqual(sc.interval, 1.0)
+
+    def test_no_max_interval_keeps_the_base_rate(self):
+        sc = Scan(Device("t009-n", "10.9.0.2", interval=0.5), ScanGroup("default", None, None, [], []))
+        for _ in range(50):
+            sc.settle((0,))
+        self.assertEqual((sc.base, sc.interval, sc.max_interval), (0.5, 0.5, None))
+
+    def test_a_static_group_slows_down_and_snaps_back_on_change(self):
+        dev = Device("t009-adapt", "10.9.0.3", timeout=1.0)
+        times, value = [], [0]
+
+        async def reads(dev, blocks):
+            times.append(asyncio.get_running_loop().time())
+            if len(times) == 12:
+                value[0] = 1   # the PLC value moves once
+            return answer(blocks, value[0])
+
+        poller = FakePoller([dev], reads)
+        scan_of(poller, dev, 1.0, 4.0)
+        with mock.patch.object(aio_poller, "ADAPT_AFTER", 2):
+            run_virtual(run_for(poller, 60.0))
+        gaps = [round(b - a, 6) for a, b in zip(times, times[1:])]
+        self.assertEqual(gaps[:10], [1.0, 1.0, 1.0, 2.0, 2.0, 4.0, 4.0, 4.0, 4.0, 4.0])
+        self.assertIn(1.0, gaps[12:14])   # back to the base rate right after the change
+        self.assertLess(len(times), 30)
+
+    def test_an_overrunning_scan_skips_its_slots(self):
+        dev = Device("t009-slow", "10.9.0.4", timeout=5.0)
+        starts = []
+
+        async def reads(dev, blocks):
+            starts.append(asyncio.get_running_loop().time())
+            await asyncio.sleep(2.5)
+            return answer(blocks)
+
+        poller = FakePoller([dev], reads)
+        sc = scan_of(poller, dev, 1.0)
+        run_virtual(run_for(poller, 9.5))
+        self.assertEqual(starts, [0.0, 3.0, 6.0, 9.0])   # never two reads of one scan at once
+        self.assertEqual(metrics.overruns_total._values[(dev.name, sc.group.name)], 6)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        h = metrics.Histogram("t_seconds", "test", ("device",), buckets=(0.1, 1.0))
+        for v in (0.05, 0.5, 0.5, 3.0):
+            h.observe(v, "d")
+        self.assertEqual(h.render(), [
+            't_seconds_bucket{device="d",le="0.1"} 1',
+            't_seconds_bucket{device="d",le="1.0"} 3',
+            't_seconds_bucket{device="d",le="+Inf"} 4',
+            't_seconds_sum{device="d"} 4.05',
+            't_seconds_count{device="d"} 4',
+        ])
+
+    def test_label_values_are_escaped(self):
+        c = metrics.Counter("t_total", "test", ("device",))
+        c.inc('a"b\\c')
+        self.assertEqual(c.render(), ['t_total{device="a\\"b\\\\c"} 1.0'])
+
+    def test_endpoint_reports_breakers_and_snapshot_age(self):
+        store.publish({"tags": {}}, device="t010-m", ts=time.time() - 3)
+        breaker = board.get("10.10.0.1", 502, 1, "t010-m")
+        for _ in range(breaker.threshold):
+            breaker.failure("timeout")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        self.assertIn("# TYPE modbus_request_seconds histogram", body)
+        self.assertIn('modbus_breaker_state{device="t010-m"} 2', body)
+        self.assertIn('modbus_breaker_opens_total{device="t010-m"} 1', body)
+        age = float(body.split('modbus_snapshot_age_seconds{device="t010-m"} ')[1].split()[0])
+        self.assertGreaterEqual(age, 3)
+
+    def test_a_skipped_scan_is_not_timed(self):
+        dev = Device("t010-open", "10.10.0.2")
+
+        async def reads(dev, blocks):
+            return answer(blocks)
+
+        poller = FakePoller([dev], reads)
+        sc = scan_of(poller, dev, 1.0)
+        breaker = poller.state[dev.name].link.breaker
+        for _ in range(breaker.threshold):
+            breaker.failure("timeout")
+        run_virtual(poller._scan(sc))
+        self.assertNotIn((dev.name, sc.group.name), metrics.cycle_seconds._values)
+
+        breaker.success()
+        run_virtual(poller._scan(sc))
+        self.assertEqual(sum(metrics.cycle_seconds._values[(dev.name, sc.group.name)][:-1]), 1)
+
+
+def wait_until(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def connects(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+class HubThread:
+    """A SnapshotHub serving `path` from its own thread and loop."""
+
+    def __init__(self, path):
+        self.hub = ipc.SnapshotHub(path)
+        self.loop = asyncio.new_event_loop()
+        self.task = self.loop.create_task(self.hub.serve())
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        wait_until(lambda: self.hub._loop is not None and connects(path))
+
+    def _run(self):
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        for writer in list(self.hub._writers):   # drop the workers, as a service exiting does
+            writer.close()
+        pending = asyncio.all_tasks(self.loop)
+        if pending:
+            self.loop.run_until_complete(asyncio.wait(pending))
+
+    def stop(self):
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join(5)
+        self.loop.close()
+
+
+def read_frame(sock):
+    size = ipc._HEADER.unpack(ipc._recv_exact(sock, ipc._HEADER.size))[0]
+    return json.loads(ipc._recv_exact(sock, size))
+
+
+class IpcTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, "poller.sock")
+
+    def test_frames_round_trip_into_the_store(self):
+        service, worker = socket.socketpair()
+        snaps = [{"device": "t012-rt", "seq": i, "ts": float(i), "tags": {"a": i * 1.5}} for i in (1, 2)]
+        for snap in snaps:
+            service.sendall(ipc.encode(snap))
+        alarm = {"op": "alarms", "seq": 1, "events": [[1, 1.0, "raised", "hi", "t012-rt", "a", 1.5]], "active": []}
+        service.sendall(ipc.encode(alarm))
+        service.close()
+        with mock.patch.object(ipc.store, "ingest") as ingest, \
+                mock.patch("modbus_reader.alarms.alarms.ingest") as alarms_ingest:
+            ipc.SnapshotFeed(self.path)._read_loop(worker)   # returns at EOF
+        worker.close()
+        self.assertEqual([c.args[0] for c in ingest.call_args_list], snaps)
+        alarms_ingest.assert_called_once_with(alarm)
+
+    def test_a_new_worker_gets_the_latest_snapshot_of_every_device(self):
+        running = HubThread(self.path)
+        self.addCleanup(running.stop)
+        hub = running.hub
+        hub.notify({"device": "t012-a", "seq": 1, "ts": 1.0})
+        hub.notify({"device": "t012-b", "seq": 2, "ts": 2.0})
+        hub.notify({"device": "t012-a", "seq": 3, "ts": 3.0})
+        hub.send({"op": "alarms", "seq": 1, "events": [], "active": []})
+        hub.send({"op": "alarms", "seq": 2, "events": [], "active": []})
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(self.path)
+            frames = [read_frame(sock) for _ in range(3)]
+            self.assertEqual(sorted(f["seq"] for f in frames if "op" not in f), [2, 3])
+            self.assertEqual([f["seq"] for f in frames if "op" in f], [2])
+            wait_until(lambda: hub.count() == 1)
+            hub.notify({"device": "t012-b", "seq": 4, "ts": 4.0})
+            self.assertEqual(read_frame(sock)["seq"], 4)
+
+            with mock.patch("modbus_reader.production.production.note_reset") as note_reset:
+                sock.sendall(ipc.encode({"op": "reset", "device": "t012-a", "address": 125}))
+                wait_until(lambda: note_reset.called)
+            note_reset.assert_called_once_with("t012-a", 125)
+        wait_until(lambda: hub.count() == 0)
+
+    def test_feed_reconnects_after_the_service_restarts(self):
+        running = HubThread(self.path)
+        running.hub.notify({"device": "t012-re", "seq": 1, "ts": 1.0})
+        feed = ipc.SnapshotFeed(self.path)
+        with mock.patch.object(ipc, "RECONNECT_DELAY", 0.02):
+            feed.start()
+            wait_until(lambda: (store.get("t012-re") or {}).get("seq") == 1)
+            running.stop()
+            wait_until(lambda: not feed.connected)
+
+            running = HubThread(self.path)
+            self.addCleanup(running.stop)
+            running.hub.notify({"device": "t012-re", "seq": 2, "ts": 2.0})
+            wait_until(lambda: feed.connected)
+            wait_until(lambda: store.get("t012-re")["seq"] == 2)
+        self.assertTrue(feed.send({"op": "ping"}))
+
+
+def shm_snap(device, seq, tags, raw=(), changes=None):
+    return {"device": device, "seq": seq, "ts": 1000.0 + seq, "change_seq": seq,
+            "tags": dict(tags), "raw": list(raw), "changes": changes or {}}
+
+
+class SharedMemoryTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, "snapshots")
+        self.writer = self.new_writer()
+
+    def new_writer(self):
+        writer = shm.SegmentWriter(self.path, devices=4, tags=8, raw=16)
+        self.addCleanup(writer.close)
+        return writer
+
+    def test_round_trip_keeps_types_and_changes(self):
+        self.writer.write(shm_snap("m1", 5, {"float1": 1.5, "n": 7, "off": None}, [1, None, 3], {"n": 7}))
+        snap = shm.SegmentReader(self.path).get("m1")
+        self.assertEqual(snap["tags"], {"float1": 1.5, "n": 7, "off": None})
+        self.assertIsInstance(snap["tags"]["n"], int)
+        self.assertEqual((snap["raw"], snap["changes"]), ([1, None, 3], {"n": 7}))
+        self.assertEqual((snap["seq"], snap["ts"], snap["change_seq"], snap["float1"]), (5, 1005.0, 5, 1.5))
+
+    def test_reader_waits_out_a_write_in_progress(self):
+        self.writer.write(shm_snap("m1", 1, {"a": 1.0}))
+        reader = shm.SegmentReader(self.path)
+        self.assertEqual(reader.get("m1")["seq"], 1)
+        off = self.writer.layout.slot(0)
+        seq = struct.unpack_from("<Q", self.writer._buf, off)[0]
+        struct.pack_into("<Q", self.writer._buf, off, seq + 1)   # writer stopped half way
+
+        with mock.patch.object(shm.time, "sleep") as sleep:
+            self.assertIsNone(reader.get("m1"))                   # gives up after READ_RETRIES
+        self.assertEqual(sleep.call_count, shm.READ_RETRIES)
+
+        def finish(_):
+            struct.pack_into("<Q", self.writer._buf, off, seq + 2)
+
+        with mock.patch.object(shm.time, "sleep", side_effect=finish):
+            self.assertEqual(reader.get("m1")["seq"], 1)
+
+    def test_a_torn_read_is_retried(self):
+        self.writer.write(shm_snap("m1", 1, {"a": 1.0, "b": 2.0}, [1, 2]))
+        reader = shm.SegmentReader(self.path)
+        real, torn = shm._array, []
+
+        def array(code, n):
+            if code == "i" and not torn:   # the writer lands a new snapshot mid-copy
+                torn.append(True)
+                self.writer.write(shm_snap("m1", 2, {"a": 10.0, "b": 20.0}, [10, 20]))
+            return real(code, n)
+
+        with mock.patch.object(shm, "_array", side_effect=array):
+            snap = reader.get("m1")
+        self.assertTrue(torn)
+        self.assertEqual((snap["seq"], snap["tags"], snap["raw"]), (2, {"a": 10.0, "b": 20.0}, [10, 20]))
+
+    def test_schema_change_is_picked_up(self):
+        reader = shm.SegmentReader(self.path)
+        self.writer.write(shm_snap("m1", 1, {"a": 1.0, "b": 2.0}))
+        self.assertEqual(list(reader.get("m1")["tags"]), ["a", "b"])
+        self.writer.write(shm_snap("m1", 2, {"b": 2.0, "c": 3.0, "a": 1.0}))
+        self.assertEqual(reader.get("m1")["tags"], {"b": 2.0, "c": 3.0, "a": 1.0})
+
+    def test_new_devices_and_a_restarted_writer_are_remapped(self):
+        reader = shm.SegmentReader(self.path)
+        self.assertEqual(reader.devices(), [])
+        self.writer.write(shm_snap("m1", 1, {"a": 1.0}))
+        self.assertEqual(reader.devices(), ["m1"])
+        self.writer.write(shm_snap("m2", 2, {"a": 2.0}))
+        self.assertEqual(reader.devices(), ["m1", "m2"])   # directory generation moved
+
+        restarted = self.new_writer()                       # new epoch, slots in a new order
+        restarted.write(shm_snap("m2", 1, {"a": 5.0}))
+        self.assertEqual(reader.devices(), ["m2"])
+        self.assertIsNone(reader.get("m1"))
+        self.assertEqual(reader.get("m2")["tags"], {"a": 5.0})
+        restarted.write(shm_snap("m1", 2, {"z": 9}))
+        self.assertEqual(reader.get("m1")["tags"], {"z": 9})
+
+
+class FakeRegisters:
+    """Sync client stand-in over a dict of holding registers; logs every request."""
+
+    class Response:
+        def __init__(self, registers=()):
+            self.registers = list(registers)
+
+        def isError(self):
+            return False
+
+    def __init__(self, ignore=()):
+        self.regs, self.calls, self.ignore = {}, [], set(ignore)   # `ignore`: writes the PLC drops
+
+    def write_register(self, address, value, **kw):
+        self.calls.append(("fc6", address, 1))
+        if address not in self.ignore:
+            self.regs[address] = value
+        return self.Response()
+
+    def write_registers(self, address, values, **kw):
+        self.calls.append(("fc16", address, len(values)))
+        for a, v in enumerate(values, address):
+            if a not in self.ignore:
+                self.regs[a] = v
+        return self.Response()
+
+    def read_holding_registers(self, address, count, **kw):
+        self.calls.append(("fc3", address, count))
+        return self.Response(self.regs.get(a, 0xFFFF) for a in range(address, address + count))
+
+
+class WriteTests(SimpleTestCase):
+    def session_with(self, client):
+        @contextlib.contextmanager
+        def session(*args, **kwargs):
+            yield client
+
+        return mock.patch.object(modbus_utils.connections, "session", session)
+
+    def test_splits_runs_at_123_registers(self):
+        runs = plan_writes({a: a for a in range(MAX_WRITE_REGS + 1)})
+        self.assertEqual([(start, len(values)) for start, values in runs], [(0, 123), (123, 1)])
+
+    def test_never_bridges_a_gap(self):
+        self.assertEqual(plan_writes({0: 1, 1: 2, 3: 4}), [(0, [1, 2]), (3, [4])])
+
+    def test_verify_reads_bridge_small_gaps(self):
+        self.assertEqual(plan_verify([(0, [1, 2]), (3, [4]), (100, [5])], max_gap=4), [(0, 4), (100, 1)])
+
+    def test_conflicting_queued_writes_go_out_separately(self):
+        rounds = _rounds([({1: 0}, "a"), ({2: 5}, "b"), ({1: 7}, "c"), ({1: 7, 3: 1}, "d")])
+        self.assertEqual(rounds, [({1: 0, 2: 5}, ["a", "b"]), ({1: 7, 3: 1}, ["c", "d"])])
+
+    def test_batch_uses_one_request_per_run_and_one_verify_read(self):
+        plc = FakeRegisters()
+        with self.session_with(plc):
+            ok, detail = write_batch("10.14.0.1", 502, 1, {10: 1, 11: 2, 12: 3, 14: 9})
+        self.assertTrue(ok)
+        self.assertEqual(plc.calls, [("fc16", 10, 3), ("fc6", 14, 1), ("fc3", 10, 5)])
+        self.assertEqual(detail, {"writes": [[10, 3], [14, 1]], "verify": "ok", "mismatches": {}})
+
+    def test_batch_reports_registers_that_did_not_take(self):
+        with self.session_with(FakeRegisters(ignore={11})):
+            ok, detail = write_batch("10.14.0.1", 502, 1, {10: 1, 11: 2})
+        self.assertTrue(ok)
+        self.assertEqual((detail["verify"], detail["mismatches"]), ("mismatch", {11: [2, 0xFFFF]}))
+
+    def test_queued_writes_to_a_device_share_a_batch(self):
+        queue, started, release, batches = modbus_utils.WriteQueue(), threading.Event(), threading.Event(), []
+
+        def batch(host, port, slave_id, regs, timeout=2):
+            batches.append(dict(regs))
+            started.set()
+            release.wait(5)
+            return True, {"n": len(batches)}
+
+        with mock.patch.object(modbus_utils, "write_batch", side_effect=batch):
+            first = queue.submit("10.14.0.2", 502, 1, {1: 1})
+            started.wait(5)   # the writer is busy: the next three queue up behind it
+            rest = [queue.submit("10.14.0.2", 502, 1, regs) for regs in ({2: 2}, {3: 3}, {2: 9})]
+            release.set()
+            results = [f.result(5) for f in [first] + rest]
+        self.assertEqual(batches, [{1: 1}, {2: 2, 3: 3}, {2: 9}])
+        self.assertEqual([r[1]["n"] for r in results], [1, 2, 2, 3])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("modbus_reader.breaker.time.monotonic", return_value=100.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(("plc", 502, 1), threshold=3, open_initial=1.0, open_max=4.0)
+
+    def test_open_half_open_closed(self):
+        b = self.breaker
+        for _ in range(2):
+            b.failure("timeout")
+        self.assertEqual(b.state, CLOSED)
+        b.failure("timeout")
+        self.assertEqual(b.state, OPEN)
+        self.assertFalse(b.allow())
+
+        self.clock.return_value = 101.0
+        self.assertTrue(b.allow())            # the probe
+        self.assertEqual(b.state, HALF_OPEN)
+        self.assertFalse(b.allow())           # only one at a time
+        b.success()
+        self.assertEqual(b.state, CLOSED)
+        self.assertTrue(b.allow())
+        self.assertEqual(b.opens_total, 1)
+
+    def test_failed_probe_doubles_the_wait(self):
+        b = self.breaker
+        for _ in range(3):
+            b.failure()
+        self.clock.return_value = 101.0
+        self.assertTrue(b.allow())
+        b.failure()
+        self.assertEqual(b.state, OPEN)
+        self.assertEqual(b.retry_in(), 2.0)
+        self.assertEqual(b.opens_total, 2)
+
+    def test_the_wait_doubles_up_to_open_max(self):
+        b = self.breaker
+        waits = []
+        for _ in range(3):
+            b.failure()
+        for _ in range(5):
+            waits.append(b.retry_in())
+            self.clock.return_value += waits[-1]
+            self.assertTrue(b.allow())
+            b.failure()
+        self.assertEqual(waits, [1.0, 2.0, 4.0, 4.0, 4.0])
+
+    def test_only_consecutive_failures_open_the_circuit(self):
+        b = self.breaker
+        for _ in range(5):
+            b.failure()
+            b.failure()
+            b.success()
+        self.assertEqual((b.state, b.opens_total), (CLOSED, 0))
+
+    def test_a_probe_that_never_reports_back_frees_the_slot(self):
+        b = self.breaker
+        for _ in range(3):
+            b.failure()
+        self.clock.return_value = 101.0
+        self.assertTrue(b.allow())
+        self.clock.return_value = 101.0 + PROBE_TIMEOUT - 0.1
+        self.assertFalse(b.allow())
+        self.clock.return_value = 101.0 + PROBE_TIMEOUT
+        self.assertTrue(b.allow())
+
+    def test_open_circuit_fails_sessions_fast_and_marks_status_stale(self):
+        host = "10.16.0.1"
+        breaker = board.get(host, 502, 1, "t016-dev")
+        for _ in range(breaker.threshold):
+            breaker.failure("timeout")
+        with mock.patch("pymodbus.client.ModbusTcpClient") as client:
+            with self.assertRaisesMessage(ConnectionUnavailable, "circuit open"):
+                with ConnectionManager().session(host, 502, 1):
+                    pass
+        client.assert_not_called()
+
+        store.publish({"tags": {"a": 1}}, device="t016-dev")   # fresh, but the circuit is open
+        body = self.client.get("/status/", {"device": "t016-dev"}).json()
+        self.assertTrue(body["stale"])
+        self.assertEqual(body["health"]["state"], OPEN)
+
+
+class TransportTests(SimpleTestCase):
+    RTU_DEFAULT = [Device("default", "/dev/ttyUSB0", port=0, transport="rtu"), Device("t017-press", "10.17.0.5")]
+
+    def test_only_serial_port_names_are_refused_outright(self):
+        with mock.patch.object(connections, "configured_devices", return_value=[]):
+            for host in ("compressor-1.plant.local", "COMPACTLOGIX", "com-gw", "10.17.0.1"):
+                check_tcp(host)
+            for host in ("COM3", "com12", "/dev/ttyUSB0"):
+                with self.assertRaises(TransportUnsupported):
+                    check_tcp(host)
+
+    def test_decided_by_the_target_devices_transport(self):
+        with mock.patch.object(connections, "configured_devices", return_value=self.RTU_DEFAULT):
+            check_tcp("10.17.0.5")                     # TCP devices stay writable
+            check_tcp("192.168.1.20")
+            with self.assertRaises(TransportUnsupported):
+                check_tcp("192.168.1.20", device="default")
+
+    def test_reset_on_an_rtu_default_device_is_501_without_a_write(self):
+        with mock.patch.object(connections, "configured_devices", return_value=self.RTU_DEFAULT), \
+                mock.patch.object(modbus_utils.writes, "submit") as submit:
+            response = self.client.post("/reset-psc/")
+        self.assertEqual(response.status_code, 501)
+        submit.assert_not_called()
+
+    def test_busy_bus_is_shared_round_robin(self):
+        bus, holders, ticks = BusQueue(), [], itertools.count()
+
+        async def unit(unit_id, cycles):
+            for _ in range(cycles):
+                async with bus.turn(unit_id):
+                    holders.append(unit_id)
+                    await asyncio.sleep(0.1)
+
+        with mock.patch.object(transports, "time", mock.Mock(monotonic=lambda: next(ticks))):
+            _, elapsed = run_virtual(unit(1, 6), unit(2, 3), unit(3, 3))
+        self.assertEqual(holders, [1, 2, 3] * 3 + [1] * 3)   # unit 1 never takes the bus twice in a row
+        self.assertAlmostEqual(elapsed, 1.2, places=6)      # and the bus never sat idle
+
+    def test_frames_wait_out_the_silent_interval(self):
+        line = SerialLine("/dev/ttyT017", baudrate=9600)
+        self.assertAlmostEqual(line.frame_gap, 3.5 * 10 / 9600)
+        self.assertAlmostEqual(SerialLine("/dev/ttyT017b", baudrate=115200).frame_gap, 0.00175)
+        self.assertAlmostEqual(line.request_budget(10), (8 + 5 + 20) * 10 / 9600 + 2 * line.frame_gap)
+
+        sent = []
+
+        class Wire:
+            connected = True
+
+            async def read_holding_registers(self, *args, **kwargs):
+                sent.append(asyncio.get_running_loop().time())
+                await asyncio.sleep(0.01)
+
+        line.client = Wire()
+        client = PacedClient(line)
+
+        async def two_reads():
+            clock = asyncio.get_running_loop().time
+            with mock.patch.object(transports, "time", mock.Mock(monotonic=clock)):
+                await client.read_holding_registers(0, count=2)
+                await client.read_holding_registers(2, count=2)
+
+        run_virtual(two_reads())
+        self.assertAlmostEqual(sent[1] - sent[0], 0.01 + line.frame_gap, places=9)
+
+
+class EncodingTests(SimpleTestCase):
+    NAMES = ["float1", "float2", "count"]
+    SNAP = {"device": "t018", "seq": 7, "change_seq": 12, "ts": 1000.5, "age": 0.25, "stale": False,
+            "tags": {"float1": 1.5, "float2": None, "count": 42}, "raw": [1, None, 3]}
+
+    def test_negotiate(self):
+        with mock.patch.object(encoding, "_has_msgpack", return_value=True):
+            self.assertEqual(encoding.negotiate(""), encoding.JSON)
+            self.assertEqual(encoding.negotiate("text/html,*/*;q=0.8"), encoding.JSON)
+            self.assertEqual(encoding.negotiate("application/json;q=0.5, application/x-msgpack"), encoding.MSGPACK)
+            self.assertEqual(encoding.negotiate(f"{encoding.PACKED};q=0.9, application/json;q=0.1"), encoding.PACKED)
+            self.assertEqual(encoding.negotiate(encoding.PACKED, "json"), encoding.JSON)   # ?format= wins
+            self.assertIsNone(encoding.negotiate("", "xml"))
+        with mock.patch.object(encoding, "_has_msgpack", return_value=False):
+            self.assertEqual(encoding.negotiate("application/msgpack"), encoding.JSON)
+            self.assertIsNone(encoding.negotiate("", "msgpack"))
+
+    def test_unknown_format_is_406(self):
+        response = self.client.get("/status/", {"format": "xml"})
+        self.assertEqual(response.status_code, 406)
+        self.assertIn("packed", response.json()["error"])
+
+    def test_pack_round_trip(self):
+        body, schema = encoding.pack(self.SNAP, self.NAMES, raw=True)
+        out = encoding.unpack(body)
+        self.assertEqual((out["seq"], out["change_seq"], out["ts"], out["age"]), (7, 12, 1000.5, 0.25))
+        self.assertEqual((out["full"], out["stale"], out["schema"]), (True, False, schema))
+        self.assertEqual(out["tags"], {"float1": 1.5, "float2": None, "count": 42.0})
+        self.assertEqual((out["index"], out["raw"]), (self.NAMES, [1, None, 3]))
+
+        cached, _ = encoding.pack(self.SNAP, self.NAMES, client_schema=schema)   # client has the index
+        self.assertLess(len(cached), len(body))
+        with self.assertRaises(ValueError):
+            encoding.unpack(cached)
+        self.assertEqual(encoding.unpack(cached, self.NAMES)["tags"]["count"], 42.0)
+
+    def test_delta_carries_only_changed_tags(self):
+        events = [(11, "t018", "count", 1000.5, 42), (12, "t018", "count", 1000.5, 42)]
+        out = encoding.delta(self.SNAP, events, missed=False)
+        self.assertEqual((out["full"], out["tags"], out["change_seq"]), (False, {"count": 42}, 12))
+        self.assertNotIn("raw", out)
+        self.assertEqual(encoding.delta(self.SNAP, events, missed=True)["tags"], self.SNAP["tags"])
+
+        body, _ = encoding.pack({**out, "stale": True}, self.NAMES)
+        packed = encoding.unpack(body)
+        self.assertEqual((packed["full"], packed["stale"], packed["tags"]), (False, True, {"count": 42.0}))
+
+    def test_packed_status_over_http(self):
+        store.publish({"tags": {"a": 1.0, "b": 2.0}, "raw": [1, 2]}, device="t018-http")
+        response = self.client.get("/status/", {"device": "t018-http"}, HTTP_ACCEPT=encoding.PACKED)
+        self.assertEqual(response["Content-Type"], encoding.PACKED)
+        out = encoding.unpack(response.content)
+        self.assertEqual((out["tags"], str(out["schema"])), ({"a": 1.0, "b": 2.0}, response["X-Tag-Schema"]))
+
+    @skipUnless(encoding._has_msgpack(), "msgpack not installed")
+    def test_msgpack_round_trip(self):
+        import msgpack
+        body, _ = encoding.encode(self.SNAP, encoding.MSGPACK, self.NAMES)
+        self.assertEqual(msgpack.unpackb(body), self.SNAP)
+
+
+class StatusETagTests(SimpleTestCase):
+    def test_unchanged_snapshot_is_304_and_a_new_seq_changes_the_etag(self):
+        store.publish({"tags": {"a": 1.0}}, device="t019")
+        first = self.client.get("/status/", {"device": "t019"})
+        tag = first["ETag"]
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first["Cache-Control"], "no-cache")
+
+        again = self.client.get("/status/", {"device": "t019"}, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual((again.status_code, again.content, again["ETag"]), (304, b"", tag))
+
+        store.publish({"tags": {"a": 1.0}}, device="t019")            # same values, new poll
+        fresh = self.client.get("/status/", {"device": "t019"}, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh["ETag"], tag)
+
+    def test_etag_depends_on_the_representation(self):
+        store.publish({"tags": {"a": 1.0}}, device="t019-rep")
+        json_tag = self.client.get("/status/", {"device": "t019-rep"})["ETag"]
+        packed = self.client.get("/status/", {"device": "t019-rep", "format": "packed"},
+                                 HTTP_IF_NONE_MATCH=json_tag)
+        self.assertEqual(packed.status_code, 200)
+        self.assertNotEqual(packed["ETag"], json_tag)
+
+    def test_cached_json_body_matches_a_fresh_render(self):
+        snap = store.publish({"tags": {"a": 1.5}, "raw": [1, 2]}, device="t019-body")
+        for _ in range(2):   # the second response reuses the rendered snapshot
+            body = self.client.get("/status/", {"device": "t019-body"}).json()
+            self.assertEqual({k: v for k, v in body.items() if k not in ("age", "stale")}, snap)
+            self.assertFalse(body["stale"])
+
+
+class StartupTests(SimpleTestCase):
+    def test_is_web_process(self):
+        web = [["gunicorn", "backend.wsgi"], ["/venv/bin/uvicorn", "backend.asgi:application"],
+               ["/venv/lib/python3.11/site-packages/daphne/__main__.py", "backend.asgi:application"],
+               ["manage.py", "runserver", "--noreload"]]
+        other = [["manage.py", "migrate"], ["manage.py", "test"], ["manage.py", "run_poller"],
+                 ["manage.py", "runserver"], ["bench/loadtest.py"], ["python"], []]
+        for argv in web:
+            self.assertTrue(poller.is_web_process(argv), argv)
+        with mock.patch.dict(os.environ, {"RUN_MAIN": ""}):
+            for argv in other:
+                self.assertFalse(poller.is_web_process(argv), argv)
+        with mock.patch.dict(os.environ, {"RUN_MAIN": "true"}):   # the autoreloader's serving child
+            self.assertTrue(poller.is_web_process(["manage.py", "runserver"]))
+
+    def test_process_role(self):
+        def role(mode, who, web=True, elected=True):
+            with mock.patch.multiple(poller, POLLER_MODE=mode, POLLER_ROLE=who), \
+                    mock.patch.object(poller, "is_web_process", return_value=web), \
+                    mock.patch.object(poller, "_elect", return_value=elected):
+                return poller.process_role()
+
+        self.assertEqual(role("thread", "auto"), "thread")
+        self.assertEqual(role("thread", "auto", elected=False), "follow")
+        self.assertEqual(role("thread", "auto", web=False), "off")       # migrate, shell, tests
+        self.assertEqual(role("service", "auto"), "service")
+        self.assertEqual(role("thread", "web", web=False, elected=False), "thread")
+        self.assertEqual(role("thread", "none"), "off")
+        self.assertEqual(role("off", "auto"), "off")
+
+    def test_one_process_per_lock_file_wins_the_election(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, "poller.lock")
+        with mock.patch.object(poller, "_lock_file", None):
+            self.assertTrue(poller._elect(path))
+            held = poller._lock_file
+            self.assertTrue(poller._elect(path))        # already elected: keeps it
+            self.assertIs(poller._lock_file, held)
+
+            poller._lock_file = None                     # another process (own open file) tries
+            self.assertFalse(poller._elect(path))
+            held.close()                                 # the poller exits; the kernel drops the lock
+            self.assertTrue(poller._elect(path))
+            poller._lock_file.close()
+
+
+class ProductionTests(SimpleTestCase):
+    def setUp(self):
+        self.spec = CounterSpec("pcs", 125)
+        self.agg = ProductionAggregator(specs=[self.spec], path=os.devnull)
+        self.agg._slots["t021"] = [(self.spec, 0)]   # the counter is raw[0]
+
+    def feed(self, *readings, start=1000.0):
+        for i, raw in enumerate(readings):
+            self.agg.observe({"device": "t021", "ts": start + i, "raw": [raw]})
+        return self.agg.summary("t021")["counters"]["pcs"]
+
+    def test_increments_count_pieces(self):
+        out = self.feed(10, 12, 12, 15)
+        self.assertEqual((out["total"], out["resets"], out["rollovers"]), (5, 0, 0))
+
+    def test_drop_near_the_top_is_a_rollover(self):
+        out = self.feed(65530, 65535, 4)
+        self.assertEqual((out["total"], out["rollovers"], out["resets"]), (5 + 5, 1, 0))
+
+    def test_drop_from_mid_range_is_a_reset(self):
+        out = self.feed(500, 510, 3)
+        self.assertEqual((out["total"], out["resets"], out["rollovers"]), (10 + 3, 1, 0))
+
+    def test_noted_reset_is_never_taken_for_a_rollover(self):
+        self.feed(65530, 65534, start=time.time() - 2)
+        self.agg.note_reset("t021", 125)
+        out = self.feed(0, 2, start=time.time())
+        self.assertEqual((out["total"], out["resets"], out["rollovers"]), (4 + 2, 1, 0))
+
+    def test_the_reset_hint_expires(self):
+        now = time.time()
+        self.agg.note_reset("t021", 125)
+        self.feed(65530, start=now + RESET_GRACE + 1)
+        out = self.feed(1, start=now + RESET_GRACE + 2)
+        self.assertEqual((out["rollovers"], out["resets"]), (1, 0))
+
+    def test_32_bit_counters_span_two_registers(self):
+        spec = CounterSpec("big", 200, bits=32)
+        agg = ProductionAggregator(specs=[spec], path=os.devnull)
+        agg._slots["t021-32"] = [(spec, 1)]
+        for i, (hi, lo) in enumerate([(0, 65535), (1, 2)]):
+            agg.observe({"device": "t021-32", "ts": 1000.0 + i, "raw": [9, hi, lo]})
+        self.assertEqual(agg.summary("t021-32")["counters"]["big"]["total"], 3)
+
+    def test_reset_endpoint_notes_the_reset_only_after_a_verified_write(self):
+        with mock.patch("modbus_reader.views.production.note_reset") as note_reset:
+            with mock.patch("modbus_reader.views.write_zero_and_verify", return_value=(False, "connect_failed")):
+                self.assertEqual(self.client.post("/reset-psc/").status_code, 502)
+            note_reset.assert_not_called()
+            with mock.patch("modbus_reader.views.write_zero_and_verify",
+                            return_value=(True, {"wrote": 0, "readback": 0})):
+                self.assertEqual(self.client.post("/reset-set/").status_code, 200)
+            note_reset.assert_called_once()
+
+
+class AlarmTests(SimpleTestCase):
+    T = time.time() + 3600   # ahead of the clock, so reading the alarms fires no timers early
+
+    def engine(self, **rule):
+        return AlarmEngine(rules=[Rule(name="r", tag="t", **rule)])
+
+    def feed(self, engine, at, value=None):
+        changes = {} if value is None else {"t": value}
+        engine.observe({"device": "t022", "ts": self.T + at, "changes": changes})
+
+    def history(self, engine):
+        return [(what, ts - self.T) for _, ts, what, *_ in engine.events()[0]]
+
+    def test_hysteresis_holds_the_alarm_until_the_value_clears_the_band(self):
+        engine = self.engine(high=100, hysteresis=5)
+        for at, value in enumerate([101, 97, 99, 94, 99, 101]):
+            self.feed(engine, at, value)
+        self.assertEqual(self.history(engine), [("raised", 0), ("cleared", 3), ("raised", 5)])
+
+    def test_on_delay_needs_the_condition_to_hold(self):
+        engine = self.engine(high=100, on_delay=5)
+        self.feed(engine, 0, 101)
+        self.feed(engine, 2, 99)    # dropped back: the pending raise is cancelled
+        self.feed(engine, 3, 101)
+        self.feed(engine, 7)
+        self.assertEqual(engine.active(), [])
+        self.feed(engine, 8)
+        self.assertEqual(self.history(engine), [("raised", 8)])
+
+    def test_off_delay_keeps_the_alarm_while_clearing(self):
+        engine = self.engine(high=100, off_delay=10)
+        self.feed(engine, 0, 101)
+        self.feed(engine, 1, 90)
+        self.assertTrue(engine.active()[0]["clearing"])
+        self.feed(engine, 5, 105)   # tripped again: stays raised
+        self.feed(engine, 6, 90)
+        self.feed(engine, 15)
+        self.assertEqual(len(engine.active()), 1)
+        self.feed(engine, 16)
+        self.assertEqual(engine.active(), [])
+        self.assertEqual(self.history(engine), [("raised", 0), ("cleared", 16)])
+
+    def test_stalled_fires_and_rearms_after_the_next_change(self):
+        engine = self.engine(stalled=30)
+        self.feed(engine, 0, 1)
+        self.feed(engine, 20, 2)    # moves the deadline to 50 without a new heap entry
+        self.assertEqual(len(engine._timers), 1)
+        self.feed(engine, 49)
+        self.assertEqual(engine.active(), [])
+        self.feed(engine, 50)
+        self.feed(engine, 51, 3)
+        self.feed(engine, 81)
+        self.assertEqual(self.history(engine), [("raised", 50), ("cleared", 51), ("raised", 81)])
+
+    def test_deadlines_moving_earlier_keep_the_heap_bounded(self):
+        engine = self.engine(stalled=30)
+        for i in range(1000):       # a clock stepping back moves the deadline earlier every time
+            self.feed(engine, -i, i)
+        self.assertLessEqual(len(engine._timers), 2 * engine._states + 16)
+        self.feed(engine, -999 + 29)
+        self.assertEqual(engine.active(), [])
+        self.feed(engine, -999 + 30)
+        self.assertEqual(self.history(engine), [("raised", -999 + 30)])
+
+    def test_workers_mirror_the_owners_events_and_active_set(self):
+        owner, worker = self.engine(high=100), AlarmEngine(rules=[])
+        sent = []
+        owner.sink = lambda msg: sent.append(json.loads(json.dumps(msg)))   # as it crosses the socket
+        for at, value in enumerate([101, 90, 101]):
+            self.feed(owner, at, value)
+        self.assertEqual([m["seq"] for m in sent], [1, 2, 3])
+
+        for msg in sent + sent[-1:]:   # the hub replays the last frame on reconnect
+            worker.ingest(msg)
+        self.assertEqual(worker.events(), owner.events())
+        self.assertEqual(worker.active(), owner.active())
+        self.assertEqual(worker.events(since=2, device="t022")[0], owner.events(since=2)[0])
+
+    def test_a_gap_or_an_owner_restart_restarts_the_mirror(self):
+        worker = AlarmEngine(rules=[])
+        event = lambda seq: [seq, self.T, "raised", "r", "t022", "t", 101]
+        worker.ingest({"op": "alarms", "seq": 2, "events": [event(1), event(2)], "active": []})
+        worker.ingest({"op": "alarms", "seq": 5, "events": [event(5)], "active": []})   # 3, 4 missed
+        self.assertEqual(worker.events(), ([tuple(event(5))], 5))
+        worker.ingest({"op": "alarms", "seq": 1, "events": [event(1)], "active": []})   # restarted owner
+        self.assertEqual(worker.events(), ([tuple(event(1))], 1))
+
+
+class FakeDevice:
+    """Sync client stand-in for the probe: `readable` addresses answer, any other is an illegal address."""
+
+    class Response:
+        def __init__(self, registers=(), exception_code=None):
+            self.registers, self.exception_code = list(registers), exception_code
+
+        def isError(self):
+            return self.exception_code is not None
+
+    connected = True
+
+    def __init__(self, readable, regs=None):
+        self.readable, self.regs, self.calls = set(readable), regs or {}, []
+
+    def read_holding_registers(self, address, count, **kw):
+        self.calls.append((address, count))
+        span = range(address, address + count)
+        if not self.readable.issuperset(span):
+            return self.Response(exception_code=2)
+        return self.Response(self.regs.get(a, 0) for a in span)
+
+    def close(self):
+        pass
+
+
+def floats_at(values, order):
+    """Registers holding `values` as float32 in `order`, at the given addresses."""
+    regs = {}
+    for address, value in values.items():
+        regs[address], regs[address + 1] = encode_value(value, "float32", *order)
+    return regs
+
+
+class ProbeTests(SimpleTestCase):
+    def scan(self, readable, end, **kwargs):
+        device = FakeDevice(readable)
+        scanner = probe.RegisterScanner(_reader(device, 1), **kwargs)
+        return scanner.scan(0, end), scanner.requests
+
+    def test_a_fully_readable_space_costs_one_read_per_125(self):
+        spans, requests = self.scan(range(1000), 1000)
+        self.assertEqual((spans, requests), ([(0, 1000)], 8))
+
+    def test_halving_and_galloping_find_every_boundary(self):
+        readable = [*range(0, 300), *range(310, 330), *range(1000, 1100)]
+        spans, requests = self.scan(readable, 1200)
+        self.assertEqual(spans, [(0, 300), (310, 330), (1000, 1100)])
+        self.assertLess(requests, 120)   # vs 1200 single reads
+
+    def test_islands_shorter_than_max_skip_can_be_jumped(self):
+        readable = [*range(0, 10), *range(80, 82), *range(200, 210)]
+        self.assertEqual(self.scan(readable, 210)[0], [(0, 10), (200, 210)])   # gallops 41, 73, 105
+        self.assertEqual(self.scan(readable, 210, max_skip=4)[0], [(0, 10), (80, 82), (200, 210)])
+
+    def test_io_errors_are_retried_then_taken_as_unreadable(self):
+        failures = iter([IOError("timeout")])
+
+        def read(address, count):
+            for e in failures:
+                raise e
+            return None if address >= 10 else [1] * count
+
+        scanner = probe.RegisterScanner(read, max_count=10, retries=1)
+        self.assertEqual(scanner.scan(0, 20), [(0, 10)])
+        self.assertEqual(probe.RegisterScanner(mock.Mock(side_effect=IOError), retries=2).scan(0, 1), [])
+
+    def test_the_word_order_is_detected_from_the_samples(self):
+        for order in probe.ORDERS:
+            regs = floats_at({100: 15.0, 102: 1234.5, 104: -0.75, 110: 88.125}, order)
+            regs.update({120: 7, 121: 300})              # counters, not floats
+            device = FakeDevice(range(100, 130), regs)
+            scanner = probe.RegisterScanner(_reader(device, 1))
+            spans = scanner.scan(100, 130)
+            samples = scanner.sample(spans)
+            scores = probe.detect_order(samples, probe.islands(samples))
+            self.assertEqual(max(probe.ORDERS, key=lambda o: scores[o]), order, probe.ORDER_NAMES[order])
+            self.assertEqual(probe.layout(samples, probe.islands(samples), order),
+                             [(100, "float32"), (102, "float32"), (104, "float32"), (110, "float32"),
+                              (120, "uint16"), (121, "uint16")])
+
+    def test_build_map_keeps_per_tag_orders(self):
+        cdab, abcd = ("little", "big"), ("big", "big")
+        regs = {**floats_at({0: 1.5, 2: 2.5}, cdab), **floats_at({4: 3.5}, abcd)}
+        samples = {a: [regs.get(a, 0)] for a in range(6)}
+        current = [Tag("a", 0), Tag("b", 2), Tag("c", 4, word_order="big", byte_order="big")]
+        current[0].word_order = current[1].word_order = "little"   # the map-level order of the old map
+        spec, notes = probe.build_map(samples, current, cdab)
+        self.assertEqual((spec["word_order"], spec["byte_order"]), cdab)
+        self.assertEqual([{k: t.get(k) for k in ("name", "word_order", "byte_order")} for t in spec["tags"]],
+                         [{"name": "a", "word_order": None, "byte_order": None},
+                          {"name": "b", "word_order": None, "byte_order": None},
+                          {"name": "c", "word_order": "big", "byte_order": "big"}])
+        self.assertEqual(notes, [])
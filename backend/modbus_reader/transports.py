@@ -0,0 +1,157 @@
+# backend/modbus_reader/transports.py
+"""
+Client construction per transport, and the RS-485 bus scheduler.
+
+TCP devices each get their own connection. RTU devices that share a serial port
+share one SerialLine: one client, one request queue (the bus is half-duplex, so
+only one request may be on the wire), and the 3.5-character silent interval Modbus
+RTU requires between frames. A unit holds the bus for its whole cycle, so its
+coalesced blocks go out back to back and the units on the line are swept one after
+another with no idle time between them. (RTU has no multi-unit request, so this
+sweep is as far as batching across unit ids can go.)
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from pymodbus.client import AsyncModbusTcpClient
+
+TCP, RTU = "tcp", "rtu"
+
+
+class BusQueue:
+    """
+    Per-bus request queue. One holder at a time; when the bus frees up it goes to
+    the waiting unit that was served longest ago, so an overloaded line degrades
+    to an even round robin instead of starving whoever lost the race.
+    """
+
+    def __init__(self):
+        self._busy = False
+        self._order = itertools.count()
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._served: Dict[int, float] = {}
+
+    @asynccontextmanager
+    async def turn(self, unit_id: int):
+        if self._busy or self._waiters:
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (self._served.get(unit_id, 0.0), next(self._order), fut))
+            try:
+                await fut                      # the releaser hands the bus over directly
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self._release()
+                raise
+        self._busy = True
+        try:
+            yield
+        finally:
+            self._served[unit_id] = time.monotonic()
+            self._release()
+
+    def _release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._busy = False
+
+
+class SerialLine:
+    def __init__(self, port: str, baudrate: int = 9600, parity: str = "N",
+                 bytesize: int = 8, stopbits: int = 1):
+        self.port = port
+        self.baudrate = baudrate
+        self.parity = parity
+        self.bytesize = bytesize
+        self.stopbits = stopbits
+        bits = 1 + bytesize + (0 if parity.upper() == "N" else 1) + stopbits
+        self.char_time = bits / baudrate
+        # spec: 3.5 chars, fixed at 1.75 ms above 19200 baud
+        self.frame_gap = 3.5 * self.char_time if baudrate <= 19200 else 0.00175
+        self.client = None
+        self.last_frame = 0.0
+        self.queue = BusQueue()
+
+    def frame_time(self, nbytes: int) -> float:
+        return nbytes * self.char_time
+
+    def request_budget(self, count: int) -> float:
+        """Wire time of one FC3 round trip: 8-byte request + (5 + 2*count)-byte reply + gaps."""
+        return self.frame_time(8 + 5 + 2 * count) + 2 * self.frame_gap
+
+    async def ensure_connected(self, timeout: float):
+        if self.client is not None and self.client.connected:
+            return self.client
+        self.close()
+        from pymodbus.client import AsyncModbusSerialClient   # needs pyserial
+        client = AsyncModbusSerialClient(self.port, baudrate=self.baudrate, parity=self.parity,
+                                         bytesize=self.bytesize, stopbits=self.stopbits,
+                                         timeout=timeout, retries=0, reconnect_delay=0)
+        if not await client.connect():
+            client.close()
+            return None
+        self.client = client
+        return client
+
+    def close(self):
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+            self.client = None
+
+
+class PacedClient:
+    """
+    The line's client as one unit sees it: every request waits out the inter-frame
+    gap since the last frame on the bus. Callers must hold a line.queue turn.
+    """
+
+    def __init__(self, line: SerialLine):
+        self.line = line
+
+    @property
+    def connected(self) -> bool:
+        return self.line.client is not None and self.line.client.connected
+
+    async def read_holding_registers(self, *args, **kwargs):
+        wait = self.line.last_frame + self.line.frame_gap - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        try:
+            return await self.line.client.read_holding_registers(*args, **kwargs)
+        finally:
+            self.line.last_frame = time.monotonic()
+
+    def close(self):
+        pass   # the line owns the socket; a failed unit must not drop its neighbours
+
+
+_lines: Dict[str, SerialLine] = {}
+
+
+def serial_line(dev) -> SerialLine:
+    """The shared SerialLine for an RTU device (first device on a port fixes its settings)."""
+    line = _lines.get(dev.host)
+    if line is None:
+        line = _lines[dev.host] = SerialLine(dev.host, dev.baudrate, dev.parity,
+                                             dev.bytesize, dev.stopbits)
+    elif line.baudrate != dev.baudrate or line.parity != dev.parity:
+        print(f"[Transport] {dev.name}: {dev.host} already opened at "
+              f"{line.baudrate} {line.parity}; ignoring this device's settings")
+    return line
+
+
+def tcp_client(dev) -> "AsyncModbusTcpClient":
+    from pymodbus.client import AsyncModbusTcpClient
+    # reconnect_delay=0: the breaker does the backoff instead of pymodbus' background reconnect
+    return AsyncModbusTcpClient(dev.host, port=dev.port, timeout=dev.timeout,
+                                retries=0, reconnect_delay=0)
@@ -1,9 +1,17 @@
 from django.urls import path
-from .views import status, write_pcs_zero, write_set_zero
+from .views import (status, status_stream, changes_since, metrics, tag_history, export_history,
+                    production_summary, active_alarms, write_pcs_zero, write_set_zero)
 from .views_diag import diag  # TEMP
 
 urlpatterns = [
     path('status/', status, name='modbus_status'),
+    path('status/stream/', status_stream, name='modbus_status_stream'),
+    path('changes/', changes_since, name='modbus_changes'),
+    path('history/', tag_history, name='modbus_history'),
+    path('history/export/', export_history, name='modbus_history_export'),
+    path('production/', production_summary, name='modbus_production'),
+    path('alarms/', active_alarms, name='modbus_alarms'),
+    path('metrics', metrics, name='modbus_metrics'),
     path("diag/", diag, name="diag"),  # TEMP
        path("reset-psc/", write_pcs_zero, name="write_zero_psc"),
        path("reset-set/", write_set_zero, name="write_zero_set"),
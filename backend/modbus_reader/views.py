@@ -1,8 +1,21 @@
+import json
 import os
-from django.http import JsonResponse
-from .modbus import read_modbus, last_values
+import time
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from .snapshot import store, with_age, DEFAULT_DEVICE
+from .breaker import board, CLOSED
+from .poller import STALE_AFTER
+from .changes import detector
+from . import encoding, export
+from .http_cache import ResponseCache, etag, not_modified
+from .history import history
+from .production import production
+from .alarms import alarms
+from .metrics import registry
+from .stream import STREAM_WSGI, snapshot_events, snapshot_events_sync
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+from .connections import TransportUnsupported
 from .modbus_utils import write_zero_and_verify
 
 # Environment overrides (optional)
@@ -14,19 +27,216 @@ MODBUS_REG_ADDR_2 = int(os.getenv("MODBUS_REG_ADDR", "127"))  # holding register
 
 
 def status(request):
-    read_modbus()
-    return JsonResponse(last_values)
+    """
+    /status/[?device=default][&since=<change_seq>][&format=json|msgpack|packed][&schema=<id>][&raw=1]
+    Served from the poller's snapshot; the request never waits on the PLC.
+    since= returns only the tags changed after that change_seq ("full": true when it
+    was missed). Compact formats are negotiated by Accept or format= (see encoding.py).
+    The ETag follows the snapshot seq: If-None-Match gets a 304 until the next poll.
+    """
+    device = request.GET.get("device", DEFAULT_DEVICE)
+    content_type = encoding.negotiate(request.headers.get("Accept", ""), request.GET.get("format"))
+    if content_type is None:
+        return JsonResponse({"ok": False, "error": "format must be one of " + ", ".join(
+            k for k, v in encoding.FORMATS.items() if v in encoding.available())}, status=406)
+    try:
+        since = int(request.GET["since"]) if "since" in request.GET else None
+        client_schema = int(request.GET["schema"]) if "schema" in request.GET else None
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "since/schema must be integers"}, status=400)
+
+    snap = store.get(device)
+    out = with_age(snap, STALE_AFTER)
+    breaker = board.for_device(device)
+    if breaker is not None:            # known when this process runs the poller
+        out["health"] = breaker.health()
+        if breaker.state != CLOSED:    # last-known values, flagged at once rather than after STALE_AFTER
+            out["stale"] = True
+    raw = request.GET.get("raw", "") in ("1", "true")
+    tag = etag(device, out["seq"], out.get("change_seq"), out["stale"], breaker and breaker.state,
+               content_type, since, client_schema, raw)
+    response = not_modified(request, tag)
+    if response is not None:
+        response["Vary"] = "Accept"
+        return response
+    if since is not None:
+        events, missed = detector.since(since, device)
+        out = encoding.delta(out, events, missed or not 0 < since <= detector.seq)
+
+    if content_type == encoding.JSON and since is None and snap is not None:
+        response = HttpResponse(_status_json(snap, out), content_type="application/json")
+    elif content_type == encoding.JSON:
+        response = JsonResponse(out)
+    else:
+        names = list((snap or {}).get("tags") or ())   # the tag index delta positions refer to
+        body, headers = encoding.encode(out, content_type, names, client_schema, raw)
+        response = HttpResponse(body, content_type=content_type)
+        for key, value in headers.items():
+            response[key] = value
+    response["ETag"] = tag
+    response["Cache-Control"] = "no-cache"   # always revalidate; unchanged polls get a 304
+    response["Vary"] = "Accept"
+    return response
+
+
+_status_bodies = ResponseCache()
+
+
+def _status_json(snap, out) -> bytes:
+    """
+    JSON body for a full /status/. The snapshot part is rendered once per seq; only
+    age/stale/health (which move between polls) are rendered per request.
+    """
+    prefix = _status_bodies.get(snap["device"], snap["seq"])
+    if prefix is None:
+        prefix = _status_bodies.put(snap["device"], snap["seq"], json.dumps(snap).encode("utf-8")[:-1])
+    extra = {k: out[k] for k in ("age", "stale", "health") if k in out}
+    return prefix + b", " + json.dumps(extra).encode("utf-8")[1:]
+
+def _is_asgi(request) -> bool:
+    return request.META.get("wsgi.version") is None
+
+async def status_stream(request):
+    """
+    /status/stream/[?device=default][&delta=1] - Server-Sent Events.
+    Pushes a frame only when the device's values change. Needs ASGI (backend.asgi)
+    so idle clients don't hold a worker; under WSGI it answers 204, which makes
+    EventSource give up and the UI poll /status/ (see MODBUS_STREAM_WSGI).
+    """
+    device = request.GET.get("device", DEFAULT_DEVICE)
+    delta = request.GET.get("delta", "") in ("1", "true")
+    if _is_asgi(request):
+        events = snapshot_events(device, delta)
+    elif STREAM_WSGI:
+        events = snapshot_events_sync(device, delta)   # Django would buffer an async iterator forever
+    else:
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"   # don't let nginx buffer the stream
+    return response
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """Prometheus scrape endpoint (text exposition format)."""
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@require_http_methods(["GET"])
+def changes_since(request):
+    """
+    /changes/?since=<seq>[&device=default]
+    Change events after `seq` as [seq, device, tag, ts, value] rows. "missed": true
+    means `since` fell out of the log - reload /status/ and continue from "seq".
+    """
+    try:
+        since = int(request.GET.get("since", "0"))
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "since must be an integer"}, status=400)
+    events, missed = detector.since(since, request.GET.get("device"))
+    return JsonResponse({"seq": detector.seq, "missed": missed, "changes": events})
+
+@require_http_methods(["GET"])
+def tag_history(request):
+    """
+    /history/?tag=float1[&device=default][&start=<epoch>][&end=<epoch>][&points=500]
+    Range defaults to the last hour; returns min/max/avg per bucket.
+    """
+    tag = request.GET.get("tag")
+    if not tag:
+        return JsonResponse({"ok": False, "error": "tag is required"}, status=400)
+    try:
+        end = float(request.GET.get("end", time.time()))
+        start = float(request.GET.get("start", end - 3600))
+        points = int(request.GET.get("points", "500"))
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "start/end/points must be numbers"}, status=400)
+    if end <= start:
+        return JsonResponse({"ok": False, "error": "end must be after start"}, status=400)
+    device = request.GET.get("device", DEFAULT_DEVICE)
+    return JsonResponse(history.query(device, tag, start, end, points))
+
+@require_http_methods(["GET"])
+def export_history(request):
+    """
+    /history/export/?tag=float1&tag=float3[&device=default][&start=<epoch>][&end=<epoch>][&format=csv|parquet]
+    Raw samples (no downsampling) as a streamed download; tag= and device= repeat
+    or take comma lists, no tag = every tag of the device. Range defaults to the
+    last 24 hours.
+    """
+    fmt = request.GET.get("format", "csv")
+    if fmt not in export.FORMATS:
+        return JsonResponse({"ok": False, "error": "format must be csv or parquet"}, status=400)
+    if not export.available(fmt):
+        return JsonResponse({"ok": False, "error": f"{fmt} export needs pyarrow"}, status=406)
+    try:
+        end = float(request.GET.get("end", time.time()))
+        start = float(request.GET.get("start", end - 86400))
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "start/end must be numbers"}, status=400)
+    if end <= start:
+        return JsonResponse({"ok": False, "error": "end must be after start"}, status=400)
+    split = lambda key: [v for item in request.GET.getlist(key) for v in item.split(",") if v]
+    devices = split("device") or [DEFAULT_DEVICE]
+    series = history.series(devices, split("tag"))
+    if not series:
+        return JsonResponse({"ok": False, "error": "no history for that device/tag"}, status=404)
+
+    body = export.encode(fmt, history.export_rows(series, start, end, export.EXPORT_CHUNK))
+    content_type, ext = export.FORMATS[fmt]
+    response = StreamingHttpResponse(export.aiterate(body) if _is_asgi(request) else body,
+                                     content_type=content_type)
+    name = f"history_{'_'.join(devices)}_{int(start)}-{int(end)}.{ext}"
+    response["Content-Disposition"] = f'attachment; filename="{name}"'
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+@require_http_methods(["GET"])
+def production_summary(request):
+    """
+    /production/[?device=default][&minutes=60][&shifts=3][&days=7]
+    Counter totals, rates (pieces/min over 1/5/15 min) and the current minute,
+    shift and day with availability/performance; minutes/shifts/days add that
+    many closed buckets. Precomputed by the aggregator - no history scan.
+    """
+    try:
+        counts = {k: min(int(request.GET.get(k, "0")), cap)
+                  for k, cap in (("minutes", 1440), ("shifts", 21), ("days", 62))}
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "minutes/shifts/days must be integers"}, status=400)
+    return JsonResponse(production.summary(request.GET.get("device", DEFAULT_DEVICE), **counts))
+
+@require_http_methods(["GET"])
+def active_alarms(request):
+    """
+    /alarms/[?device=default][&since=<seq>]
+    Active alarms (oldest first); with since=, also the raised/cleared events after
+    that seq as [seq, ts, event, name, device, tag, value] rows.
+    """
+    device = request.GET.get("device")
+    out = {"active": alarms.active(device)}
+    if "since" in request.GET:
+        try:
+            since = int(request.GET["since"])
+        except ValueError:
+            return JsonResponse({"ok": False, "error": "since must be an integer"}, status=400)
+        out["events"], out["seq"] = alarms.events(since, device)
+    return JsonResponse(out)
 
 @csrf_exempt                 # remove if you handle CSRF from your React app
 @require_http_methods(["POST","GET"])
 def write_pcs_zero(request):
-    ok, data = write_zero_and_verify(
-        host=MODBUS_HOST,
-        port=MODBUS_PORT,
-        slave_id=MODBUS_SLAVE_ID,
-        address=MODBUS_REG_ADDR
-    )
+    try:
+        ok, data = write_zero_and_verify(
+            host=MODBUS_HOST,
+            port=MODBUS_PORT,
+            slave_id=MODBUS_SLAVE_ID,
+            address=MODBUS_REG_ADDR,
+            device=DEFAULT_DEVICE,
+        )
+    except TransportUnsupported as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=501)
     if ok:
+        production.note_reset(DEFAULT_DEVICE, MODBUS_REG_ADDR)   # the counter's next drop is this reset
         return JsonResponse({
             "ok": True,
             "address": MODBUS_REG_ADDR,
@@ -39,13 +249,18 @@ def write_pcs_zero(request):
 @csrf_exempt                 # remove if you handle CSRF from your React app
 @require_http_methods(["POST","GET"])
 def write_set_zero(request):
-    ok, data = write_zero_and_verify(
-        host=MODBUS_HOST,
-        port=MODBUS_PORT,
-        slave_id=MODBUS_SLAVE_ID,
-        address=MODBUS_REG_ADDR_2
-    )
+    try:
+        ok, data = write_zero_and_verify(
+            host=MODBUS_HOST,
+            port=MODBUS_PORT,
+            slave_id=MODBUS_SLAVE_ID,
+            address=MODBUS_REG_ADDR_2,
+            device=DEFAULT_DEVICE,
+        )
+    except TransportUnsupported as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=501)
     if ok:
+        production.note_reset(DEFAULT_DEVICE, MODBUS_REG_ADDR_2)   # the counter's next drop is this reset
         return JsonResponse({
             "ok": True,
             "address": MODBUS_REG_ADDR,
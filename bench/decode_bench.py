@@ -0,0 +1,117 @@
+# bench/decode_bench.py — batch decoder vs. the original per-pair decode
+#
+#   python bench/decode_bench.py [--tags 200] [--repeat 2000]
+#
+# Checks that BlockDecoder agrees with a straightforward per-tag reference for every
+# type and all four word/byte orders, then times both on a block of N float32 tags.
+import argparse
+import os
+import random
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from modbus_reader.decode import TYPES, BlockDecoder, decode_array  # noqa: E402
+from modbus_reader.register_map import Tag, plan_reads               # noqa: E402
+
+ORDERS = [("big", "big"), ("little", "big"), ("big", "little"), ("little", "little")]
+
+
+# ---- the original implementation (modbus.py before the batch decoder) ----
+def legacy_decode_float32_from_pair(reg_hi, reg_lo, word_order="big", byte_order="big"):
+    try:
+        if word_order.lower() == "big":
+            words = (reg_hi, reg_lo)
+        else:
+            words = (reg_lo, reg_hi)
+
+        def word_to_bytes(w):
+            high = (w >> 8) & 0xFF
+            low = w & 0xFF
+            return bytes([high, low]) if byte_order.lower() == "big" else bytes([low, high])
+
+        b = word_to_bytes(words[0]) + word_to_bytes(words[1])
+        return struct.unpack(">f", b)[0]
+    except Exception:
+        return None
+
+
+def legacy_regs_to_float_list(regs, word_order="big", byte_order="big"):
+    out = []
+    for i in range(0, len(regs), 2):
+        pair = regs[i:i + 2]
+        if len(pair) < 2:
+            break
+        f = legacy_decode_float32_from_pair(pair[0], pair[1], word_order, byte_order)
+        if f is None:
+            break
+        out.append(f)
+    return out
+
+
+def reference_tag(tag, regs):
+    """Arrange words/bytes by hand, like the legacy code, for any type."""
+    words = list(regs) if tag.word_order == "big" else list(reversed(regs))
+    b = b"".join(w.to_bytes(2, "big" if tag.byte_order == "big" else "little") for w in words)
+    return struct.unpack(">" + TYPES[tag.type][1], b)[0] * tag.scale
+
+
+def same(a, b):
+    return a == b or (a != a and b != b)   # NaN == NaN for our purposes
+
+
+def check():
+    rnd = random.Random(1)
+    for type_ in TYPES:
+        for wo, bo in ORDERS:
+            tags, addr = [], 0
+            for i in range(20):
+                tags.append(Tag(f"t{i}", addr, type=type_, word_order=wo, byte_order=bo,
+                                scale=rnd.choice([1.0, 0.1])))
+                addr = tags[-1].end + rnd.choice([0, 0, 1, 3])
+            regs = [rnd.randrange(65536) for _ in range(addr)]
+            for block in plan_reads(tags, max_gap=8):
+                got = block.decoder.decode(regs[block.start:block.end])
+                for tag, value in zip(block.tags, got):
+                    want = reference_tag(tag, regs[tag.address:tag.end])
+                    assert same(value, want), (type_, wo, bo, tag, value, want)
+        regs = [rnd.randrange(65536) for _ in range(40)]
+        for wo, bo in ORDERS:
+            assert all(same(a, b) for a, b in zip(decode_array(regs, "float32", wo, bo),
+                                                   legacy_regs_to_float_list(regs, wo, bo)))
+    print("decoders agree for", ", ".join(TYPES), "x 4 word/byte orders")
+
+
+def bench(n_tags, repeat):
+    rnd = random.Random(2)
+    regs = [rnd.randrange(65536) for _ in range(2 * n_tags)]
+    tags = [Tag(f"t{i}", 2 * i) for i in range(n_tags)]
+    blocks = plan_reads(tags)
+
+    def legacy():
+        legacy_regs_to_float_list(regs)
+
+    def batch():
+        for b in blocks:
+            b.decoder.decode(regs[b.start:b.end])
+
+    def flat():
+        decode_array(regs)
+
+    print(f"{n_tags} float32 tags ({len(blocks)} blocks), {repeat} iterations")
+    base = None
+    for name, fn in (("legacy per-pair", legacy), ("BlockDecoder", batch), ("decode_array", flat)):
+        t = min(timeit.repeat(fn, number=repeat, repeat=5)) / repeat
+        base = base or t
+        print(f"  {name:16s} {t * 1e6:9.2f} us/cycle  {base / t:6.1f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tags", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+    check()
+    bench(args.tags, args.repeat)
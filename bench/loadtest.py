@@ -0,0 +1,235 @@
+# bench/loadtest.py — repeatable backend performance baseline against a simulated fleet
+#
+#   python bench/loadtest.py --devices 100 --duration 15 --delay 0.005 --jitter 0.002 \
+#                            --fault-rate 0.01 --http-clients 8 --sse-clients 20 [--json out.json]
+#
+# 1. starts bench/simfleet.py in a child process (N devices on local ports)
+# 2. boots Django in this process with MODBUS_DEVICES_FILE pointing at the fleet,
+#    so the app's own poller is what gets measured
+# 3. phase "poller": poller alone -> scans/s, request and scan latency, CPU per device
+# 4. phase "load": poller + HTTP clients on /status/ + SSE subscribers on /status/stream/
+#    -> req/s and p50/p99 for HTTP, frames/s and publish->client lag for SSE
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "backend"))
+
+import simfleet  # noqa: E402
+
+
+def pct(samples, q):
+    if not samples:
+        return None
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def hist_quantile(hist, q):
+    """Quantile over all label sets of a metrics.Histogram (linear inside the bucket)."""
+    with hist._lock:
+        rows = [list(r) for r in hist._values.values()]
+    if not rows:
+        return None
+    counts = [sum(col) for col in zip(*[r[:-1] for r in rows])]
+    total = sum(counts)
+    if total == 0:
+        return None
+    target, seen, lower = q * total, 0, 0.0
+    for upper, n in zip(hist.buckets + (float("inf"),), counts):
+        if seen + n >= target and n:
+            if upper == float("inf"):
+                return lower
+            return lower + (upper - lower) * (target - seen) / n
+        seen += n
+        lower = upper
+    return lower
+
+
+def counter_total(counter, **match):
+    with counter._lock:
+        items = list(counter._values.items())
+    names = counter.labelnames
+    return sum(v for k, v in items
+               if all(dict(zip(names, k)).get(m) == want for m, want in match.items()))
+
+
+def cpu_seconds():
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+
+def wait_ports(host, ports, timeout=30.0):
+    deadline = time.time() + timeout
+    for port in ports:
+        while True:
+            try:
+                socket.create_connection((host, port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise SystemExit(f"simulated device on port {port} never came up")
+                time.sleep(0.1)
+
+
+def ms(v):
+    return None if v is None else round(v * 1000, 2)
+
+
+def http_load(clients, duration, devices, results):
+    from django.test import Client
+
+    stop = time.time() + duration
+
+    def worker(i):
+        c = Client()
+        lat = []
+        n = 0
+        while time.time() < stop:
+            t = time.perf_counter()
+            c.get("/status/", {"device": devices[n % len(devices)]})
+            lat.append(time.perf_counter() - t)
+            n += 1
+        results.extend(lat)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+async def sse_load(clients, duration, devices):
+    from django.test import AsyncClient
+
+    lags, frames = [], [0]
+
+    async def subscriber(i):
+        response = await AsyncClient().get("/status/stream/", {"device": devices[i % len(devices)]})
+        it = response.streaming_content.__aiter__()
+        try:
+            while True:
+                chunk = await it.__anext__()
+                text = chunk.decode() if isinstance(chunk, bytes) else chunk
+                if text.startswith(":"):
+                    continue
+                frames[0] += 1
+                data = json.loads(text.split("data: ", 1)[1])
+                lags.append(time.time() - data["ts"])
+        except (asyncio.CancelledError, StopAsyncIteration):
+            pass
+
+    tasks = [asyncio.create_task(subscriber(i)) for i in range(clients)]
+    await asyncio.sleep(duration)
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return frames[0], lags
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    simfleet.add_arguments(ap)
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    ap.add_argument("--warmup", type=float, default=3.0)
+    ap.add_argument("--interval", type=float, default=1.0, help="poll interval per device")
+    ap.add_argument("--timeout", type=float, default=1.0, help="per-device cycle timeout")
+    ap.add_argument("--http-clients", type=int, default=4)
+    ap.add_argument("--sse-clients", type=int, default=10)
+    ap.add_argument("--json", help="also write the report to this file")
+    args = ap.parse_args()
+
+    cfg = simfleet.config_from_args(args)
+    fleet = multiprocessing.Process(target=simfleet.fleet_main, args=(cfg,), daemon=True)
+    fleet.start()
+    ports = [cfg.base_port + i for i in range(cfg.devices)]
+    wait_ports(cfg.host, ports)
+
+    workdir = tempfile.mkdtemp(prefix="bina-loadtest-")
+    names = [f"sim{i:03d}" for i in range(cfg.devices)]
+    devices_file = os.path.join(workdir, "devices.json")
+    with open(devices_file, "w") as f:
+        json.dump([{"name": n, "host": cfg.host, "port": p, "interval": args.interval,
+                    "timeout": args.timeout} for n, p in zip(names, ports)], f)
+
+    os.environ["MODBUS_DEVICES_FILE"] = devices_file
+    os.environ["MODBUS_HISTORY_DB"] = os.path.join(workdir, "history.sqlite3")
+    os.environ["MODBUS_POLLER_ROLE"] = "web"   # a script, not a server: start the poller anyway
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    django.setup()
+    from django.conf import settings
+    settings.ALLOWED_HOSTS.append("testserver")
+    from modbus_reader import metrics
+    from modbus_reader.snapshot import store
+
+    publishes = [0]
+    store.subscribe(lambda snap: publishes.__setitem__(0, publishes[0] + 1))
+
+    time.sleep(args.warmup)
+    report = {"config": {**vars(args)}}
+
+    # ---- phase 1: poller only ----
+    for m in (metrics.request_seconds, metrics.cycle_seconds, metrics.requests_total,
+              metrics.cycle_timeouts_total):
+        with m._lock:
+            m._values.clear()
+    p0, c0, t0 = publishes[0], cpu_seconds(), time.time()
+    time.sleep(args.duration)
+    elapsed, cpu = time.time() - t0, cpu_seconds() - c0
+    ok = counter_total(metrics.requests_total, result="ok")
+    report["poller"] = {
+        "snapshots_per_s": round((publishes[0] - p0) / elapsed, 1),
+        "expected_per_s": round(cfg.devices / args.interval, 1),
+        "requests_per_s": round(ok / elapsed, 1),
+        "request_errors": counter_total(metrics.requests_total) - ok,
+        "cycle_timeouts": counter_total(metrics.cycle_timeouts_total),
+        "request_p50_ms": ms(hist_quantile(metrics.request_seconds, 0.50)),
+        "request_p99_ms": ms(hist_quantile(metrics.request_seconds, 0.99)),
+        "scan_p50_ms": ms(hist_quantile(metrics.cycle_seconds, 0.50)),
+        "scan_p99_ms": ms(hist_quantile(metrics.cycle_seconds, 0.99)),
+        "cpu_ms_per_device_s": round(cpu * 1000 / elapsed / cfg.devices, 3),
+    }
+
+    # ---- phase 2: poller + HTTP + SSE ----
+    http_lat = []
+    threads = http_load(args.http_clients, args.duration, names, http_lat) if args.http_clients else []
+    c0, t0 = cpu_seconds(), time.time()
+    frames, lags = asyncio.run(sse_load(args.sse_clients, args.duration, names)) \
+        if args.sse_clients else (0, [])
+    for t in threads:
+        t.join()
+    elapsed, cpu = time.time() - t0, cpu_seconds() - c0
+    report["load"] = {
+        "http_req_per_s": round(len(http_lat) / elapsed, 1),
+        "http_p50_ms": ms(pct(http_lat, 0.50)),
+        "http_p99_ms": ms(pct(http_lat, 0.99)),
+        "sse_frames_per_s": round(frames / elapsed, 1),
+        "sse_lag_p50_ms": ms(pct(lags, 0.50)),
+        "sse_lag_p99_ms": ms(pct(lags, 0.99)),
+        "cpu_ms_per_device_s": round(cpu * 1000 / elapsed / cfg.devices, 3),
+    }
+
+    fleet.terminate()
+    print(f"\n{cfg.devices} devices, interval {args.interval}s, delay {cfg.delay}s "
+          f"+-{cfg.jitter}s, faults {cfg.fault_rate}, churn {cfg.churn}/s")
+    for phase in ("poller", "load"):
+        print(f"[{phase}]")
+        for k, v in report[phase].items():
+            print(f"  {k:22s} {v}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
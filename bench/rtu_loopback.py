@@ -0,0 +1,99 @@
+# bench/rtu_loopback.py — RS-485 bus check without hardware
+#
+#   python bench/rtu_loopback.py --units 4 --baud 19200 --duration 10
+#
+# Two pseudo-terminals joined by a byte pump stand in for the cable (like
+# `socat pty,raw pty,raw`); the pump holds each chunk for its wire time at the
+# chosen baud rate so throughput is realistic. A pymodbus RTU server answers for
+# unit ids 1..N with the simulator.py register layout, and the app's AsyncPoller
+# polls all units over one SerialLine. Reports scans/s against the bus ceiling.
+import argparse
+import asyncio
+import os
+import select
+import sys
+import threading
+import time
+import tty
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "backend"))
+
+from pymodbus.datastore import ModbusServerContext   # noqa: E402
+from pymodbus.server import ModbusSerialServer        # noqa: E402
+
+from simfleet import _device_context                  # noqa: E402
+
+
+def pty_pair():
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    return master, os.ttyname(slave)
+
+
+def pump(a: int, b: int, char_time: float):
+    """Copy bytes both ways, delaying each chunk by its transmission time."""
+    while True:
+        ready, _, _ = select.select([a, b], [], [])
+        for src in ready:
+            data = os.read(src, 4096)
+            time.sleep(len(data) * char_time)
+            os.write(b if src == a else a, data)
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--units", type=int, default=4)
+    ap.add_argument("--baud", type=int, default=19200)
+    ap.add_argument("--interval", type=float, default=0.1, help="poll interval per unit")
+    ap.add_argument("--duration", type=float, default=10.0)
+    args = ap.parse_args()
+
+    from modbus_reader import metrics
+    from modbus_reader.aio_poller import AsyncPoller
+    from modbus_reader.devices import Device
+    from modbus_reader.register_map import get_plan
+    from modbus_reader.snapshot import store
+    from modbus_reader.transports import SerialLine
+
+    client_master, client_path = pty_pair()
+    server_master, server_path = pty_pair()
+    line = SerialLine(client_path, args.baud)
+    threading.Thread(target=pump, args=(client_master, server_master, line.char_time),
+                     daemon=True).start()
+
+    context = ModbusServerContext(devices={u: _device_context() for u in range(1, args.units + 1)},
+                                  single=False)
+    server = ModbusSerialServer(context, port=server_path, baudrate=args.baud)
+    server_task = asyncio.create_task(server.serve_forever())
+    await asyncio.sleep(0.5)
+
+    devices = [Device(name=f"unit{u}", host=client_path, port=0, unit_id=u, transport="rtu",
+                      baudrate=args.baud, interval=args.interval, timeout=2.0)
+               for u in range(1, args.units + 1)]
+    counts = {d.name: 0 for d in devices}
+    store.subscribe(lambda snap: counts.__setitem__(snap["device"], counts[snap["device"]] + 1))
+
+    poller = AsyncPoller(devices)
+    task = asyncio.create_task(poller.run())
+    await asyncio.sleep(args.duration)
+    poller.stop()
+    task.cancel()
+    server_task.cancel()
+    await asyncio.gather(task, server_task, return_exceptions=True)
+
+    blocks = get_plan().blocks
+    cycle_wire = sum(line.request_budget(b.count) for b in blocks)
+    scans = sum(counts.values())
+    requests = sum(v for k, v in metrics.requests_total._values.items() if k[1] == "ok")
+    print(f"\n{args.units} units @ {args.baud} baud, {len(blocks)} blocks per cycle "
+          f"({cycle_wire * 1000:.1f} ms wire time per cycle)")
+    print(f"  scans/s        {scans / args.duration:.1f}   (bus ceiling {1 / cycle_wire:.1f}, "
+          f"asked {args.units / args.interval:.1f})")
+    print(f"  requests/s     {requests / args.duration:.1f}")
+    print(f"  per unit       {counts}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
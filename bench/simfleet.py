@@ -0,0 +1,148 @@
+# bench/simfleet.py — many simulated PLCs on local ports, with churn and fault injection
+#
+#   python bench/simfleet.py --devices 50 --base-port 15020 --delay 0.01 --jitter 0.005 \
+#                            --fault-rate 0.01 --disconnect-rate 0.001 --churn 2
+#
+# Device i listens on base_port + i. Each one is the simulator.py register layout served
+# by a pymodbus server on an internal port, fronted by a small TCP proxy that adds the
+# response delay/jitter, drops responses (fault rate) or resets connections.
+import argparse
+import asyncio
+import os
+import random
+import sys
+from dataclasses import dataclass
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pymodbus.datastore import (ModbusDeviceContext, ModbusSequentialDataBlock,  # noqa: E402
+                                ModbusServerContext)
+from pymodbus.server import ModbusTcpServer                                       # noqa: E402
+
+from simulator import BLOCK1_REGS, BLOCK2_REGS, REG1_START, REG2_START           # noqa: E402
+
+INTERNAL_PORT_OFFSET = 10000   # pymodbus servers live at port + offset, behind the proxies
+
+
+@dataclass
+class FleetConfig:
+    devices: int = 10
+    base_port: int = 15020
+    host: str = "127.0.0.1"
+    delay: float = 0.0            # seconds added to every response
+    jitter: float = 0.0           # +- uniform jitter on top of delay
+    fault_rate: float = 0.0       # probability a response is swallowed (client times out)
+    disconnect_rate: float = 0.0  # probability a response resets the connection instead
+    churn: float = 1.0            # register changes per device per second
+    seed: int = 1
+
+
+def _device_context() -> ModbusDeviceContext:
+    device = ModbusDeviceContext(
+        di=ModbusSequentialDataBlock(0, [0] * 100),
+        co=ModbusSequentialDataBlock(0, [0] * 100),
+        hr=ModbusSequentialDataBlock(0, [0] * 1000),
+        ir=ModbusSequentialDataBlock(0, [0] * 100),
+    )
+    device.setValues(3, REG1_START, BLOCK1_REGS)
+    device.setValues(3, REG2_START, BLOCK2_REGS)
+    return device
+
+
+async def _pipe(reader, writer, cfg: FleetConfig, rnd: random.Random, upstream: bool):
+    try:
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            if not upstream:
+                roll = rnd.random()
+                if roll < cfg.disconnect_rate:
+                    break
+                if roll < cfg.disconnect_rate + cfg.fault_rate:
+                    continue
+                wait = cfg.delay + (rnd.uniform(-cfg.jitter, cfg.jitter) if cfg.jitter else 0.0)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _proxy(cfg: FleetConfig, port: int, backend_port: int, rnd: random.Random):
+    async def handle(reader, writer):
+        try:
+            up_reader, up_writer = await asyncio.open_connection(cfg.host, backend_port)
+        except OSError:
+            writer.close()
+            return
+        await asyncio.gather(_pipe(reader, up_writer, cfg, rnd, True),
+                             _pipe(up_reader, writer, cfg, rnd, False))
+
+    server = await asyncio.start_server(handle, cfg.host, port)
+    async with server:
+        await server.serve_forever()
+
+
+async def _churn(cfg: FleetConfig, devices, rnd: random.Random):
+    """Bump a counter word and wobble a float word, `churn` times per device per second."""
+    tick = 0.1
+    while True:
+        await asyncio.sleep(tick)
+        for dev in devices:
+            if rnd.random() < cfg.churn * tick:
+                pcs = dev.getValues(3, REG1_START + 1, 1)[0]
+                dev.setValues(3, REG1_START + 1, [(pcs + 1) & 0xFFFF])
+                dev.setValues(3, REG2_START + 2, [rnd.randrange(65536)])
+
+
+async def run_fleet(cfg: FleetConfig):
+    rnd = random.Random(cfg.seed)
+    devices, tasks = [], []
+    for i in range(cfg.devices):
+        dev = _device_context()
+        devices.append(dev)
+        backend_port = cfg.base_port + INTERNAL_PORT_OFFSET + i
+        server = ModbusTcpServer(ModbusServerContext(devices=dev, single=True),
+                                 address=(cfg.host, backend_port))
+        tasks.append(asyncio.create_task(server.serve_forever()))
+        tasks.append(asyncio.create_task(_proxy(cfg, cfg.base_port + i, backend_port, rnd)))
+    tasks.append(asyncio.create_task(_churn(cfg, devices, rnd)))
+    print(f"[simfleet] {cfg.devices} devices on {cfg.host}:{cfg.base_port}..{cfg.base_port + cfg.devices - 1}",
+          flush=True)
+    await asyncio.gather(*tasks)
+
+
+def fleet_main(cfg: FleetConfig):
+    """Process entry point (used by loadtest.py through multiprocessing)."""
+    try:
+        asyncio.run(run_fleet(cfg))
+    except KeyboardInterrupt:
+        pass
+
+
+def add_arguments(ap: argparse.ArgumentParser):
+    ap.add_argument("--devices", type=int, default=10)
+    ap.add_argument("--base-port", type=int, default=15020)
+    ap.add_argument("--delay", type=float, default=0.0)
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--fault-rate", type=float, default=0.0)
+    ap.add_argument("--disconnect-rate", type=float, default=0.0)
+    ap.add_argument("--churn", type=float, default=1.0)
+    ap.add_argument("--seed", type=int, default=1)
+
+
+def config_from_args(args) -> FleetConfig:
+    return FleetConfig(devices=args.devices, base_port=args.base_port, delay=args.delay,
+                       jitter=args.jitter, fault_rate=args.fault_rate,
+                       disconnect_rate=args.disconnect_rate, churn=args.churn, seed=args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    fleet_main(config_from_args(parser.parse_args()))
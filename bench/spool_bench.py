@@ -0,0 +1,98 @@
+# bench/spool_bench.py — history writes through a database outage
+#
+#   python bench/spool_bench.py [--devices 50] [--tags 20] [--interval 0.1] [--duration 12] [--outage 3:8] [--stall]
+#
+# A fake poller publishes snapshots (every tag changed) into a HistoryStore with its
+# writer threads running; between the --outage seconds every SQLite insert fails
+# ("database is locked"), or with --stall blocks for 5 s before failing. Reports the
+# poll cadence (cycle time, late cycles), how long record() took, and how many
+# samples reached the database - with the spool, and with writes going straight
+# to SQLite (MODBUS_SPOOL_DIR="").
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from modbus_reader import history as history_module  # noqa: E402
+from modbus_reader.history import HistoryStore  # noqa: E402
+
+
+def run(args, spool: bool):
+    tmp = tempfile.mkdtemp()
+    h = HistoryStore(os.path.join(tmp, "h.sqlite3"), spool_dir=os.path.join(tmp, "spool") if spool else "")
+    start_out, end_out = (float(x) for x in args.outage.split(":"))
+    t0 = time.monotonic()
+    insert = h._insert
+
+    def flaky_insert(batch):
+        if start_out <= time.monotonic() - t0 < end_out:
+            if args.stall:
+                time.sleep(5)
+            raise sqlite3.OperationalError("database is locked")
+        return insert(batch)
+
+    h._insert = flaky_insert
+    h.start()
+
+    cycles, record_ms, produced = [], [], 0
+    names = [f"tag{t}" for t in range(args.tags)]
+    devices = [f"dev{d}" for d in range(args.devices)]
+    n, next_at = 0, time.monotonic()
+    while time.monotonic() - t0 < args.duration:
+        begin = time.monotonic()
+        ts = time.time()
+        for dev in devices:
+            s = time.perf_counter()
+            h.record({"device": dev, "ts": ts, "changes": {name: float(n) for name in names}})
+            record_ms.append((time.perf_counter() - s) * 1000)
+        produced += len(devices) * len(names)
+        cycles.append(begin - next_at)   # how late this cycle started
+        n += 1
+        next_at += args.interval
+        time.sleep(max(0.0, next_at - time.monotonic()))
+
+    # give the drainer time to replay after the outage, then stop the world
+    deadline = time.monotonic() + 10
+    stored = 0
+    while time.monotonic() < deadline:
+        time.sleep(0.2)
+        stored = sqlite3.connect(h.path).execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+        if stored >= produced:
+            break
+    if spool:
+        h.flush()
+        stored = sqlite3.connect(h.path).execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+    record_ms.sort()
+    return {"late_max_ms": max(cycles) * 1000, "late_cycles": sum(1 for c in cycles if c > args.interval / 2),
+            "cycles": len(cycles), "record_p99_ms": record_ms[int(len(record_ms) * 0.99)],
+            "record_max_ms": record_ms[-1], "produced": produced, "stored": stored}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", type=int, default=50)
+    ap.add_argument("--tags", type=int, default=20)
+    ap.add_argument("--interval", type=float, default=0.1)
+    ap.add_argument("--duration", type=float, default=12.0)
+    ap.add_argument("--outage", default="3:8", help="start:end seconds of failing inserts")
+    ap.add_argument("--stall", action="store_true", help="inserts hang 5 s before failing")
+    args = ap.parse_args()
+    history_module.FLUSH_INTERVAL = 0.5
+    history_module.print = lambda *a, **k: None
+    history_module.traceback.print_exc = lambda *a, **k: None
+
+    print(f"{args.devices} devices x {args.tags} tags every {args.interval}s for {args.duration}s, "
+          f"database failing {args.outage}s{' (stalling)' if args.stall else ''}")
+    for label, spool in (("spool", True), ("direct", False)):
+        r = run(args, spool)
+        print(f"  {label:<7} cycles {r['cycles']}, late {r['late_cycles']} (max {r['late_max_ms']:.1f} ms), "
+              f"record() p99 {r['record_p99_ms']:.3f} ms max {r['record_max_ms']:.2f} ms, "
+              f"stored {r['stored']}/{r['produced']} ({r['produced'] - r['stored']} lost)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# bench/startup_bench.py — process start cost and what each kind of process starts
+#
+#   python bench/startup_bench.py [--repeat 5] [--backend ../other-checkout/backend]
+#
+# Each scenario runs in a fresh interpreter: django.setup() plus loading the URLconf
+# (what a worker does before its first request), with sys.argv set the way that
+# process would see it. Reports the median time, whether pymodbus / pymysql got
+# imported, and which background threads were running afterwards (a
+# "modbus-poller" thread means this process talks to the PLCs).
+#
+# --backend points at another checkout's backend/ for before/after numbers, e.g.
+#   git worktree add /tmp/before <commit> && python bench/startup_bench.py --backend /tmp/before/backend
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r"""
+import json, sys, threading, time
+sys.argv = ARGV
+t0 = time.perf_counter()
+import django
+django.setup()
+t1 = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+t2 = time.perf_counter()
+result = {"setup_ms": (t1 - t0) * 1000, "urls_ms": (t2 - t1) * 1000,
+          "pymodbus": "pymodbus" in sys.modules, "pymysql": "pymysql" in sys.modules,
+          "threads": sorted(t.name for t in threading.enumerate() if t.name != "MainThread")}
+print("@@" + json.dumps(result), flush=True)
+"""
+
+SCENARIOS = [
+    # label, argv the process sees, extra env
+    ("manage.py migrate", ["manage.py", "migrate"], {}),
+    ("manage.py shell", ["manage.py", "shell"], {}),
+    ("manage.py test", ["manage.py", "test"], {}),
+    ("pytest", ["pytest"], {}),
+    ("gunicorn worker, service mode", ["gunicorn", "backend.wsgi"], {"MODBUS_POLLER_MODE": "service"}),
+    ("gunicorn worker, thread mode", ["gunicorn", "backend.wsgi"], {"MODBUS_POLLER_MODE": "thread"}),
+    ("runserver (serving child)", ["manage.py", "runserver"], {"RUN_MAIN": "true"}),
+    ("runserver (reloader parent)", ["manage.py", "runserver"], {}),
+]
+
+
+def run(backend, argv, env, repeat):
+    code = CHILD.replace("ARGV", repr(argv))
+    child_env = {**os.environ, "DJANGO_SETTINGS_MODULE": "backend.settings",
+                 "PYTHONPATH": backend, "PYTHONDONTWRITEBYTECODE": "1", **env}
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], cwd=backend, env=child_env,
+                             capture_output=True, text=True, timeout=60)
+        _, marker, result = out.stdout.partition("@@")   # background threads may print too
+        if not marker:
+            raise RuntimeError(f"{argv}: child failed\n{out.stderr[-2000:]}")
+        samples.append(json.JSONDecoder().raw_decode(result)[0])
+    last = samples[-1]
+    return {"ms": statistics.median(s["setup_ms"] + s["urls_ms"] for s in samples),
+            "pymodbus": last["pymodbus"], "pymysql": last["pymysql"], "threads": last["threads"]}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--backend", default=os.path.join(HERE, "..", "backend"))
+    args = ap.parse_args()
+    backend = os.path.abspath(args.backend)
+
+    # the PLC address is unroutable so a process that does start polling can't reach anything
+    with tempfile.TemporaryDirectory() as tmp:
+        base_env = {"MODBUS_HOST": "192.0.2.1", "MODBUS_HISTORY_DB": os.path.join(tmp, "h.sqlite3"),
+                    "MODBUS_POLLER_SOCKET": os.path.join(tmp, "none.sock"),
+                    "MODBUS_POLLER_LOCK": os.path.join(tmp, "poller.lock")}
+        print(f"{backend}\n")
+        print(f"{'process':<32} {'start ms':>9}  {'pymodbus':<9} {'pymysql':<8} threads")
+        for label, argv, env in SCENARIOS:
+            r = run(backend, argv, {**base_env, **env}, args.repeat)
+            print(f"{label:<32} {r['ms']:>9.1f}  {str(r['pymodbus']):<9} {str(r['pymysql']):<8} "
+                  f"{', '.join(r['threads']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# bench/status_encoding_bench.py — /status/ payload size and encode time per format
+#
+#   python bench/status_encoding_bench.py [--tags 7,50,200] [--changed 1,10] [--repeat 5000]
+#
+# Builds /status/-shaped snapshots (float32 tags, two raw registers each, the way
+# read_modbus lays them out) and encodes them as the current JSON, MessagePack (if
+# installed) and the packed float32 format - the full document and ?since= deltas
+# with a few changed tags. Packed rows are shown with the tag index (first request)
+# and without it (client sent ?schema=). gzip sizes are what a compressing proxy
+# would put on the wire.
+import argparse
+import gzip
+import json
+import os
+import random
+import struct
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from modbus_reader import encoding  # noqa: E402
+
+
+def make_snapshot(n_tags: int, seed: int = 1):
+    rnd = random.Random(seed)
+    tags, raw = {}, []
+    for i in range(n_tags):
+        value = round(rnd.uniform(-1000, 1000), 2)
+        f32 = struct.unpack(">f", struct.pack(">f", value))[0]
+        tags["float%d" % (i + 1) if i < 2 else "tag%03d" % i] = f32
+        raw.extend(struct.unpack(">HH", struct.pack(">f", value)))
+    now = time.time()
+    return {
+        "float1": tags.get("float1"), "float2": tags.get("float2"),
+        "values": list(tags.values()), "raw": raw, "tags": tags,
+        "changes": dict(list(tags.items())[:3]), "change_seq": 123456,
+        "device": "default", "seq": 987654, "ts": now, "age": 0.042, "stale": False,
+        "health": {"state": "closed", "failures": 0, "retry_in": 0.0,
+                   "last_error": None, "last_ok": now},
+    }
+
+
+def make_delta(snap, n_changed: int):
+    names = list(snap["tags"])
+    events = [(snap["change_seq"] - i, "default", name, snap["ts"], snap["tags"][name])
+              for i, name in enumerate(random.Random(2).sample(names, min(n_changed, len(names))))]
+    return encoding.delta(snap, events, missed=False)
+
+
+def measure(fn, repeat):
+    body = fn()
+    best = min(timeit.repeat(fn, number=repeat, repeat=3)) / repeat
+    return len(body), len(gzip.compress(body)), best * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tags", default="7,50,200")
+    ap.add_argument("--changed", default="1,10")
+    ap.add_argument("--repeat", type=int, default=5000)
+    args = ap.parse_args()
+
+    formats = [("json", lambda p, names: json.dumps(p).encode("utf-8"))]
+    if encoding.MSGPACK in encoding.available():
+        formats.append(("msgpack", lambda p, names: encoding.encode(p, encoding.MSGPACK, names)[0]))
+    else:
+        print("(msgpack not installed - skipping that format)")
+    formats.append(("packed+index", lambda p, names: encoding.pack(p, names)[0]))
+    formats.append(("packed", lambda p, names: encoding.pack(p, names, encoding.schema_id(names))[0]))
+
+    print(f"{'payload':<22} {'format':<13} {'bytes':>7} {'gzip':>7} {'vs json':>8} {'encode us':>10}")
+    for n in [int(x) for x in args.tags.split(",")]:
+        snap = make_snapshot(n)
+        names = list(snap["tags"])
+        cases = [(f"{n} tags, full", snap)]
+        cases += [(f"{n} tags, delta {k}", make_delta(snap, k))
+                  for k in [int(x) for x in args.changed.split(",")] if k < n]
+        for label, payload in cases:
+            base = None
+            for name, fn in formats:
+                size, gz, us = measure(lambda: fn(payload, names), args.repeat)
+                base = base or size
+                print(f"{label:<22} {name:<13} {size:>7} {gz:>7} {size / base:>7.0%} {us:>10.2f}")
+            print()
+
+
+if __name__ == "__main__":
+    main()
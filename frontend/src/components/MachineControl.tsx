@@ -7,8 +7,13 @@ type ModbusStatus = {
   float1: number | null;
   float2: number | null;
   raw: number[];
+  age?: number | null;   // seconds since the poller read these values
+  stale?: boolean;       // PLC unreachable or values older than MODBUS_STALE_AFTER
 };
 
+// Heartbeat the stream sends while no value changes
+type AgeFrame = { seq: number; ts: number | null; age: number | null; stale: boolean };
+
 // Keep your existing shape for demo defaults (inputs stay rendered)
 type MachineSettings = {
   auto_s1_speed: number | string;
@@ -41,11 +46,12 @@ export default function MachineControl() {
   const [m, setM] = useState<ModbusStatus | null>(null);
   const [visible, setVisible] = useState(true);
 
-  // ---- Poll /status/ every 1s ----
+  // ---- Live values: server push from /status/stream/, 1s polling as fallback ----
   useEffect(() => {
     let stopped = false;
     let timer: number | undefined;
     let ac: AbortController | null = null;
+    let es: EventSource | null = null;
 
     const tick = async () => {
       ac?.abort();
@@ -60,11 +66,33 @@ export default function MachineControl() {
       }
     };
 
-    tick(); // immediate
-    timer = window.setInterval(tick, 1000);
+    const startPolling = () => {
+      if (stopped || timer) return;
+      tick(); // immediate
+      timer = window.setInterval(tick, 1000);
+    };
+
+    if (typeof EventSource === "undefined") {
+      startPolling();
+    } else {
+      // server only sends a frame when values change
+      es = new EventSource(`${API}/status/stream/`);
+      es.addEventListener("snapshot", (ev) => {
+        if (!stopped) setM(JSON.parse((ev as MessageEvent).data) as ModbusStatus);
+      });
+      es.addEventListener("age", (ev) => {
+        const a = JSON.parse((ev as MessageEvent).data) as AgeFrame;
+        if (!stopped) setM((old) => (old ? { ...old, age: a.age, stale: a.stale } : old));
+      });
+      es.onerror = () => {
+        // EventSource retries by itself; only give up if the browser closed it
+        if (es?.readyState === EventSource.CLOSED) startPolling();
+      };
+    }
 
     return () => {
       stopped = true;
+      es?.close();
       if (timer) window.clearInterval(timer);
       ac?.abort();
     };
@@ -126,6 +154,11 @@ export default function MachineControl() {
         <div className="hmi-inner-border">
           <Container>
             {/* Live values strip from /status/ */}
+            {m?.stale && (
+              <div className="alert alert-warning py-1 mt-2 mb-0 small">
+                PLC not responding - values are {m.age != null ? `${Math.round(m.age)}s` : "of unknown age"} old
+              </div>
+            )}
 
             {/* Speed row with No of Roll on same line */}
             <Row className="mt-3">